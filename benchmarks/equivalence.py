@@ -0,0 +1,296 @@
+"""
+Checks that a fast rendering path produces the same image as the reference path.
+
+Call it from the command line using `uv run benchmarks/equivalence.py [arguments]`.
+To see a full list of arguments, use `uv run benchmarks/equivalence.py --help`.
+
+The reference path traces every pixel recursively with `_get_color`, testing every
+ray against every object (no culling, rasterization, or occluder grids) with the
+NumPy kernels. The fast path is `ray_trace` with the given settings,
+`ray_trace_sharded` if given a number of shards, or `ray_trace_adaptive` if given
+a subsampling threshold.
+Exits with status 1 if more pixels differ than allowed.
+"""
+
+import sys
+from argparse import ArgumentParser
+from datetime import timedelta
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+from numpy.typing import NDArray
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from exporter import export
+from importer import import_scene
+from kernels import KERNELS, use_kernels
+from ray_tracer import (
+	BACKENDS,
+	_get_color,
+	_get_pixel_direction,
+	_get_window_size,
+	ray_trace,
+)
+from scene import Scene
+from sharding import ray_trace_sharded
+from subsampling import ray_trace_adaptive
+
+DEFAULT_WIDTH = 128
+DEFAULT_HEIGHT = 128
+DEFAULT_REFLECTION_LIMIT = 10
+DEFAULT_TOLERANCE = 1 / 512
+DEFAULT_MAX_MISMATCHES = 0
+DEFAULT_DIFF_GAIN = 16
+
+
+def reference_render(
+	scene: Scene, width: int, height: int, reflection_limit: int
+) -> NDArray[np.float64]:
+	"""Ray trace every pixel recursively, testing every ray against every object."""
+	use_kernels("numpy")
+	scene = Scene(
+		scene.camera,
+		scene.lights,
+		scene.ambient_light_color,
+		scene.background_color,
+		scene.objects,
+		{},
+	)
+
+	viewport_size = np.array([width, height])
+	window_size = _get_window_size(
+		viewport_size, scene.camera.focal_length, scene.camera.field_of_view
+	)
+	window_to_viewport_size_ratio = window_size / viewport_size
+	half_window_size = window_size / 2
+
+	screen = np.zeros((height, width, 3))
+	for y in range(height):
+		for x in range(width):
+			screen[y, x] = _get_color(
+				scene,
+				reflection_limit,
+				scene.camera.position,
+				_get_pixel_direction(
+					scene, x, y, window_to_viewport_size_ratio, half_window_size
+				),
+			)
+	return screen
+
+
+def check(
+	scene_file_path: str,
+	width: int,
+	height: int,
+	reflection_limit: int,
+	tolerance: float,
+	max_mismatches: int,
+	diff_file_path: str | None,
+	diff_gain: float,
+	ray_reordering: bool,
+	kernels: str,
+	backend: str,
+	batch_size: int | None,
+	rasterize: bool,
+	triangulate: bool,
+	shards: int | None = None,
+	subsampling: float | None = None,
+) -> bool:
+	"""Render the scene with both paths, report how much they differ, and return whether they match."""
+	print()
+	start_time = perf_counter()
+	reference = reference_render(
+		import_scene(scene_file_path), width, height, reflection_limit
+	)
+	reference_time = perf_counter() - start_time
+	print(f"Reference\tTime elapsed: {timedelta(seconds=reference_time)}")
+
+	start_time = perf_counter()
+	if shards:
+		fast = ray_trace_sharded(
+			import_scene(scene_file_path, triangulate),
+			width,
+			height,
+			reflection_limit,
+			False,
+			shards,
+			ray_reordering,
+			kernels,
+			batch_size=batch_size,
+		)
+	elif subsampling is not None:
+		fast, traced_pixels = ray_trace_adaptive(
+			import_scene(scene_file_path, triangulate),
+			width,
+			height,
+			reflection_limit,
+			False,
+			subsampling,
+			kernels,
+			backend,
+		)
+	else:
+		fast = ray_trace(
+			import_scene(scene_file_path, triangulate),
+			width,
+			height,
+			reflection_limit,
+			False,
+			ray_reordering,
+			kernels,
+			backend,
+			batch_size=batch_size,
+			rasterize=rasterize,
+		)
+	fast_time = perf_counter() - start_time
+	print(f"Fast\t\tTime elapsed: {timedelta(seconds=fast_time)}")
+	print(f"Speedup: {reference_time / fast_time:.2f}x")
+	if subsampling is not None:
+		print(f"Pixels traced: {traced_pixels / (width * height):.1%}")
+
+	# Compare each pixel by its worst channel
+	errors = np.max(np.abs(fast - reference), axis=2)
+	mismatches = int(np.count_nonzero(errors > tolerance))
+	print(f"Max error: {np.max(errors)}")
+	print(f"Mean error: {np.mean(errors)}")
+	print(f"Mismatched pixels (error > {tolerance}): {mismatches}")
+	if mismatches:
+		for y, x in np.argwhere(errors > tolerance)[:10]:
+			print(f"\t({x}, {y}): error {errors[y, x]}")
+
+	if diff_file_path:
+		diff = np.clip(np.abs(fast - reference) * diff_gain, 0, 1)
+		export(diff, diff_file_path)
+		print(f"Diff image (x{diff_gain}): {diff_file_path}")
+
+	passed = mismatches <= max_mismatches
+	print("PASS" if passed else f"FAIL (more than {max_mismatches} mismatched pixels)")
+	print()
+	return passed
+
+
+if __name__ == "__main__":
+	arg = ArgumentParser("Equivalence Checker")
+	arg.add_argument(
+		"-s", "--scene", type=str, help="Path to the scene file", required=True
+	)
+	arg.add_argument(
+		"-x", "--width", type=int, help="Width of the image", default=DEFAULT_WIDTH
+	)
+	arg.add_argument(
+		"-y", "--height", type=int, help="Height of the image", default=DEFAULT_HEIGHT
+	)
+	arg.add_argument(
+		"-r",
+		"--reflection-limit",
+		type=int,
+		help="Max number of recursive reflections",
+		default=DEFAULT_REFLECTION_LIMIT,
+	)
+	arg.add_argument(
+		"--tolerance",
+		type=float,
+		help="Largest difference in any color channel for pixels to still match",
+		default=DEFAULT_TOLERANCE,
+	)
+	arg.add_argument(
+		"--max-mismatches",
+		type=int,
+		help="Number of mismatched pixels allowed before failing",
+		default=DEFAULT_MAX_MISMATCHES,
+	)
+	arg.add_argument(
+		"--diff",
+		type=str,
+		help="Path to write an image of the differences to",
+	)
+	arg.add_argument(
+		"--diff-gain",
+		type=float,
+		help="How much to amplify the differences in the diff image",
+		default=DEFAULT_DIFF_GAIN,
+	)
+	arg.add_argument(
+		"--ray-reordering",
+		type=bool,
+		help="Whether the fast path sorts secondary and shadow rays",
+		default=False,
+	)
+	arg.add_argument(
+		"--kernels",
+		type=str,
+		choices=KERNELS,
+		help="Kernels of the fast path",
+		default="numpy",
+	)
+	arg.add_argument(
+		"--backend",
+		type=str,
+		choices=BACKENDS,
+		help="Parallel backend of the fast path",
+		default="serial",
+	)
+	arg.add_argument(
+		"--batch-size",
+		type=int,
+		help="Ray batch size of the fast path",
+	)
+	arg.add_argument(
+		"--rasterize",
+		type=bool,
+		help="Whether the fast path rasterizes primary visibility",
+		default=False,
+	)
+	arg.add_argument(
+		"--triangulate",
+		type=bool,
+		help="Whether the fast path splits polygons into triangles",
+		default=False,
+	)
+	arg.add_argument(
+		"--shards",
+		type=int,
+		help="Number of processes the fast path splits the scene's objects among",
+	)
+	arg.add_argument(
+		"--subsampling",
+		type=float,
+		help="Threshold of the fast path's adaptive subsampling",
+	)
+	parsed = arg.parse_args()
+	if parsed.shards is not None and parsed.shards <= 0:
+		arg.error(f"argument --shards: must be positive, not {parsed.shards}")
+	if parsed.shards and (parsed.backend != "serial" or parsed.rasterize):
+		arg.error(
+			"argument --shards: not allowed with argument --backend or --rasterize"
+		)
+	if parsed.subsampling is not None and (
+		parsed.shards
+		or parsed.ray_reordering
+		or parsed.batch_size is not None
+		or parsed.rasterize
+	):
+		arg.error(
+			"argument --subsampling: not allowed with argument --shards, --ray-reordering, --batch-size, or --rasterize"
+		)
+	passed = check(
+		parsed.scene,
+		parsed.width,
+		parsed.height,
+		parsed.reflection_limit,
+		parsed.tolerance,
+		parsed.max_mismatches,
+		parsed.diff,
+		parsed.diff_gain,
+		parsed.ray_reordering,
+		parsed.kernels,
+		parsed.backend,
+		parsed.batch_size,
+		parsed.rasterize,
+		parsed.triangulate,
+		parsed.shards,
+		parsed.subsampling,
+	)
+	sys.exit(0 if passed else 1)
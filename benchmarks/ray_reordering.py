@@ -0,0 +1,87 @@
+"""
+Compares batched ray tracing with and without sorting rays for coherence.
+
+Call it from the command line using `uv run benchmarks/ray_reordering.py [arguments]`.
+To see a full list of arguments, use `uv run benchmarks/ray_reordering.py --help`.
+
+Every row is traced serially in this process so that timings are not skewed
+by multiprocessing overhead.
+"""
+
+import sys
+from argparse import ArgumentParser
+from datetime import timedelta
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from importer import import_scene
+from ray_tracer import _get_window_size, _ray_trace_tile
+
+DEFAULT_WIDTH = 128
+DEFAULT_HEIGHT = 128
+DEFAULT_REFLECTION_LIMIT = 10
+
+
+def benchmark(
+	scene_file_path: str, width: int, height: int, reflection_limit: int
+) -> None:
+	"""Time rendering the scene with unsorted and sorted ray generations."""
+	scene = import_scene(scene_file_path)
+
+	viewport_size = np.array([width, height])
+	window_size = _get_window_size(
+		viewport_size, scene.camera.focal_length, scene.camera.field_of_view
+	)
+	window_to_viewport_size_ratio = window_size / viewport_size
+	half_window_size = window_size / 2
+
+	print()
+	screens = {}
+	for sort_rays in (False, True):
+		start_time = perf_counter()
+		screens[sort_rays] = np.concatenate(
+			[
+				_ray_trace_tile(
+					scene,
+					reflection_limit,
+					(0, y, width, 1),
+					window_to_viewport_size_ratio,
+					half_window_size,
+					width,
+					sort_rays,
+				)
+				for y in range(height)
+			]
+		)
+		time_elapsed = perf_counter() - start_time
+		print(f"Sorted: {sort_rays}\tTime elapsed: {timedelta(seconds=time_elapsed)}")
+
+	max_error = np.max(np.abs(screens[True] - screens[False]))
+	print(f"Max difference between images: {max_error}")
+	print()
+
+
+if __name__ == "__main__":
+	arg = ArgumentParser("Ray Reordering Benchmark")
+	arg.add_argument(
+		"-s", "--scene", type=str, help="Path to the scene file", required=True
+	)
+	arg.add_argument(
+		"-x", "--width", type=int, help="Width of the image", default=DEFAULT_WIDTH
+	)
+	arg.add_argument(
+		"-y", "--height", type=int, help="Height of the image", default=DEFAULT_HEIGHT
+	)
+	arg.add_argument(
+		"-r",
+		"--reflection-limit",
+		type=int,
+		help="Max number of recursive reflections",
+		default=DEFAULT_REFLECTION_LIMIT,
+	)
+	parsed = arg.parse_args()
+	benchmark(parsed.scene, parsed.width, parsed.height, parsed.reflection_limit)
@@ -0,0 +1,180 @@
+"""
+Measures how long a small render takes to start, and which imports it spends that time on.
+
+Call it from the command line using `uv run benchmarks/startup.py [arguments]`.
+To see a full list of arguments, use `uv run benchmarks/startup.py --help`.
+
+The ray tracer is run in a fresh interpreter with `-X importtime`, so that nothing
+is already imported, and the import time of each top-level module is reported
+along with the wall time of the whole run.
+"""
+
+import re
+import sys
+from argparse import ArgumentParser
+from datetime import timedelta
+from os import environ
+from pathlib import Path
+from subprocess import run
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+SOURCE_DIRECTORY = Path(__file__).parent.parent / "src"
+
+DEFAULT_WIDTH = 16
+DEFAULT_HEIGHT = 16
+DEFAULT_REFLECTION_LIMIT = 3
+DEFAULT_RUNS = 3
+DEFAULT_TOP = 10
+
+IMPORT_TIME_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def measure(
+	scene_file_path: str,
+	width: int,
+	height: int,
+	reflection_limit: int,
+	backend: str,
+	workers: int | None,
+	start_method: str | None,
+) -> tuple[float, dict[str, int]]:
+	"""Render the scene in a fresh interpreter, and return the wall time and the import time of each top-level module in microseconds, summed over every process."""
+	with TemporaryDirectory() as directory:
+		arguments = [
+			sys.executable,
+			"-X",
+			"importtime",
+			str(SOURCE_DIRECTORY),
+			"--scene",
+			scene_file_path,
+			"--output",
+			str(Path(directory) / "startup.png"),
+			"--width",
+			str(width),
+			"--height",
+			str(height),
+			"--reflection-limit",
+			str(reflection_limit),
+			"--backend",
+			backend,
+		]
+		if workers:
+			arguments += ["--workers", str(workers)]
+		if start_method:
+			arguments += ["--start-method", start_method]
+
+		start_time = perf_counter()
+		result = run(
+			arguments,
+			capture_output=True,
+			text=True,
+			env={**environ, "progress-bar": "0"},
+			check=True,
+		)
+		wall_time = perf_counter() - start_time
+
+	# Processes started with `spawn` or `forkserver` report their imports too
+	import_times: dict[str, int] = {}
+	for line in result.stderr.splitlines():
+		match = IMPORT_TIME_PATTERN.match(line)
+		if match and not match[3]:
+			import_times[match[4]] = import_times.get(match[4], 0) + int(match[2])
+	return wall_time, import_times
+
+
+def report(
+	scene_file_path: str,
+	width: int,
+	height: int,
+	reflection_limit: int,
+	backend: str,
+	workers: int | None,
+	start_method: str | None,
+	runs: int,
+	top: int,
+) -> None:
+	"""Measure several runs, and print the fastest wall time and the slowest top-level imports of that run."""
+	print()
+	measurements = [
+		measure(
+			scene_file_path,
+			width,
+			height,
+			reflection_limit,
+			backend,
+			workers,
+			start_method,
+		)
+		for _ in range(runs)
+	]
+	wall_time, import_times = min(measurements, key=lambda measurement: measurement[0])
+
+	print(f"Wall time (fastest of {runs}): {timedelta(seconds=wall_time)}")
+	print(f"Import time: {timedelta(microseconds=sum(import_times.values()))}")
+	print("Slowest top-level imports:")
+	for module, import_time in sorted(
+		import_times.items(), key=lambda item: item[1], reverse=True
+	)[:top]:
+		print(f"\t{import_time / 1000:8.1f}ms  {module}")
+	print()
+
+
+if __name__ == "__main__":
+	arg = ArgumentParser("Startup Benchmark")
+	arg.add_argument(
+		"-s", "--scene", type=str, help="Path to the scene file", required=True
+	)
+	arg.add_argument(
+		"-x", "--width", type=int, help="Width of the image", default=DEFAULT_WIDTH
+	)
+	arg.add_argument(
+		"-y", "--height", type=int, help="Height of the image", default=DEFAULT_HEIGHT
+	)
+	arg.add_argument(
+		"-r",
+		"--reflection-limit",
+		type=int,
+		help="Max number of recursive reflections",
+		default=DEFAULT_REFLECTION_LIMIT,
+	)
+	arg.add_argument(
+		"--backend",
+		type=str,
+		help="Parallel backend",
+		default="process",
+	)
+	arg.add_argument(
+		"--workers",
+		type=int,
+		help="Number of workers",
+	)
+	arg.add_argument(
+		"--start-method",
+		type=str,
+		help="How to start worker processes",
+	)
+	arg.add_argument(
+		"--runs",
+		type=int,
+		help="Number of runs to take the fastest of",
+		default=DEFAULT_RUNS,
+	)
+	arg.add_argument(
+		"--top",
+		type=int,
+		help="Number of top-level imports to report",
+		default=DEFAULT_TOP,
+	)
+	parsed = arg.parse_args()
+	report(
+		parsed.scene,
+		parsed.width,
+		parsed.height,
+		parsed.reflection_limit,
+		parsed.backend,
+		parsed.workers,
+		parsed.start_method,
+		parsed.runs,
+		parsed.top,
+	)
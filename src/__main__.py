@@ -6,15 +6,23 @@ To see a full list of arguments, use `uv run src --help`.
 """
 
 from argparse import ArgumentParser
+from contextlib import nullcontext
 from datetime import timedelta
 from os import getenv
+from pathlib import Path
 from time import perf_counter
 
 from dotenv import load_dotenv
 
 from exporter import assert_supported_extension, export
 from importer import import_scene
-from ray_tracer import ray_trace
+from kernels import KERNELS
+from ray_tracer import BACKENDS, ray_trace
+from startup import START_METHODS, use_start_method
+from telemetry import open_stream
+
+# Modules only needed by some modes are imported when they are used,
+# so that small renders start quickly
 
 # Default arguments
 DEFAULT_OUTPUT = "./output.png"
@@ -22,9 +30,49 @@ DEFAULT_WIDTH = 512
 DEFAULT_HEIGHT = 512
 DEFAULT_REFLECTION_LIMIT = 10
 DEFAULT_PROGRESS_BAR = int(True)  # Must be an int (bools cannot be parsed from strings)
+DEFAULT_RAY_REORDERING = int(False)
+DEFAULT_KERNELS = "numpy"
+DEFAULT_BACKEND = "process"
+DEFAULT_AUTOTUNE = int(False)
+DEFAULT_WATCH = int(False)
+DEFAULT_TRIANGULATE = int(False)
+DEFAULT_RASTERIZE = int(False)
+DEFAULT_DRY_RUN = int(False)
+DEFAULT_BATCH = int(False)
+DEFAULT_PROFILE = int(False)
+DEFAULT_COST_SCHEDULING = int(False)
 
 
-def parse_arguments() -> tuple[str, str, int, int, int, bool]:
+def parse_arguments() -> tuple[
+	str,
+	str,
+	int,
+	int,
+	int,
+	bool,
+	bool,
+	str,
+	str,
+	int | None,
+	int | None,
+	int | None,
+	int | None,
+	bool,
+	bool,
+	str | None,
+	str | None,
+	bool,
+	bool,
+	bool,
+	int | None,
+	str | None,
+	bool,
+	bool,
+	bool,
+	int | None,
+	str | None,
+	float | None,
+]:
 	"""Parse and return the environment variables and command-line arguments."""
 	# Retrieve arguments from environment variables
 	# (All environment variables are imported as strings.
@@ -38,6 +86,30 @@ def parse_arguments() -> tuple[str, str, int, int, int, bool]:
 		"reflection-limit", default=str(DEFAULT_REFLECTION_LIMIT)
 	)
 	env_progress_bar = getenv("progress-bar", default=str(DEFAULT_PROGRESS_BAR))
+	env_ray_reordering = getenv("ray-reordering", default=str(DEFAULT_RAY_REORDERING))
+	env_kernels = getenv("kernels", default=DEFAULT_KERNELS)
+	env_backend = getenv("backend", default=DEFAULT_BACKEND)
+	env_workers = getenv("workers")
+	env_tile_width = getenv("tile-width")
+	env_tile_height = getenv("tile-height")
+	env_batch_size = getenv("batch-size")
+	env_autotune = getenv("autotune", default=str(DEFAULT_AUTOTUNE))
+	env_watch = getenv("watch", default=str(DEFAULT_WATCH))
+	env_gbuffer = getenv("gbuffer")
+	env_reshade = getenv("reshade")
+	env_triangulate = getenv("triangulate", default=str(DEFAULT_TRIANGULATE))
+	env_rasterize = getenv("rasterize", default=str(DEFAULT_RASTERIZE))
+	env_dry_run = getenv("dry-run", default=str(DEFAULT_DRY_RUN))
+	env_cache_size = getenv("cache-size")
+	env_telemetry = getenv("telemetry")
+	env_batch = getenv("batch", default=str(DEFAULT_BATCH))
+	env_profile = getenv("profile", default=str(DEFAULT_PROFILE))
+	env_cost_scheduling = getenv(
+		"cost-scheduling", default=str(DEFAULT_COST_SCHEDULING)
+	)
+	env_shards = getenv("shards")
+	env_start_method = getenv("start-method")
+	env_subsampling = getenv("subsampling")
 
 	# Retrieve arguments overrides from command line
 	# (A command line argument is only required if the environment variable is missing.)
@@ -90,6 +162,152 @@ def parse_arguments() -> tuple[str, str, int, int, int, bool]:
 		default=int(env_progress_bar),
 		required=env_progress_bar is None,
 	)
+	arg.add_argument(
+		"--ray-reordering",
+		type=bool,
+		help="Whether to sort secondary and shadow rays for coherence before casting them",
+		default=int(env_ray_reordering),
+		required=env_ray_reordering is None,
+	)
+	arg.add_argument(
+		"--kernels",
+		type=str,
+		choices=KERNELS,
+		help="Implementation of the hot numerical loops (jit requires Numba)",
+		default=env_kernels,
+		required=env_kernels is None,
+	)
+	arg.add_argument(
+		"--backend",
+		type=str,
+		choices=BACKENDS,
+		help="How to run ray-tracing work in parallel",
+		default=env_backend,
+		required=env_backend is None,
+	)
+	arg.add_argument(
+		"--workers",
+		type=int,
+		help="Number of parallel workers (defaults to one per CPU)",
+		default=env_workers,
+	)
+	arg.add_argument(
+		"--tile-width",
+		type=int,
+		help="Width of the tiles of pixels handed to each worker",
+		default=env_tile_width,
+	)
+	arg.add_argument(
+		"--tile-height",
+		type=int,
+		help="Height of the tiles of pixels handed to each worker",
+		default=env_tile_height,
+	)
+	arg.add_argument(
+		"--batch-size",
+		type=int,
+		help="Number of rays traced together, one generation of reflections at a time",
+		default=env_batch_size,
+	)
+	arg.add_argument(
+		"--autotune",
+		type=bool,
+		help="Whether to pick the fastest workers, tile size, and batch size with calibration renders",
+		default=int(env_autotune),
+		required=env_autotune is None,
+	)
+	arg.add_argument(
+		"--watch",
+		type=bool,
+		help="Whether to keep re-rendering the pixels affected by each change to the scene file",
+		default=int(env_watch),
+		required=env_watch is None,
+	)
+	arg.add_argument(
+		"--gbuffer",
+		type=str,
+		help="Path to save the G-buffer of the render to, for reshading later",
+		default=env_gbuffer,
+	)
+	arg.add_argument(
+		"--reshade",
+		type=str,
+		help="Path to a saved G-buffer to shade with the scene's materials and light colors, instead of ray tracing",
+		default=env_reshade,
+	)
+	arg.add_argument(
+		"--triangulate",
+		type=bool,
+		help="Whether to split polygons into triangles when importing the scene",
+		default=int(env_triangulate),
+		required=env_triangulate is None,
+	)
+	arg.add_argument(
+		"--rasterize",
+		type=bool,
+		help="Whether to find what every primary ray hits at once with a depth buffer, instead of casting them",
+		default=int(env_rasterize),
+		required=env_rasterize is None,
+	)
+	arg.add_argument(
+		"--dry-run",
+		type=bool,
+		help="Whether to only estimate the render time and memory from a sample of pixels",
+		default=int(env_dry_run),
+		required=env_dry_run is None,
+	)
+	arg.add_argument(
+		"--cache-size",
+		type=int,
+		help="Megabytes of rendered images to cache by scene and settings (defaults to no caching)",
+		default=env_cache_size,
+	)
+	arg.add_argument(
+		"--telemetry",
+		type=str,
+		help="Path of a file, or tcp://<host>:<port> of a socket, to stream JSON-lines progress events to",
+		default=env_telemetry,
+	)
+	arg.add_argument(
+		"--batch",
+		type=bool,
+		help="Whether the scene is a glob pattern of scene files or a manifest of jobs, to render all at once",
+		default=int(env_batch),
+		required=env_batch is None,
+	)
+	arg.add_argument(
+		"--profile",
+		type=bool,
+		help="Whether to profile ray tracing in every worker, and save the merged profile next to the output",
+		default=int(env_profile),
+		required=env_profile is None,
+	)
+	arg.add_argument(
+		"--cost-scheduling",
+		type=bool,
+		help="Whether to estimate the cost of each tile with a pre-pass, handing out the most expensive first and splitting large ones",
+		default=int(env_cost_scheduling),
+		required=env_cost_scheduling is None,
+	)
+	arg.add_argument(
+		"--shards",
+		type=int,
+		help="Number of processes to split the scene's objects among, instead of copying the whole scene to every worker",
+		default=env_shards,
+	)
+	arg.add_argument(
+		"--start-method",
+		type=str,
+		choices=START_METHODS,
+		help="How to start worker processes (`forkserver` forks them from a template that has already imported the ray tracer)",
+		default=env_start_method,
+	)
+	arg.add_argument(
+		"--subsampling",
+		type=float,
+		help="Trace a sparse grid of pixels, and interpolate blocks whose corners see the same object with colors within this threshold",
+		default=env_subsampling,
+	)
 
 	# Parse arguments
 	parsed = arg.parse_args()
@@ -99,6 +317,89 @@ def parse_arguments() -> tuple[str, str, int, int, int, bool]:
 	height: int = parsed.height
 	reflection_limit: int = parsed.reflection_limit
 	progress_bar: bool = parsed.progress_bar
+	ray_reordering: bool = parsed.ray_reordering
+	kernels: str = parsed.kernels
+	backend: str = parsed.backend
+	workers: int | None = parsed.workers
+	tile_width: int | None = parsed.tile_width
+	tile_height: int | None = parsed.tile_height
+	batch_size: int | None = parsed.batch_size
+	autotune: bool = parsed.autotune
+	watch: bool = parsed.watch
+	gbuffer_file_path: str | None = parsed.gbuffer
+	reshade_file_path: str | None = parsed.reshade
+	triangulate: bool = parsed.triangulate
+	rasterize: bool = parsed.rasterize
+	dry_run: bool = parsed.dry_run
+	cache_size: int | None = parsed.cache_size
+	telemetry_target: str | None = parsed.telemetry
+	batch: bool = parsed.batch
+	profile: bool = parsed.profile
+	cost_scheduling: bool = parsed.cost_scheduling
+	shards: int | None = parsed.shards
+	start_method: str | None = parsed.start_method
+	subsampling: float | None = parsed.subsampling
+
+	# Work can only be split into positive numbers of workers, pixels, and rays
+	for name, value in (
+		("workers", workers),
+		("tile-width", tile_width),
+		("tile-height", tile_height),
+		("batch-size", batch_size),
+		("shards", shards),
+	):
+		if value is not None and value <= 0:
+			arg.error(f"argument --{name}: must be positive, not {value}")
+
+	# Autotuning picks every work setting itself, so it cannot be given these
+	if autotune:
+		for name, value in (
+			("workers", workers),
+			("tile-width", tile_width),
+			("tile-height", tile_height),
+			("batch-size", batch_size),
+		):
+			if value is not None:
+				arg.error(f"argument --autotune: not allowed with argument --{name}")
+
+	# Sharded renders trace tiles in the main process, so they cannot use these
+	if shards is not None:
+		for name, is_set in (
+			("backend", backend != "process"),
+			("workers", workers is not None),
+			("rasterize", rasterize),
+			("cost-scheduling", cost_scheduling),
+			("subsampling", subsampling is not None),
+			("autotune", autotune),
+			("watch", watch),
+			("batch", batch),
+			("gbuffer", gbuffer_file_path is not None),
+			("reshade", reshade_file_path is not None),
+		):
+			if is_set:
+				arg.error(f"argument --shards: not allowed with argument --{name}")
+
+	# Subsampled renders trace single pixels with rasterized visibility, so they cannot use these
+	if subsampling is not None:
+		if subsampling < 0:
+			arg.error(
+				f"argument --subsampling: must not be negative, not {subsampling}"
+			)
+		for name, is_set in (
+			("ray-reordering", ray_reordering),
+			("tile-width", tile_width is not None),
+			("tile-height", tile_height is not None),
+			("batch-size", batch_size is not None),
+			("rasterize", rasterize),
+			("cost-scheduling", cost_scheduling),
+			("autotune", autotune),
+			("watch", watch),
+			("batch", batch),
+			("gbuffer", gbuffer_file_path is not None),
+			("reshade", reshade_file_path is not None),
+		):
+			if is_set:
+				arg.error(f"argument --subsampling: not allowed with argument --{name}")
 
 	return (
 		scene_file_path,
@@ -107,6 +408,28 @@ def parse_arguments() -> tuple[str, str, int, int, int, bool]:
 		height,
 		reflection_limit,
 		progress_bar,
+		ray_reordering,
+		kernels,
+		backend,
+		workers,
+		tile_width,
+		tile_height,
+		batch_size,
+		autotune,
+		watch,
+		gbuffer_file_path,
+		reshade_file_path,
+		triangulate,
+		rasterize,
+		dry_run,
+		cache_size,
+		telemetry_target,
+		batch,
+		profile,
+		cost_scheduling,
+		shards,
+		start_method,
+		subsampling,
 	)
 
 
@@ -117,34 +440,299 @@ def main(
 	height: int,
 	reflection_limit: int,
 	progress_bar: bool,
+	ray_reordering: bool,
+	kernels: str,
+	backend: str,
+	workers: int | None,
+	tile_width: int | None,
+	tile_height: int | None,
+	batch_size: int | None,
+	autotune: bool,
+	watch: bool,
+	gbuffer_file_path: str | None,
+	reshade_file_path: str | None,
+	triangulate: bool,
+	rasterize: bool,
+	dry_run: bool,
+	cache_size: int | None,
+	telemetry_target: str | None,
+	batch: bool,
+	profile: bool,
+	cost_scheduling: bool,
+	shards: int | None,
+	start_method: str | None,
+	subsampling: float | None,
 ) -> None:
 	"""Import, ray-trace, and export."""
+	# Start the worker template first, so it warms up while the rest starts
+	if start_method:
+		use_start_method(start_method)
+
 	# Assert the output file extension is supported
 	assert_supported_extension(output_file_path)
 
+	# Tile sizes may be given partially, with the rest defaulting to 1
+	tile_size = (
+		(tile_width or 1, tile_height or 1) if tile_width or tile_height else None
+	)
+
+	# Watch mode renders and exports on its own until interrupted
+	if watch:
+		from watch import watch as watch_scene
+
+		watch_scene(
+			scene_file_path,
+			output_file_path,
+			width,
+			height,
+			reflection_limit,
+			kernels,
+			backend,
+			workers,
+		)
+		return
+
+	# Batch mode renders and exports every job on its own
+	if batch:
+		from batch import find_jobs, render_batch
+
+		print()
+		print("> Rendering batch...")
+		start_time = perf_counter()
+		jobs = find_jobs(
+			scene_file_path, output_file_path, width, height, reflection_limit
+		)
+		for job_output_file_path in {
+			Path(job.output_file_path).suffix: job.output_file_path for job in jobs
+		}.values():
+			assert_supported_extension(job_output_file_path)
+		reports = render_batch(
+			jobs,
+			progress_bar,
+			ray_reordering,
+			kernels,
+			backend,
+			workers,
+			tile_size,
+			batch_size,
+			rasterize,
+			triangulate,
+		)
+		for report in reports:
+			print(report)
+		time_elapsed = perf_counter() - start_time
+		print(f"Time elapsed: {timedelta(seconds=time_elapsed)}")
+		print("> Done")
+		print()
+		return
+
+	# Skip renders that were already made
+	cache = None
+	cache_key = ""
+	if cache_size is not None and not (
+		dry_run or gbuffer_file_path or reshade_file_path
+	):
+		from render_cache import RenderCache, render_key
+
+		print()
+		print("> Checking render cache...")
+		try:
+			cache_key = render_key(
+				scene_file_path,
+				width,
+				height,
+				reflection_limit,
+				kernels,
+				triangulate,
+				rasterize,
+				subsampling,
+			)
+		except OSError:
+			# Importing the scene reports why it cannot be read
+			print("Cache skipped (could not read the scene)")
+			print("> Done")
+		else:
+			cache = RenderCache(cache_size * 1_000_000)
+			hit = cache.fetch(cache_key, output_file_path)
+			hits, misses = cache.stats()
+			print(
+				f"Cache {'hit' if hit else 'miss'} ({hits} hits, {misses} misses so far)"
+			)
+			print("> Done")
+			if hit:
+				print()
+				return
+
 	# Import Scene
 	print()
 	print("> Importing...")
 	start_time = perf_counter()
-	scene = import_scene(scene_file_path)
+	scene = import_scene(scene_file_path, triangulate)
 	time_elapsed = perf_counter() - start_time
 	print(f"Time elapsed: {timedelta(seconds=time_elapsed)}")
 	print("> Done")
 	print()
 
+	# Dry runs only estimate the cost of rendering
+	if dry_run:
+		from estimate import estimate
+
+		print("> Estimating...")
+		start_time = perf_counter()
+		print(
+			estimate(scene, width, height, reflection_limit, kernels, backend, workers)
+		)
+		time_elapsed = perf_counter() - start_time
+		print(f"Time elapsed: {timedelta(seconds=time_elapsed)}")
+		print("> Done")
+		print()
+		return
+
+	# Autotune
+	if autotune:
+		from autotune import autotune as tune
+		from autotune import scene_fingerprint
+
+		print("> Autotuning...")
+		start_time = perf_counter()
+		fingerprint = scene_fingerprint(
+			scene_file_path,
+			width,
+			height,
+			reflection_limit,
+			ray_reordering,
+			kernels,
+			backend,
+		)
+		settings = tune(
+			scene,
+			fingerprint,
+			width,
+			height,
+			reflection_limit,
+			ray_reordering,
+			kernels,
+			backend,
+		)
+		workers = settings.workers
+		tile_size = (settings.tile_width, settings.tile_height)
+		batch_size = settings.batch_size
+		print(f"Settings: {settings}")
+		time_elapsed = perf_counter() - start_time
+		print(f"Time elapsed: {timedelta(seconds=time_elapsed)}")
+		print("> Done")
+		print()
+
 	# Raytrace
-	print("> Ray tracing...")
-	start_time = perf_counter()
-	screen = ray_trace(scene, width, height, reflection_limit, progress_bar)
+	profile_file_path = ""
+	if reshade_file_path:
+		from gbuffer import GBuffer, reshade
+
+		print("> Reshading...")
+		start_time = perf_counter()
+		screen = reshade(
+			GBuffer.load(reshade_file_path), scene, kernels, backend, workers
+		)
+	elif gbuffer_file_path:
+		from gbuffer import capture, reshade
+
+		print("> Ray tracing...")
+		start_time = perf_counter()
+		gbuffer = capture(
+			scene, width, height, reflection_limit, kernels, backend, workers
+		)
+		gbuffer.save(gbuffer_file_path)
+		screen = reshade(gbuffer, scene, kernels, backend, workers)
+	else:
+		print("> Ray tracing...")
+		start_time = perf_counter()
+		if profile:
+			from profiling import PROFILE_EXTENSION
+			from profiling import profile as profile_render
+
+			profile_file_path = str(
+				Path(output_file_path).with_suffix(PROFILE_EXTENSION)
+			)
+		with (
+			open_stream(telemetry_target)
+			if telemetry_target
+			else nullcontext() as telemetry_stream,
+			profile_render(profile_file_path)
+			if profile_file_path
+			else nullcontext() as profile_directory,
+		):
+			if shards:
+				from sharding import ray_trace_sharded
+
+				screen = ray_trace_sharded(
+					scene,
+					width,
+					height,
+					reflection_limit,
+					progress_bar,
+					shards,
+					ray_reordering,
+					kernels,
+					tile_size,
+					batch_size,
+					telemetry_stream,
+				)
+			elif subsampling is not None:
+				from subsampling import ray_trace_adaptive
+
+				screen, traced_pixels = ray_trace_adaptive(
+					scene,
+					width,
+					height,
+					reflection_limit,
+					progress_bar,
+					subsampling,
+					kernels,
+					backend,
+					workers,
+					telemetry_stream,
+					profile_directory,
+				)
+				print(f"Pixels traced: {traced_pixels / (width * height):.1%}")
+			else:
+				screen = ray_trace(
+					scene,
+					width,
+					height,
+					reflection_limit,
+					progress_bar,
+					ray_reordering,
+					kernels,
+					backend,
+					workers,
+					tile_size,
+					batch_size,
+					rasterize,
+					telemetry_stream,
+					profile_directory,
+					cost_scheduling,
+				)
 	time_elapsed = perf_counter() - start_time
 	print(f"Time elapsed: {timedelta(seconds=time_elapsed)}")
 	print("> Done")
 	print()
 
+	# Report where the time went
+	if profile_file_path:
+		from profiling import hot_functions
+
+		print("> Profiling...")
+		print(hot_functions(profile_file_path))
+		print(f"Profile: {profile_file_path}")
+		print("> Done")
+		print()
+
 	# Export to file
 	print("> Exporting...")
 	start_time = perf_counter()
 	export(screen, output_file_path)
+	if cache is not None:
+		cache.store(cache_key, output_file_path)
 	time_elapsed = perf_counter() - start_time
 	print(f"Time elapsed: {timedelta(seconds=time_elapsed)}")
 	print("> Done")
@@ -0,0 +1,271 @@
+"""Automatically tunes how ray-tracing work is distributed for the current machine and scene."""
+
+import platform
+from collections.abc import Callable
+from hashlib import sha256
+from json import dumps as dict_as_json
+from json import loads as json_as_dict
+from math import sqrt
+from multiprocessing import cpu_count
+from os import getenv
+from pathlib import Path
+from time import perf_counter
+
+from kernels import use_kernels
+from ray_tracer import (
+	_get_tile_inputs,
+	_get_tiles,
+	_open_imap,
+	_ray_trace_tile_tuple,
+)
+from scene import Scene
+
+CACHE_PATH = (
+	Path(getenv("XDG_CACHE_HOME", str(Path.home() / ".cache")))
+	/ "ray-tracer"
+	/ "autotune.json"
+)
+"Where tuned settings are cached between runs"
+
+CALIBRATION_PIXELS = 64 * 64
+"Approximate minimum number of pixels in each calibration render"
+
+TILES_PER_WORKER = 4
+"Minimum number of tiles each worker gets in a calibration render"
+
+TILE_SIZES = ((1, 1), (4, 4), (8, 8), (16, 16), (32, 32))
+"Candidate tile dimensions"
+
+BATCH_SIZES = (1, 16, 64, 256)
+"Candidate ray batch sizes"
+
+
+class WorkSettings:
+	"""Defines how ray-tracing work is split up and spread across workers."""
+
+	workers: int
+	tile_width: int
+	tile_height: int
+	batch_size: int
+
+	def __init__(
+		self, workers: int, tile_width: int, tile_height: int, batch_size: int
+	) -> None:
+		"""Initialize an instance of WorkSettings."""
+		self.workers = workers
+		self.tile_width = tile_width
+		self.tile_height = tile_height
+		self.batch_size = batch_size
+
+	def is_valid(self) -> bool:
+		"""Return whether every setting is a positive integer."""
+		return all(
+			isinstance(value, int) and value > 0 for value in vars(self).values()
+		)
+
+	def __str__(self) -> str:
+		"""Return a human-readable summary of the settings."""
+		return (
+			f"{self.workers} workers, "
+			f"{self.tile_width}x{self.tile_height} tiles, "
+			f"batches of {self.batch_size} rays"
+		)
+
+
+def scene_fingerprint(
+	scene_file_path: str,
+	width: int,
+	height: int,
+	reflection_limit: int,
+	ray_reordering: bool,
+	kernels: str,
+	backend: str,
+) -> str:
+	"""Return a hash of the scene file contents and every setting that affects tuning."""
+	fingerprint = sha256(Path(scene_file_path).read_bytes())
+	fingerprint.update(
+		f"{width}x{height}/{reflection_limit}/{ray_reordering}/{kernels}/{backend}".encode()
+	)
+	return fingerprint.hexdigest()
+
+
+def autotune(
+	scene: Scene,
+	fingerprint: str,
+	width: int,
+	height: int,
+	reflection_limit: int,
+	ray_reordering: bool,
+	kernels: str,
+	backend: str,
+) -> WorkSettings:
+	"""
+	Return the work settings with the best throughput for this machine and scene.
+
+	Settings are found with short calibration renders of a downsampled version of
+	the scene, and cached by the machine and scene `fingerprint`.
+	"""
+	key = f"{_machine_fingerprint()}/{fingerprint}"
+	cache = _read_cache()
+	if key in cache:
+		try:
+			settings = WorkSettings(**cache[key])
+		except TypeError:
+			settings = None
+		if settings is not None and settings.is_valid():
+			print("Using cached settings")
+			return settings
+
+	settings = _calibrate(
+		scene, width, height, reflection_limit, ray_reordering, kernels, backend
+	)
+
+	cache[key] = vars(settings)
+	_write_cache(cache)
+
+	return settings
+
+
+def _calibrate(
+	scene: Scene,
+	width: int,
+	height: int,
+	reflection_limit: int,
+	ray_reordering: bool,
+	kernels: str,
+	backend: str,
+) -> WorkSettings:
+	"""
+	Tune each setting in turn, keeping the best value of the previous ones.
+
+	Every worker count is measured with its own pool, which traces a frame before
+	it is timed, so only the tile work is timed and not the pool's startup.
+	"""
+	# Prepare the kernels before forking, so workers inherit them ready to use
+	use_kernels(kernels)
+
+	best = WorkSettings(cpu_count(), *TILE_SIZES[2], BATCH_SIZES[0])
+	worker_counts = _worker_counts() if backend != "serial" else [1]
+
+	# Downsample the screen, keeping its aspect ratio and enough tiles for every worker
+	calibration_pixels = max(
+		CALIBRATION_PIXELS,
+		max(worker_counts) * TILES_PER_WORKER * best.tile_width * best.tile_height,
+	)
+	scale = min(1, sqrt(calibration_pixels / (width * height)))
+	calibration_width = max(1, round(width * scale))
+	calibration_height = max(1, round(height * scale))
+	calibration_pixels = calibration_width * calibration_height
+
+	measured: dict[tuple[int, ...], float] = {}
+
+	def trace(settings: WorkSettings, imap: Callable) -> float:
+		"""Trace the calibration frame with the settings, and return how long the tiles took."""
+		_, tuple_inputs = _get_tile_inputs(
+			scene,
+			calibration_width,
+			calibration_height,
+			reflection_limit,
+			ray_reordering,
+			(settings.tile_width, settings.tile_height),
+			settings.batch_size,
+			False,
+		)
+		start_time = perf_counter()
+		for _ in imap(_ray_trace_tile_tuple, tuple_inputs):
+			pass
+		return perf_counter() - start_time
+
+	def throughput(settings: WorkSettings, imap: Callable) -> float:
+		"""Return how many pixels per second are rendered with the settings."""
+		key = tuple(vars(settings).values())
+		if key not in measured:
+			measured[key] = calibration_pixels / trace(settings, imap)
+			print(f"{settings}: {measured[key]:.0f} pixels/second")
+		return measured[key]
+
+	def has_enough_tiles(settings: WorkSettings) -> bool:
+		"""Return whether every worker gets enough tiles of the calibration frame."""
+		tiles = _get_tiles(
+			calibration_width,
+			calibration_height,
+			settings.tile_width,
+			settings.tile_height,
+		)
+		return len(tiles) >= settings.workers * TILES_PER_WORKER
+
+	# Workers, each with a warmed-up pool of their own
+	candidates = [
+		WorkSettings(workers, best.tile_width, best.tile_height, best.batch_size)
+		for workers in worker_counts
+	]
+	throughputs = []
+	for settings in candidates:
+		with _open_imap(backend, kernels, settings.workers, None, scene) as imap:
+			trace(settings, imap)
+			throughputs.append(throughput(settings, imap))
+	best = candidates[throughputs.index(max(throughputs))]
+
+	with _open_imap(backend, kernels, best.workers, None, scene) as imap:
+		trace(best, imap)
+
+		# Tile dimensions
+		candidates = [
+			WorkSettings(best.workers, tile_width, tile_height, best.batch_size)
+			for tile_width, tile_height in TILE_SIZES
+		]
+		candidates = [
+			settings
+			for settings in candidates
+			if settings.tile_width <= calibration_width
+			and settings.tile_height <= calibration_height
+			and has_enough_tiles(settings)
+		]
+		best = max(
+			candidates,
+			key=lambda settings: throughput(settings, imap),
+			default=best,
+		)
+
+		# Ray batch size
+		tile_pixels = best.tile_width * best.tile_height
+		candidates = [
+			WorkSettings(best.workers, best.tile_width, best.tile_height, batch_size)
+			for batch_size in BATCH_SIZES
+			if batch_size == 1 or batch_size <= tile_pixels
+		]
+		return max(candidates, key=lambda settings: throughput(settings, imap))
+
+
+def _worker_counts() -> list[int]:
+	"""Return powers of two up to the number of CPUs, plus the number of CPUs."""
+	counts = []
+	workers = 1
+	while workers < cpu_count():
+		counts.append(workers)
+		workers *= 2
+	counts.append(cpu_count())
+	return counts
+
+
+def _machine_fingerprint() -> str:
+	"""Return an identifier for this machine and its processor."""
+	return f"{platform.node()}-{platform.machine()}-{cpu_count()}"
+
+
+def _read_cache() -> dict:
+	"""Return all cached settings, or nothing if the cache is missing or unreadable."""
+	try:
+		cache = json_as_dict(CACHE_PATH.read_text(encoding="utf8"))
+	except (OSError, ValueError):
+		return {}
+	return cache if isinstance(cache, dict) else {}
+
+
+def _write_cache(cache: dict) -> None:
+	"""Save all cached settings, warning if the cache cannot be written."""
+	try:
+		CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+		CACHE_PATH.write_text(dict_as_json(cache, indent="\t"), encoding="utf8")
+	except OSError as err:
+		print(f"WARNING: Could not save autotune cache to {CACHE_PATH}\n\t{err}")
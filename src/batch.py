@@ -0,0 +1,381 @@
+"""
+Renders many scenes in one run, sharing one pool of workers between them.
+
+The tiles of every job are handed to the same pool as one stream, so workers move
+straight on to the next job instead of idling while the last tiles of a job finish.
+Scenes are imported in the background a few jobs ahead, and only a few tiles per
+worker are queued at a time, so memory does not grow with the size of the batch.
+Worker processes load each scene once from a temporary file, instead of receiving
+it with every tile.
+"""
+
+import pickle
+import sys
+from collections import Counter, deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import timedelta
+from glob import glob
+from json import loads as json_as_dict
+from multiprocessing import cpu_count
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Event, Semaphore
+from time import perf_counter
+
+import numpy as np
+from numpy.typing import NDArray
+from tqdm import tqdm
+
+from exporter import export, get_extension
+from importer import load_scene
+from kernels import use_kernels
+from ray_tracer import (
+	BACKENDS,
+	_get_tile_inputs,
+	_open_pool,
+	_ray_trace_tile_tuple,
+)
+from scene import Scene
+from telemetry import TileReport
+
+IMPORT_LOOKAHEAD = 2
+"Number of jobs whose scenes are imported ahead of the job being handed out"
+
+QUEUED_TILES_PER_WORKER = 4
+"Number of tiles handed to the pool per worker before waiting for one to finish"
+
+WORKER_SCENES = 2
+"Number of job scenes each worker process keeps loaded (the current job, and the one before it)"
+
+_worker_scenes: dict[str, Scene] = {}
+"The scenes of the latest jobs this worker process traced tiles of, by the path they were loaded from"
+
+
+class Job:
+	"""Defines one scene to render, and where to save it."""
+
+	scene_file_path: str
+	output_file_path: str
+	width: int
+	height: int
+	reflection_limit: int
+
+	def __init__(
+		self,
+		scene_file_path: str,
+		output_file_path: str,
+		width: int,
+		height: int,
+		reflection_limit: int,
+	) -> None:
+		"""Initialize an instance of Job."""
+		self.scene_file_path = scene_file_path
+		self.output_file_path = output_file_path
+		self.width = width
+		self.height = height
+		self.reflection_limit = reflection_limit
+
+
+class JobReport:
+	"""Defines how long a job took, and how much work went into it."""
+
+	job: Job
+	error: str | None
+	"Why nothing was rendered, if the job failed"
+	import_seconds: float
+	busy_seconds: float
+	"Total time the workers spent tracing the tiles"
+	finish_seconds: float
+	"Time from the start of the batch until the job was exported"
+	rays: int
+	tiles: int
+	"Number of tiles not received yet, until the job is finished"
+	screen: NDArray[np.float64] | None
+	"The pixel colors, until the job is finished and exported"
+
+	def __init__(self, job: Job) -> None:
+		"""Initialize an instance of JobReport."""
+		self.job = job
+		self.error = None
+		self.import_seconds = 0.0
+		self.busy_seconds = 0.0
+		self.finish_seconds = 0.0
+		self.rays = 0
+		self.tiles = 0
+		self.screen = None
+
+	def __str__(self) -> str:
+		"""Return a one-line summary of the job."""
+		if self.error is not None:
+			return f"{self.job.scene_file_path}: failed ({self.error})"
+		rays_per_second = self.rays / self.busy_seconds if self.busy_seconds else 0
+		return (
+			f"{self.job.scene_file_path} -> {self.job.output_file_path}: "
+			f"{self.job.width}x{self.job.height}, "
+			f"import {timedelta(seconds=self.import_seconds)}, "
+			f"trace {timedelta(seconds=self.busy_seconds)} (worker time), "
+			f"{self.rays} rays ({rays_per_second:.0f}/second), "
+			f"finished after {timedelta(seconds=self.finish_seconds)}"
+		)
+
+
+def find_jobs(
+	pattern: str,
+	output_file_path: str,
+	width: int,
+	height: int,
+	reflection_limit: int,
+) -> list[Job]:
+	"""
+	Return the jobs listed in a manifest file, or one job per scene file matching the glob pattern.
+
+	A manifest is a JSON array of objects with a `scene` path, an `output` path, and
+	optionally a `width`, `height`, and `reflection-limit`, which default to the given ones.
+	Scenes matching a glob pattern are saved next to the output file path,
+	named after the scene, with the extension of the output file path.
+	Prints why and exits if the manifest is invalid, or if jobs share an output path.
+	"""
+	manifest_path = Path(pattern)
+	if manifest_path.is_file():
+		try:
+			manifest = json_as_dict(manifest_path.read_text(encoding="utf8"))
+		except (OSError, ValueError):
+			manifest = None
+		if isinstance(manifest, list):
+			try:
+				jobs = [
+					_load_job(entry, width, height, reflection_limit)
+					for entry in manifest
+				]
+			except (TypeError, ValueError) as err:
+				print(f'"{pattern}" is an improperly formatted manifest\n\t{err}')
+				sys.exit(1)
+			_assert_unique_outputs(jobs)
+			return jobs
+
+	output_path = Path(output_file_path)
+	extension = get_extension(output_file_path)
+	jobs = [
+		Job(
+			scene_file_path,
+			str(output_path.parent / f"{Path(scene_file_path).stem}{extension}"),
+			width,
+			height,
+			reflection_limit,
+		)
+		for scene_file_path in sorted(glob(pattern, recursive=True))
+	]
+	_assert_unique_outputs(jobs)
+	return jobs
+
+
+def render_batch(
+	jobs: list[Job],
+	progress_bar: bool,
+	ray_reordering: bool = False,
+	kernels: str = "numpy",
+	backend: str = "process",
+	workers: int | None = None,
+	tile_size: tuple[int, int] | None = None,
+	batch_size: int | None = None,
+	rasterize: bool = False,
+	triangulate: bool = False,
+) -> list[JobReport]:
+	"""
+	Render and export every job, with the tiles of all jobs sharing the same workers.
+
+	The arguments are the same as those of `ray_trace`, and apply to every job.
+	Jobs whose scenes cannot be imported, or that have no pixels, are reported as
+	failed, and skipped.
+	"""
+	if backend not in BACKENDS:
+		raise ValueError(f"Backend must be one of {BACKENDS}, not {backend}")
+
+	# Prepare the kernels before forking, so workers inherit them ready to use
+	use_kernels(kernels)
+
+	workers = 1 if backend == "serial" else workers or cpu_count()
+	queued_tiles = Semaphore(workers * QUEUED_TILES_PER_WORKER)
+	stopping = Event()
+
+	start_time = perf_counter()
+	reports = [JobReport(job) for job in jobs]
+	with (
+		ThreadPoolExecutor(1) as importer,
+		nullcontext()
+		if backend == "serial"
+		else _open_pool(backend, kernels, workers) as pool,
+		TemporaryDirectory() if backend == "process" else nullcontext() as directory,
+	):
+
+		def job_tile_inputs() -> Iterator[tuple[int, str | None, tuple]]:
+			"""Yield the tile inputs of every job in order, waiting while too many tiles are queued."""
+			imports: deque[Future[tuple[Scene, float]]] = deque()
+			submitted = 0
+			for i, report in enumerate(reports):
+				# Import a few scenes ahead, so the workers do not wait for them
+				while submitted < min(len(jobs), i + 1 + IMPORT_LOOKAHEAD):
+					imports.append(
+						importer.submit(_timed_import, jobs[submitted], triangulate)
+					)
+					submitted += 1
+				scene = _get_imported_scene(report, imports.popleft())
+				if scene is None:
+					continue
+
+				job = report.job
+				if job.width <= 0 or job.height <= 0:
+					report.error = "no pixels to render"
+					continue
+				_, tuple_inputs = _get_tile_inputs(
+					scene,
+					job.width,
+					job.height,
+					job.reflection_limit,
+					ray_reordering,
+					tile_size,
+					batch_size,
+					rasterize,
+				)
+				# Worker processes load the scene from a file, once each
+				scene_path = None
+				if directory is not None:
+					scene_path = str(Path(directory) / f"{i}.pickle")
+					Path(scene_path).write_bytes(pickle.dumps(scene))
+					tuple_inputs = [
+						(None, *tuple_input[1:]) for tuple_input in tuple_inputs
+					]
+
+				report.tiles = len(tuple_inputs)
+				report.screen = np.zeros((job.height, job.width, 3))
+				for tuple_input in tuple_inputs:
+					queued_tiles.acquire()
+					if stopping.is_set():
+						return
+					yield i, scene_path, tuple_input
+
+		outputs = (
+			map(_ray_trace_job_tile_tuple, job_tile_inputs())
+			if pool is None
+			else pool.imap_unordered(_ray_trace_job_tile_tuple, job_tile_inputs())
+		)
+
+		with (
+			tqdm(total=len(jobs), unit="job", disable=not progress_bar) as progress,
+			_stop_on_exit(stopping, queued_tiles),
+		):
+			for i, (x, y, tile_width, tile_height), colors, tile_report in outputs:
+				queued_tiles.release()
+				report = reports[i]
+				assert report.screen is not None
+				report.screen[y : y + tile_height, x : x + tile_width] = colors
+				report.busy_seconds += tile_report.seconds
+				report.rays += tile_report.rays
+				report.tiles -= 1
+
+				# Export finished jobs while the workers carry on with the next ones
+				if report.tiles == 0:
+					Path(report.job.output_file_path).parent.mkdir(
+						parents=True, exist_ok=True
+					)
+					export(report.screen, report.job.output_file_path)
+					report.finish_seconds = perf_counter() - start_time
+					report.screen = None
+					if directory is not None:
+						Path(directory, f"{i}.pickle").unlink(missing_ok=True)
+					progress.update(1)
+			progress.update(sum(report.error is not None for report in reports))
+
+	return reports
+
+
+@contextmanager
+def _stop_on_exit(stopping: Event, queued_tiles: Semaphore) -> Iterator[None]:
+	"""Stop handing out tiles when the context exits, even if it waits for a tile to finish."""
+	try:
+		yield
+	finally:
+		stopping.set()
+		queued_tiles.release()
+
+
+def _assert_unique_outputs(jobs: list[Job]) -> None:
+	"""Print the output paths shared by several jobs and exit, if there are any."""
+	counts = Counter(str(Path(job.output_file_path).resolve()) for job in jobs)
+	collisions = sorted(path for path, count in counts.items() if count > 1)
+	if collisions:
+		print(
+			"Several jobs would be saved to the same output file\n\t"
+			+ "\n\t".join(collisions)
+		)
+		sys.exit(1)
+
+
+def _load_job(entry: dict, width: int, height: int, reflection_limit: int) -> Job:
+	"""Return the job described by the manifest entry."""
+	if not isinstance(entry, dict):
+		raise TypeError(f"Job must be an object, not {entry}")
+	for key in ("scene", "output"):
+		if not isinstance(entry.get(key), str):
+			raise TypeError(f"Job must have a path as its {key}: {entry}")
+	for key in ("width", "height", "reflection-limit"):
+		if key in entry and not isinstance(entry[key], int):
+			raise TypeError(f"Job {key} must be an integer: {entry}")
+	for key in ("width", "height"):
+		if key in entry and entry[key] <= 0:
+			raise ValueError(f"Job {key} must be positive: {entry}")
+
+	return Job(
+		entry["scene"],
+		entry["output"],
+		entry.get("width", width),
+		entry.get("height", height),
+		entry.get("reflection-limit", reflection_limit),
+	)
+
+
+def _timed_import(job: Job, triangulate: bool) -> tuple[Scene, float]:
+	"""Import the scene of the job, and return it with how long it took."""
+	start_time = perf_counter()
+	scene = load_scene(job.scene_file_path, triangulate)
+	return scene, perf_counter() - start_time
+
+
+def _get_imported_scene(
+	report: JobReport, scene_import: Future[tuple[Scene, float]]
+) -> Scene | None:
+	"""Wait for the scene to be imported, or mark the job as failed if it could not be."""
+	try:
+		scene, report.import_seconds = scene_import.result()
+	except (OSError, ValueError) as err:
+		print(f"WARNING: Skipping {report.job.scene_file_path}\n\t{err}")
+		report.error = "could not import the scene"
+		return None
+	return scene
+
+
+def _ray_trace_job_tile_tuple(
+	job_tuple_input: tuple[int, str | None, tuple],
+) -> tuple[int, tuple[int, int, int, int], NDArray[np.float64], TileReport]:
+	"""
+	Unpacks the job index and tuple input for _ray_trace_tile, and returns them with the result.
+
+	Tuple inputs without a scene are traced with the scene saved at the scene path.
+	"""
+	i, scene_path, tuple_input = job_tuple_input
+	if scene_path is not None:
+		tuple_input = (_get_job_scene(scene_path), *tuple_input[1:])
+	colors, report = _ray_trace_tile_tuple(tuple_input)
+	return i, tuple_input[2], colors, report
+
+
+def _get_job_scene(scene_path: str) -> Scene:
+	"""Return the scene saved at the path, loading it if this worker process has not already."""
+	if scene_path not in _worker_scenes:
+		# Forget the oldest scenes, whose jobs are finished
+		while len(_worker_scenes) >= WORKER_SCENES:
+			del _worker_scenes[next(iter(_worker_scenes))]
+		_worker_scenes[scene_path] = pickle.loads(Path(scene_path).read_bytes())
+	return _worker_scenes[scene_path]
@@ -0,0 +1,228 @@
+"""Estimates how long and how much memory a render will take, from a small sample of pixels."""
+
+import pickle
+import tracemalloc
+from datetime import timedelta
+from math import ceil, sqrt
+from multiprocessing import cpu_count
+from random import Random
+from time import perf_counter
+
+import numpy as np
+from numpy.typing import NDArray
+
+from kernels import use_kernels
+from ray_tracer import (
+	_get_bounding_spheres,
+	_get_window_size,
+	_imap,
+	_ray_trace_tile,
+)
+from scene import CountingScene, Scene
+
+SAMPLE_PIXELS = 256
+"Approximate number of pixels traced to measure the scene"
+
+MEMORY_SAMPLE_PIXELS = 16
+"Number of sampled pixels traced again to measure working memory"
+
+DISPATCH_SAMPLE_TILES = 256
+"Number of empty tiles handed to the workers to measure the cost of handing out tiles"
+
+SCREEN_BYTES_PER_PIXEL = 3 * 8
+"Size of each pixel of the screen (three 64-bit floats)"
+
+EXPORT_BYTES_PER_PIXEL = 150
+"Approximate peak memory used by `exporter.export` for each pixel, beyond the screen"
+
+
+class Estimate:
+	"""Defines the measured cost of a scene, and the extrapolated cost of rendering it."""
+
+	sample_pixels: int
+	rays_per_pixel: float
+	"Average number of rays cast per pixel, including shadow rays"
+	mean_reflection_depth: float
+	max_reflection_depth: int
+	seconds_per_pixel: float
+	"Average time to trace a pixel on one worker"
+	seconds_per_tile: float
+	"Average time to hand a tile to a worker and get its pixels back"
+	wall_time: float
+	"Estimated seconds to trace every pixel"
+	screen_bytes: int
+	"Estimated peak memory used by the screen and exporting it"
+	worker_bytes: int
+	"Estimated peak memory used by all workers (scene copies and working memory)"
+
+	def __init__(
+		self,
+		sample_pixels: int,
+		rays_per_pixel: float,
+		mean_reflection_depth: float,
+		max_reflection_depth: int,
+		seconds_per_pixel: float,
+		seconds_per_tile: float,
+		wall_time: float,
+		screen_bytes: int,
+		worker_bytes: int,
+	) -> None:
+		"""Initialize an instance of Estimate."""
+		self.sample_pixels = sample_pixels
+		self.rays_per_pixel = rays_per_pixel
+		self.mean_reflection_depth = mean_reflection_depth
+		self.max_reflection_depth = max_reflection_depth
+		self.seconds_per_pixel = seconds_per_pixel
+		self.seconds_per_tile = seconds_per_tile
+		self.wall_time = wall_time
+		self.screen_bytes = screen_bytes
+		self.worker_bytes = worker_bytes
+
+	@property
+	def peak_bytes(self) -> int:
+		"""Return the estimated peak memory of the whole render."""
+		return self.screen_bytes + self.worker_bytes
+
+	def __str__(self) -> str:
+		"""Return a human-readable summary of the estimate."""
+		return "\n".join(
+			[
+				f"Sampled pixels: {self.sample_pixels}",
+				f"Rays per pixel: {self.rays_per_pixel:.2f}",
+				f"Reflection depth: {self.mean_reflection_depth:.2f} average, {self.max_reflection_depth} max",
+				f"Time per pixel: {self.seconds_per_pixel * 1e6:.0f} us",
+				f"Overhead per tile: {self.seconds_per_tile * 1e6:.0f} us",
+				f"Estimated wall time: {timedelta(seconds=round(self.wall_time))}",
+				f"Estimated screen memory: {_megabytes(self.screen_bytes)}",
+				f"Estimated worker memory: {_megabytes(self.worker_bytes)}",
+				f"Estimated peak memory: {_megabytes(self.peak_bytes)}",
+			]
+		)
+
+
+def estimate(
+	scene: Scene,
+	width: int,
+	height: int,
+	reflection_limit: int,
+	kernels: str = "numpy",
+	backend: str = "process",
+	workers: int | None = None,
+) -> Estimate:
+	"""
+	Trace a stratified sample of pixels, and extrapolate the cost of the full render.
+
+	The wall time assumes the default work distribution of one pixel per tile, and
+	that the workers scale perfectly, so it is a lower bound on machines with fewer
+	cores than workers.
+	Memory estimates do not include the Python interpreter of each worker.
+	"""
+	use_kernels(kernels)
+	workers = 1 if backend == "serial" else workers or cpu_count()
+
+	viewport_size = np.array([width, height])
+	window_size = _get_window_size(
+		viewport_size, scene.camera.focal_length, scene.camera.field_of_view
+	)
+	window_to_viewport_size_ratio = window_size / viewport_size
+	half_window_size = window_size / 2
+	bounding_spheres = _get_bounding_spheres(scene.objects)
+	pixels = _stratified_sample(width, height, SAMPLE_PIXELS)
+
+	def tile_input(counting_scene: Scene, x: int, y: int) -> tuple:
+		"""Return the input of the tile of the pixel, like `ray_trace` does by default."""
+		return (
+			counting_scene,
+			reflection_limit,
+			(x, y, 1, 1),
+			window_to_viewport_size_ratio,
+			half_window_size,
+			1,
+			False,
+			bounding_spheres,
+		)
+
+	def trace(counting_scene: Scene, x: int, y: int) -> None:
+		"""Trace the pixel like `ray_trace` does by default."""
+		_ray_trace_tile(*tile_input(counting_scene, x, y))
+
+	# Time
+	rays = []
+	depths = []
+	start_time = perf_counter()
+	for x, y in pixels:
+		counting_scene = CountingScene(scene)
+		trace(counting_scene, x, y)
+		rays.append(counting_scene.rays)
+		depths.append(max(0, counting_scene.sight_rays - 1))
+	seconds_per_pixel = (perf_counter() - start_time) / len(pixels)
+
+	# Memory (measured separately, since tracing memory slows everything down)
+	tracemalloc.start()
+	for x, y in pixels[:: max(1, len(pixels) // MEMORY_SAMPLE_PIXELS)]:
+		trace(scene, x, y)
+	_, working_bytes = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	# Handing out tiles (and pickling them for processes) is not free either.
+	# The pool is started before timing, since it is started only once per render.
+	seconds_per_tile = 0.0
+	if backend != "serial":
+		x, y = pixels[0]
+		inputs = [tile_input(scene, x, y)] * DISPATCH_SAMPLE_TILES
+		outputs = _imap(_skip_tile_tuple, inputs, backend, kernels, workers)
+		next(outputs)
+		start_time = perf_counter()
+		for _ in outputs:
+			pass
+		seconds_per_tile = (perf_counter() - start_time) / (len(inputs) - 1)
+
+	# Process workers each receive their own copy of the scene
+	scene_bytes = len(pickle.dumps(scene))
+	scene_copies = workers if backend == "process" else 1
+
+	pixel_count = width * height
+	return Estimate(
+		len(pixels),
+		float(np.mean(rays)),
+		float(np.mean(depths)),
+		max(depths),
+		seconds_per_pixel,
+		seconds_per_tile,
+		seconds_per_pixel * pixel_count / min(workers, pixel_count)
+		+ seconds_per_tile * pixel_count,
+		width * height * (SCREEN_BYTES_PER_PIXEL + EXPORT_BYTES_PER_PIXEL),
+		scene_bytes * scene_copies + working_bytes * workers,
+	)
+
+
+def _skip_tile_tuple(tuple_input: tuple) -> NDArray[np.float64]:
+	"""Return black pixels for the tile without tracing it."""
+	_, _, (_, _, width, height), *_ = tuple_input
+	return np.zeros((height, width, 3))
+
+
+def _stratified_sample(width: int, height: int, samples: int) -> list[tuple[int, int]]:
+	"""Return one random pixel from each cell of a grid spread evenly over the screen."""
+	# Split the screen into roughly square cells
+	columns = max(1, min(width, round(sqrt(samples * width / height))))
+	rows = max(1, min(height, ceil(samples / columns)))
+
+	generator = Random(0)
+	pixels = []
+	for row in range(rows):
+		for column in range(columns):
+			x_start, x_end = column * width // columns, (column + 1) * width // columns
+			y_start, y_end = row * height // rows, (row + 1) * height // rows
+			pixels.append(
+				(
+					generator.randrange(x_start, x_end),
+					generator.randrange(y_start, y_end),
+				)
+			)
+	return pixels
+
+
+def _megabytes(num_bytes: int) -> str:
+	"""Return the number of bytes in megabytes."""
+	return f"{num_bytes / 1e6:.1f} MB"
@@ -2,8 +2,6 @@
 
 import sys
 from pathlib import Path
-from secrets import choice
-from string import ascii_letters
 
 import numpy as np
 from numpy.typing import NDArray
@@ -12,20 +10,22 @@ from PIL import Image
 COLOR_MODE = "RGB"
 
 
-def random_str(length: int) -> str:
-	"""Generate a random string of the given length."""
-	return "".join(choice(ascii_letters) for _ in range(length))
+def get_extension(file_path: str) -> str:
+	"""Return the extension of the file path with its dot, which is the whole name for names like `.png`."""
+	name = Path(file_path).name
+	return name[name.rfind(".") :] if "." in name else ""
 
 
 def assert_supported_extension(output_file_path: str) -> None:
-	"""Assert that the file path with the given extension is supported by Pillow."""
-	extension = output_file_path.split(".")[-1]
-	random_file_name = f"temp_{random_str(10)}.{extension}"
-	try:
-		Image.new(COLOR_MODE, (1, 1)).save(random_file_name)
-		Path(random_file_name).unlink()
-	except ValueError:
-		print(f"Output file extension is not supported: {extension}")
+	"""Assert that Pillow can save images with the extension of the file path, without writing any files."""
+	extension = get_extension(output_file_path).lower()
+
+	# Like Image.save, only load every plugin if the common ones do not match
+	Image.preinit()
+	if extension not in Image.EXTENSION:
+		Image.init()
+	if Image.EXTENSION.get(extension) not in Image.SAVE:
+		print(f"Output file extension is not supported: {extension.removeprefix('.')}")
 		sys.exit(1)
 
 
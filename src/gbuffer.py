@@ -0,0 +1,349 @@
+"""
+Captures geometry buffers from renders, and reshades them without casting rays.
+
+A geometry buffer (G-buffer) records, for every pixel and every bounce, what the
+ray hit and which lights were visible from there. As long as the geometry, camera,
+and light positions stay the same, the image can then be recomputed with new
+materials or light colors by only running the shader.
+"""
+
+from multiprocessing import cpu_count
+
+import numpy as np
+from numpy.typing import NDArray
+
+from kernels import use_kernels
+from objects import Object
+from ray import Ray
+from ray_tracer import (
+	COLLISION_NORMAL_OFFSET,
+	FADE_LIMIT,
+	LIGHT_CONTRIBUTION_LIMIT,
+	_get_pixel_direction,
+	_get_window_size,
+	_imap,
+)
+from scene import Scene
+from shader import max_light_contribution, shade
+
+MISSED = -1
+"Object index for rays that did not hit any object"
+
+NOT_CAST = -2
+"Object index for rays that were never cast"
+
+
+class GBuffer:
+	"""
+	Defines what every ray of every pixel hit.
+
+	All arrays have `shape=(height, width, bounces, ...)`.
+	"""
+
+	reflection_limit: int
+	object_indices: NDArray[np.int32]
+	"The index of the object hit, or `MISSED`, or `NOT_CAST`"
+	positions: NDArray[np.float64]
+	"Where the object was hit (offset from the surface)"
+	normals: NDArray[np.float64]
+	view_directions: NDArray[np.float64]
+	lit: NDArray[np.bool_]
+	"Whether each light was unshadowed (lights behind the surface are shadowed)"
+
+	def __init__(
+		self,
+		reflection_limit: int,
+		object_indices: NDArray[np.int32],
+		positions: NDArray[np.float64],
+		normals: NDArray[np.float64],
+		view_directions: NDArray[np.float64],
+		lit: NDArray[np.bool_],
+	) -> None:
+		"""Initialize an instance of GBuffer."""
+		self.reflection_limit = reflection_limit
+		self.object_indices = object_indices
+		self.positions = positions
+		self.normals = normals
+		self.view_directions = view_directions
+		self.lit = lit
+
+	def save(self, file_path: str) -> None:
+		"""Write the G-buffer to a compressed `.npz` file, at exactly the given path."""
+		# NumPy appends `.npz` to paths without it, but not to open files
+		with open(file_path, "wb") as file:
+			np.savez_compressed(
+				file,
+				reflection_limit=self.reflection_limit,
+				object_indices=self.object_indices,
+				positions=self.positions,
+				normals=self.normals,
+				view_directions=self.view_directions,
+				lit=self.lit,
+			)
+
+	@staticmethod
+	def load(file_path: str) -> "GBuffer":
+		"""Read a G-buffer from a file written by `save`."""
+		with np.load(file_path) as data:
+			return GBuffer(
+				int(data["reflection_limit"]),
+				data["object_indices"],
+				data["positions"],
+				data["normals"],
+				data["view_directions"],
+				data["lit"],
+			)
+
+
+def capture(
+	scene: Scene,
+	width: int,
+	height: int,
+	reflection_limit: int,
+	kernels: str = "numpy",
+	backend: str = "process",
+	workers: int | None = None,
+) -> GBuffer:
+	"""
+	Trace the scene and record every bounce of every pixel.
+
+	Every light in front of each surface is shadow-tested, even ones too dim to
+	matter for the current materials, so that materials can be changed when reshading.
+	"""
+	use_kernels(kernels)
+
+	viewport_size = np.array([width, height])
+	window_size = _get_window_size(
+		viewport_size, scene.camera.focal_length, scene.camera.field_of_view
+	)
+	window_to_viewport_size_ratio = window_size / viewport_size
+	half_window_size = window_size / 2
+
+	tuple_inputs = [
+		(
+			scene,
+			reflection_limit,
+			y,
+			width,
+			window_to_viewport_size_ratio,
+			half_window_size,
+		)
+		for y in range(height)
+	]
+	rows = list(
+		_imap(
+			_capture_row_tuple,
+			tuple_inputs,
+			backend,
+			kernels,
+			workers or cpu_count(),
+		)
+	)
+
+	# Drop bounces that no pixel reached
+	object_indices = np.array([row[0] for row in rows])
+	bounces = max(1, int(np.max(np.sum(object_indices != NOT_CAST, axis=2))))
+	return GBuffer(
+		reflection_limit,
+		object_indices[:, :, :bounces],
+		*(np.array([row[i] for row in rows])[:, :, :bounces] for i in range(1, 5)),
+	)
+
+
+def reshade(
+	gbuffer: GBuffer,
+	scene: Scene,
+	kernels: str = "numpy",
+	backend: str = "process",
+	workers: int | None = None,
+) -> NDArray[np.float64]:
+	"""
+	Shade the G-buffer with the materials and light colors of the scene, without casting rays.
+
+	The scene must have the same objects and lights, in the same order,
+	as the scene the G-buffer was captured from.
+	Increasing `reflectivity` cannot add bounces that were not captured.
+
+	Returns a 3-dimensional array of pixel colors with `shape=(height, width, 3)`.
+	"""
+	if np.max(gbuffer.object_indices) >= len(scene.objects):
+		raise ValueError("Scene has fewer objects than the G-buffer was captured with")
+	if gbuffer.lit.shape[3] != len(scene.lights):
+		raise ValueError(
+			f"Scene must have {gbuffer.lit.shape[3]} lights, not {len(scene.lights)}"
+		)
+
+	use_kernels(kernels)
+
+	height = gbuffer.object_indices.shape[0]
+	tuple_inputs = [
+		(
+			scene,
+			gbuffer.reflection_limit,
+			gbuffer.object_indices[y],
+			gbuffer.positions[y],
+			gbuffer.normals[y],
+			gbuffer.view_directions[y],
+			gbuffer.lit[y],
+		)
+		for y in range(height)
+	]
+	rows = _imap(
+		_reshade_row_tuple,
+		tuple_inputs,
+		backend,
+		kernels,
+		workers or cpu_count(),
+	)
+	return np.array(list(rows))
+
+
+def _capture_row_tuple(
+	tuple_input: tuple[Scene, int, int, int, NDArray[np.float64], NDArray[np.float64]],
+) -> tuple[NDArray, ...]:
+	"""Unpacks the tuple input for _capture_row and returns the result."""
+	return _capture_row(*tuple_input)
+
+
+def _capture_row(
+	scene: Scene,
+	reflection_limit: int,
+	y: int,
+	width: int,
+	window_to_viewport_size_ratio: NDArray[np.float64],
+	half_window_size: NDArray[np.float64],
+) -> tuple[NDArray, ...]:
+	"""Record every bounce of every pixel in the row."""
+	bounces = max(0, reflection_limit + 1)
+	object_indices = np.full((width, bounces), NOT_CAST, dtype=np.int32)
+	positions = np.zeros((width, bounces, 3))
+	normals = np.zeros((width, bounces, 3))
+	view_directions = np.zeros((width, bounces, 3))
+	lit = np.zeros((width, bounces, len(scene.lights)), dtype=np.bool_)
+
+	indices = {id(obj): i for i, obj in enumerate(scene.objects)}
+	for x in range(width):
+		ray = Ray(
+			scene.camera.position,
+			_get_pixel_direction(
+				scene, x, y, window_to_viewport_size_ratio, half_window_size
+			),
+		)
+		fade = 1.0
+
+		# Follow the chain of reflections, like _get_color does
+		for bounce in range(bounces):
+			if fade <= FADE_LIMIT:
+				break
+
+			collision = scene.cast_ray(ray)
+			if collision is None:
+				object_indices[x, bounce] = MISSED
+				break
+
+			# Avoid getting trapped inside objects
+			normal = collision.obj.normal(collision.position)
+			collision.position += COLLISION_NORMAL_OFFSET * normal
+
+			object_indices[x, bounce] = indices[id(collision.obj)]
+			positions[x, bounce] = collision.position
+			normals[x, bounce] = normal
+			view_directions[x, bounce] = -1 * ray.direction
+			lit[x, bounce] = _get_lit_lights(scene, collision.position, normal)
+
+			ray = Ray(
+				collision.position,
+				ray.direction - 2 * normal * np.dot(ray.direction, normal),
+			)
+			fade *= collision.obj.reflectivity
+
+	return object_indices, positions, normals, view_directions, lit
+
+
+def _get_lit_lights(
+	scene: Scene, point: NDArray[np.float64], normal: NDArray[np.float64]
+) -> list[bool]:
+	"""Return whether each light is in front of the surface and unblocked."""
+	lit = [False] * len(scene.lights)
+	candidates = []
+	rays = []
+	for i, light in enumerate(scene.lights):
+		light_direction = light.direction_from(point)
+		if np.dot(normal, light_direction) >= 0:
+			candidates.append(i)
+			rays.append(Ray(point, light_direction))
+
+	blockers = scene.cast_shadow_rays(
+		rays, [scene.lights[i].distance_from(point) for i in candidates], candidates
+	)
+	for i, blocker in zip(candidates, blockers, strict=True):
+		lit[i] = blocker is None
+	return lit
+
+
+def _reshade_row_tuple(
+	tuple_input: tuple[
+		Scene,
+		int,
+		NDArray[np.int32],
+		NDArray[np.float64],
+		NDArray[np.float64],
+		NDArray[np.float64],
+		NDArray[np.bool_],
+	],
+) -> NDArray[np.float64]:
+	"""Unpacks the tuple input for _reshade_row and returns the result."""
+	return _reshade_row(*tuple_input)
+
+
+def _reshade_row(
+	scene: Scene,
+	reflection_limit: int,
+	object_indices: NDArray[np.int32],
+	positions: NDArray[np.float64],
+	normals: NDArray[np.float64],
+	view_directions: NDArray[np.float64],
+	lit: NDArray[np.bool_],
+) -> NDArray[np.float64]:
+	"""Shade every pixel in the row of the G-buffer."""
+	width, bounces = object_indices.shape
+	row = np.zeros((width, 3))
+	for x in range(width):
+		# Find how far the new materials let reflections go, like _get_color does
+		objects: list[Object] = []
+		color = np.array([0, 0, 0])
+		fade = 1.0
+		for bounce in range(bounces + 1):
+			if fade <= FADE_LIMIT or bounce > reflection_limit or bounce == bounces:
+				break
+			if object_indices[x, bounce] == NOT_CAST:
+				# The capture stopped here, so assume the ray faded out
+				break
+			if object_indices[x, bounce] == MISSED:
+				color = scene.background_color
+				break
+			objects.append(scene.objects[object_indices[x, bounce]])
+			fade *= objects[-1].reflectivity
+
+		# Shade backward, since every color depends on the color of its reflection
+		for bounce in reversed(range(len(objects))):
+			obj = objects[bounce]
+			position = positions[x, bounce]
+			lights = [
+				light
+				for i, light in enumerate(scene.lights)
+				if lit[x, bounce, i]
+				and max_light_contribution(
+					obj,
+					light,
+					float(np.dot(normals[x, bounce], light.direction_from(position))),
+				)
+				> LIGHT_CONTRIBUTION_LIMIT
+			]
+			color = shade(
+				scene, obj, position, view_directions[x, bounce], lights, color
+			)
+
+		row[x] = color
+
+	return row
@@ -8,39 +8,53 @@ from typing import Any
 import numpy as np
 from numpy.typing import NDArray
 
+from lights import DirectionalLight, Light, PointLight
 from objects import Circle, Object, Plane, Polygon, Sphere, Triangle
 from scene import Camera, Scene
 from vector import magnitude, normalized
 
 
-def import_scene(file_path: str) -> Scene:
-	"""Return a scene with the values importing from the given file."""
-	json_str = None
+def import_scene(file_path: str, triangulate: bool = False) -> Scene:
+	"""
+	Return a scene with the values importing from the given file.
+
+	If `triangulate` is set, polygons are split into triangles.
+	If the scene cannot be loaded, prints why and exits.
+	"""
 	try:
-		with Path(file_path).open(encoding="utf8") as json_file:
-			json_str = json_file.read()
+		return load_scene(file_path, triangulate)
 	except OSError as err:
 		print(f'"{file_path}" is not a valid path\n\t{err}')
 		sys.exit(1)
+	except ValueError as err:
+		print(err)
+		sys.exit(1)
+
+
+def load_scene(file_path: str, triangulate: bool = False) -> Scene:
+	"""
+	Return a scene with the values importing from the given file.
+
+	If `triangulate` is set, polygons are split into triangles.
+	Raises `OSError` if the file cannot be read, and `ValueError` if it is not a valid scene.
+	"""
+	json_str = Path(file_path).read_text(encoding="utf8")
 
 	json_data: dict
 	try:
 		json_data = json_as_dict(json_str)
-	except (TypeError, ValueError) as err:
-		print(f'"{file_path}" is not a valid json file\n\t{err}')
-		sys.exit(1)
+	except ValueError as err:
+		raise ValueError(f'"{file_path}" is not a valid json file\n\t{err}') from err
 
-	scene: Scene
 	try:
-		scene = _load_from_json(json_data)
+		if not isinstance(json_data, dict):
+			raise TypeError(f"Scene must be type dict, not {type(json_data)}")
+		return load_from_json(json_data, triangulate)
 	except (TypeError, ValueError) as err:
-		print(f'"{file_path}" is improperly formatted\n\t{err}')
-		sys.exit(1)
-
-	return scene
+		raise ValueError(f'"{file_path}" is improperly formatted\n\t{err}') from err
 
 
-def _load_from_json(json: dict) -> Scene:
+def load_from_json(json: dict, triangulate: bool = False) -> Scene:
 	"""Import a scene from a dictionary formatted as a JSON file."""
 	error_prefix = "Scene"
 
@@ -71,16 +85,27 @@ def _load_from_json(json: dict) -> Scene:
 	camera = Camera(camera_look_at, camera_look_from, camera_look_up, field_of_view)
 
 	# Lighting
-	light_direction = _validate_direction_vector(
-		json.get("light_direction"),
-		default=[0, 1, 0],
-		error_prefix=f"{error_prefix}.light_direction",
-	)
-	light_color = _validate_color_vector(
-		json.get("light_color"),
-		default=[1, 1, 1],
-		error_prefix=f"{error_prefix}.light_color",
-	)
+	lights: list[Light]
+	if json.get("lights") is not None:
+		lights = _load_lights(
+			json.get("lights"),
+			error_prefix=f"{error_prefix}.lights",
+		)
+	else:
+		# Fall back to the single directional light
+		light = DirectionalLight(
+			_validate_direction_vector(
+				json.get("light_direction"),
+				default=[0, 1, 0],
+				error_prefix=f"{error_prefix}.light_direction",
+			)
+		)
+		light.color = _validate_color_vector(
+			json.get("light_color"),
+			default=[1, 1, 1],
+			error_prefix=f"{error_prefix}.light_color",
+		)
+		lights = [light]
 	ambient_light_color = _validate_color_vector(
 		json.get("ambient_light_color"),
 		default=[1, 1, 1],
@@ -96,30 +121,110 @@ def _load_from_json(json: dict) -> Scene:
 	objects = _load_objects(
 		json.get("objects"),
 		default=[],
+		triangulate=triangulate,
 		error_prefix=f"{error_prefix}.objects",
 	)
 
 	return Scene(
 		camera,
-		light_direction,
-		light_color,
+		lights,
 		ambient_light_color,
 		background_color,
 		objects,
 	)
 
 
+def _load_lights(
+	json_value: Any | None,
+	default: list[Light] | None = None,
+	error_prefix: str = "Lights",
+) -> list[Light]:
+	"""Take a list of dictionaries and imports each of them as a Light."""
+	lights = []
+
+	json_value = _validate_list(json_value, default=default, error_prefix=error_prefix)
+	for count, element in enumerate(json_value):
+		light = _load_light(element, error_prefix=f"{error_prefix}[{count}]")
+		lights.append(light)
+
+	return lights
+
+
+def _load_light(json_value: Any | None, error_prefix: str = "Light") -> Light:
+	"""Import a dictionary as a Light."""
+	light: Light | None = None
+
+	if json_value is None:
+		raise ValueError(f"{error_prefix} must not be missing")
+	if not isinstance(json_value, dict):
+		raise TypeError(f"{error_prefix} must be type dict, not {type(json_value)}")
+
+	light_type = json_value.get("type")
+	if light_type is None:
+		raise ValueError(f"{error_prefix}.type must not be missing")
+	if not isinstance(light_type, str):
+		raise TypeError(
+			f"{error_prefix}.type must be type string, not {type(light_type)}"
+		)
+	light_type = light_type.lower()
+
+	# Load in light-type-specific values
+	if light_type == "directional":
+		light = DirectionalLight(
+			_validate_direction_vector(
+				json_value.get("direction"),
+				error_prefix=f"{error_prefix}<DirectionalLight>.direction",
+			)
+		)
+	elif light_type == "point":
+		light = PointLight(
+			_validate_position_vector(
+				json_value.get("position"),
+				error_prefix=f"{error_prefix}<PointLight>.position",
+			)
+		)
+	else:
+		raise TypeError(f"{error_prefix} must have valid type, not {light_type}")
+
+	# Load in universal light values
+	name = json_value.get("name")
+	if name is not None and not isinstance(name, str):
+		raise TypeError(f"{error_prefix}.name must be type string, not {type(name)}")
+	light.name = name
+
+	light.color = _validate_color_vector(
+		json_value.get("color"),
+		default=[1, 1, 1],
+		error_prefix=f"{error_prefix}.color",
+	)
+
+	return light
+
+
 def _load_objects(
 	json_value: Any | None,
 	default: list[Object] | None = None,
+	triangulate: bool = False,
 	error_prefix: str = "Objects",
 ) -> list[Object]:
-	"""Take a list of dictionaries and imports each of them as an Object."""
-	objects = []
+	"""
+	Take a list of dictionaries and imports each of them as an Object.
+
+	If `triangulate` is set, polygons are replaced with the triangles that cover them.
+	"""
+	objects: list[Object] = []
 
 	json_value = _validate_list(json_value, default=default, error_prefix=error_prefix)
 	for count, element in enumerate(json_value):
 		obj = _load_object(element, error_prefix=f"{error_prefix}[{count}]")
+		if triangulate and isinstance(obj, Polygon) and not isinstance(obj, Triangle):
+			try:
+				objects.extend(obj.triangulate())
+				continue
+			except ValueError as err:
+				print(
+					f"WARNING: {error_prefix}[{count}]<Polygon> could not be triangulated, keeping it as a Polygon\n\t{err}"
+				)
 		objects.append(obj)
 
 	return objects
@@ -318,7 +423,7 @@ def _validate_position_vector(
 			error_prefix=f"{error_prefix} element",
 		)
 
-	return np.array(json_value)
+	return np.array(json_value, dtype=np.float64)
 
 
 def _validate_direction_vector(
@@ -340,7 +445,7 @@ def _validate_direction_vector(
 		)
 
 	# Convert to numpy array
-	vector = np.array(json_value)
+	vector = np.array(json_value, dtype=np.float64)
 
 	# Make sure the vector is normalized
 	mag = magnitude(vector)
@@ -376,7 +481,7 @@ def _validate_color_vector(
 			error_prefix=f"{error_prefix} element",
 		)
 
-	return np.array(json_value)
+	return np.array(json_value, dtype=np.float64)
 
 
 def _validate_list(
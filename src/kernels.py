@@ -0,0 +1,525 @@
+"""
+The hot numerical loops of the ray tracer, with optional JIT compilation.
+
+By default, every kernel is the plain NumPy implementation.
+Call `use_kernels("jit")` to swap in versions compiled with
+[Numba](https://numba.pydata.org/), if it is installed,
+or `use_kernels("scalar")` to swap in versions that convert their small arrays
+to Python floats and use the `math` module, which avoids NumPy's per-call overhead.
+
+Kernels must always be looked up through this module (`kernels.sphere_intersection`)
+rather than imported directly, so that swapping implementations takes effect.
+"""
+
+from collections.abc import Callable
+from math import inf, sqrt
+from typing import Any
+
+import numpy as np
+from numpy.typing import NDArray
+
+KERNELS = ("numpy", "jit", "scalar")
+"Names of the supported kernel implementations"
+
+
+# NumPy kernels
+
+
+def _sphere_intersection_numpy(
+	position: NDArray[np.float64],
+	radius: float,
+	origin: NDArray[np.float64],
+	direction: NDArray[np.float64],
+) -> float:
+	"""Return how far along the ray it collides with the sphere, or `inf` if it misses."""
+	relative_position = position - origin
+	distance_sqr = np.dot(relative_position, relative_position)
+	distance = distance_sqr**0.5
+
+	origin_outside = distance >= radius
+
+	closest_approach = np.dot(direction, relative_position)
+
+	if closest_approach < 0 and origin_outside:
+		return inf
+
+	closest_approach_dist_to_surface_sqr = (
+		radius**2 - distance_sqr + closest_approach**2
+	)
+
+	if closest_approach_dist_to_surface_sqr < 0:
+		return inf
+
+	closest_approach_dist_to_surface = closest_approach_dist_to_surface_sqr**0.5
+
+	return (
+		(closest_approach - closest_approach_dist_to_surface)
+		if origin_outside
+		else (closest_approach + closest_approach_dist_to_surface)
+	)
+
+
+def _plane_intersection_numpy(
+	normal: NDArray[np.float64],
+	distance_from_origin: float,
+	origin: NDArray[np.float64],
+	direction: NDArray[np.float64],
+) -> float:
+	"""Return how far along the ray it collides with the plane, or `inf` if it misses."""
+	v_d = np.dot(normal, direction)
+	if v_d == 0:
+		# Ray is parallel to plane
+		return inf
+
+	v_o = -np.dot(normal, origin) - distance_from_origin
+	t = v_o / v_d
+	if t <= 0:
+		# Intersection point is behind the ray
+		return inf
+
+	return t
+
+
+def _polygon_crossings_numpy(
+	edge_starts: NDArray[np.float64],
+	edge_ends: NDArray[np.float64],
+	flattened_point: NDArray[np.float64],
+	x_axis_shift: float,
+) -> int:
+	"""Return how many times the polygon edges cross the x-axis to the right of the point."""
+	# Move all flattened edges so the point is at the origin
+	starts = edge_starts - flattened_point
+	ends = edge_ends - flattened_point
+
+	# Make sure no vertices lie on the x-axis
+	starts[starts[:, 1] == 0, 1] = x_axis_shift
+	ends[ends[:, 1] == 0, 1] = x_axis_shift
+
+	# Only edges that cross the x-axis can cross
+	crossing = (starts[:, 1] < 0) != (ends[:, 1] < 0)
+	starts = starts[crossing]
+	ends = ends[crossing]
+
+	right_of_y_axis = starts[:, 0] > 0
+	next_right_of_y_axis = ends[:, 0] > 0
+
+	# Edges entirely right of the y-axis cross,
+	# and edges partly right of it cross if their intersection with the x-axis does
+	differences = ends - starts
+	cross = starts[:, 0] - starts[:, 1] * differences[:, 0] / differences[:, 1]
+	crosses = (right_of_y_axis & next_right_of_y_axis) | (
+		(right_of_y_axis | next_right_of_y_axis) & (cross > 0)
+	)
+
+	return int(np.count_nonzero(crosses))
+
+
+def _triangle_area_numpy(
+	vertex_1: NDArray[np.float64],
+	vertex_2: NDArray[np.float64],
+	vertex_3: NDArray[np.float64],
+) -> float:
+	"""Return the area of the triangle enclosed by the three flattened vertices."""
+	area: float = (
+		vertex_1[0] * (vertex_2[1] - vertex_3[1])
+		+ vertex_2[0] * (vertex_3[1] - vertex_1[1])
+		+ vertex_3[0] * (vertex_1[1] - vertex_2[1])
+	) / 2.0
+	return abs(area)
+
+
+def _phong_numpy(
+	surface_normal: NDArray[np.float64],
+	view_direction: NDArray[np.float64],
+	light_directions: list[NDArray[np.float64]],
+	light_colors: list[NDArray[np.float64]],
+	gloss_coefficient: float,
+) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+	"""Return the summed diffuse and specular light intensities from every light."""
+	diffuse = np.zeros(3)
+	specular = np.zeros(3)
+	for light_direction, light_color in zip(
+		light_directions, light_colors, strict=True
+	):
+		normal_dot_light = np.dot(surface_normal, light_direction)
+		light_reflection_direction = (
+			2 * surface_normal * normal_dot_light - light_direction
+		)
+		view_dot_light = np.dot(view_direction, light_reflection_direction)
+
+		diffuse += light_color * max(0, normal_dot_light)
+		specular += light_color * max(0, view_dot_light) ** gloss_coefficient
+
+	return diffuse, specular
+
+
+# JIT kernels
+# (Written with explicit scalar loops, which Numba compiles well.)
+
+
+def _sphere_intersection_loops(
+	position: NDArray[np.float64],
+	radius: float,
+	origin: NDArray[np.float64],
+	direction: NDArray[np.float64],
+) -> float:
+	"""Return how far along the ray it collides with the sphere, or `inf` if it misses."""
+	distance_sqr = 0.0
+	closest_approach = 0.0
+	for i in range(3):
+		relative = position[i] - origin[i]
+		distance_sqr += relative * relative
+		closest_approach += direction[i] * relative
+
+	origin_outside = distance_sqr >= radius * radius
+	if closest_approach < 0 and origin_outside:
+		return inf
+
+	closest_approach_dist_to_surface_sqr = (
+		radius * radius - distance_sqr + closest_approach * closest_approach
+	)
+	if closest_approach_dist_to_surface_sqr < 0:
+		return inf
+
+	closest_approach_dist_to_surface = sqrt(closest_approach_dist_to_surface_sqr)
+	if origin_outside:
+		return closest_approach - closest_approach_dist_to_surface
+	return closest_approach + closest_approach_dist_to_surface
+
+
+def _plane_intersection_loops(
+	normal: NDArray[np.float64],
+	distance_from_origin: float,
+	origin: NDArray[np.float64],
+	direction: NDArray[np.float64],
+) -> float:
+	"""Return how far along the ray it collides with the plane, or `inf` if it misses."""
+	v_d = 0.0
+	v_o = -distance_from_origin
+	for i in range(3):
+		v_d += normal[i] * direction[i]
+		v_o -= normal[i] * origin[i]
+
+	if v_d == 0:
+		return inf
+	t = v_o / v_d
+	if t <= 0:
+		return inf
+	return t
+
+
+def _polygon_crossings_loops(
+	edge_starts: NDArray[np.float64],
+	edge_ends: NDArray[np.float64],
+	flattened_point: NDArray[np.float64],
+	x_axis_shift: float,
+) -> int:
+	"""Return how many times the polygon edges cross the x-axis to the right of the point."""
+	num_crossings = 0
+	for i in range(edge_starts.shape[0]):
+		x = edge_starts[i, 0] - flattened_point[0]
+		y = edge_starts[i, 1] - flattened_point[1]
+		next_x = edge_ends[i, 0] - flattened_point[0]
+		next_y = edge_ends[i, 1] - flattened_point[1]
+
+		# Make sure no vertices lie on the x-axis
+		if y == 0:
+			y += x_axis_shift
+		if next_y == 0:
+			next_y += x_axis_shift
+
+		# If the edge crosses the x axis...
+		if (y < 0) != (next_y < 0):
+			if x > 0 and next_x > 0:
+				# This edge crosses
+				num_crossings += 1
+			elif x > 0 or next_x > 0:
+				# The edge might cross
+				cross = x - y * (next_x - x) / (next_y - y)
+				if cross > 0:
+					num_crossings += 1
+
+	return num_crossings
+
+
+def _triangle_area_loops(
+	vertex_1: NDArray[np.float64],
+	vertex_2: NDArray[np.float64],
+	vertex_3: NDArray[np.float64],
+) -> float:
+	"""Return the area of the triangle enclosed by the three flattened vertices."""
+	area = (
+		vertex_1[0] * (vertex_2[1] - vertex_3[1])
+		+ vertex_2[0] * (vertex_3[1] - vertex_1[1])
+		+ vertex_3[0] * (vertex_1[1] - vertex_2[1])
+	) / 2.0
+	return abs(area)
+
+
+def _phong_loops(
+	surface_normal: NDArray[np.float64],
+	view_direction: NDArray[np.float64],
+	light_directions: NDArray[np.float64],
+	light_colors: NDArray[np.float64],
+	gloss_coefficient: float,
+) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+	"""Return the summed diffuse and specular light intensities from every light."""
+	diffuse = np.zeros(3)
+	specular = np.zeros(3)
+	for light in range(light_directions.shape[0]):
+		normal_dot_light = 0.0
+		for i in range(3):
+			normal_dot_light += surface_normal[i] * light_directions[light, i]
+
+		view_dot_light = 0.0
+		for i in range(3):
+			view_dot_light += view_direction[i] * (
+				2 * surface_normal[i] * normal_dot_light - light_directions[light, i]
+			)
+
+		diffuse_intensity = max(0.0, normal_dot_light)
+		specular_intensity = max(0.0, view_dot_light) ** gloss_coefficient
+		for i in range(3):
+			diffuse[i] += light_colors[light, i] * diffuse_intensity
+			specular[i] += light_colors[light, i] * specular_intensity
+
+	return diffuse, specular
+
+
+# Scalar kernels
+# (Written with Python floats, since NumPy's overhead dominates on 3-element arrays.)
+
+
+def _sphere_intersection_scalar(
+	position: NDArray[np.float64],
+	radius: float,
+	origin: NDArray[np.float64],
+	direction: NDArray[np.float64],
+) -> float:
+	"""Return how far along the ray it collides with the sphere, or `inf` if it misses."""
+	position_x, position_y, position_z = position.tolist()
+	origin_x, origin_y, origin_z = origin.tolist()
+	direction_x, direction_y, direction_z = direction.tolist()
+
+	relative_x = position_x - origin_x
+	relative_y = position_y - origin_y
+	relative_z = position_z - origin_z
+	distance_sqr = (
+		relative_x * relative_x + relative_y * relative_y + relative_z * relative_z
+	)
+
+	origin_outside = sqrt(distance_sqr) >= radius
+
+	closest_approach = (
+		direction_x * relative_x + direction_y * relative_y + direction_z * relative_z
+	)
+	if closest_approach < 0 and origin_outside:
+		return inf
+
+	closest_approach_dist_to_surface_sqr = (
+		radius * radius - distance_sqr + closest_approach * closest_approach
+	)
+	if closest_approach_dist_to_surface_sqr < 0:
+		return inf
+
+	closest_approach_dist_to_surface = sqrt(closest_approach_dist_to_surface_sqr)
+	if origin_outside:
+		return closest_approach - closest_approach_dist_to_surface
+	return closest_approach + closest_approach_dist_to_surface
+
+
+def _plane_intersection_scalar(
+	normal: NDArray[np.float64],
+	distance_from_origin: float,
+	origin: NDArray[np.float64],
+	direction: NDArray[np.float64],
+) -> float:
+	"""Return how far along the ray it collides with the plane, or `inf` if it misses."""
+	normal_x, normal_y, normal_z = normal.tolist()
+	direction_x, direction_y, direction_z = direction.tolist()
+
+	v_d = normal_x * direction_x + normal_y * direction_y + normal_z * direction_z
+	if v_d == 0:
+		return inf
+
+	origin_x, origin_y, origin_z = origin.tolist()
+	v_o = (
+		-(normal_x * origin_x + normal_y * origin_y + normal_z * origin_z)
+		- distance_from_origin
+	)
+	t = v_o / v_d
+	if t <= 0:
+		return inf
+	return t
+
+
+def _polygon_crossings_scalar(
+	edge_starts: NDArray[np.float64],
+	edge_ends: NDArray[np.float64],
+	flattened_point: NDArray[np.float64],
+	x_axis_shift: float,
+) -> int:
+	"""Return how many times the polygon edges cross the x-axis to the right of the point."""
+	point_x, point_y = flattened_point.tolist()
+	num_crossings = 0
+	for (start_x, start_y), (end_x, end_y) in zip(
+		edge_starts.tolist(), edge_ends.tolist(), strict=True
+	):
+		x = start_x - point_x
+		y = start_y - point_y
+		next_x = end_x - point_x
+		next_y = end_y - point_y
+
+		# Make sure no vertices lie on the x-axis
+		if y == 0:
+			y = x_axis_shift
+		if next_y == 0:
+			next_y = x_axis_shift
+
+		# If the edge crosses the x axis...
+		if (y < 0) != (next_y < 0):
+			if x > 0 and next_x > 0:
+				# This edge crosses
+				num_crossings += 1
+			elif x > 0 or next_x > 0:
+				# The edge might cross
+				cross = x - y * (next_x - x) / (next_y - y)
+				if cross > 0:
+					num_crossings += 1
+
+	return num_crossings
+
+
+def _triangle_area_scalar(
+	vertex_1: NDArray[np.float64],
+	vertex_2: NDArray[np.float64],
+	vertex_3: NDArray[np.float64],
+) -> float:
+	"""Return the area of the triangle enclosed by the three flattened vertices."""
+	x_1, y_1 = vertex_1.tolist()
+	x_2, y_2 = vertex_2.tolist()
+	x_3, y_3 = vertex_3.tolist()
+	return abs((x_1 * (y_2 - y_3) + x_2 * (y_3 - y_1) + x_3 * (y_1 - y_2)) / 2.0)
+
+
+def _phong_scalar(
+	surface_normal: NDArray[np.float64],
+	view_direction: NDArray[np.float64],
+	light_directions: list[NDArray[np.float64]],
+	light_colors: list[NDArray[np.float64]],
+	gloss_coefficient: float,
+) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+	"""Return the summed diffuse and specular light intensities from every light."""
+	normal_x, normal_y, normal_z = surface_normal.tolist()
+	view_x, view_y, view_z = view_direction.tolist()
+	diffuse = [0.0, 0.0, 0.0]
+	specular = [0.0, 0.0, 0.0]
+	for light_direction, light_color in zip(
+		light_directions, light_colors, strict=True
+	):
+		light_x, light_y, light_z = light_direction.tolist()
+		normal_dot_light = normal_x * light_x + normal_y * light_y + normal_z * light_z
+		view_dot_light = (
+			view_x * (2 * normal_x * normal_dot_light - light_x)
+			+ view_y * (2 * normal_y * normal_dot_light - light_y)
+			+ view_z * (2 * normal_z * normal_dot_light - light_z)
+		)
+
+		diffuse_intensity = max(0, normal_dot_light)
+		specular_intensity = max(0, view_dot_light) ** gloss_coefficient
+		for i, channel in enumerate(light_color.tolist()):
+			diffuse[i] += channel * diffuse_intensity
+			specular[i] += channel * specular_intensity
+
+	return np.array(diffuse), np.array(specular)
+
+
+# Active kernels
+
+sphere_intersection: Callable[..., float] = _sphere_intersection_numpy
+plane_intersection: Callable[..., float] = _plane_intersection_numpy
+polygon_crossings: Callable[..., int] = _polygon_crossings_numpy
+triangle_area: Callable[..., float] = _triangle_area_numpy
+phong: Callable[..., tuple[NDArray[np.float64], NDArray[np.float64]]] = _phong_numpy
+_active = "numpy"
+
+
+def use_kernels(name: str) -> None:
+	"""
+	Swap in the kernels with the given name.
+
+	Falls back to the NumPy kernels (with a warning) if Numba is not installed.
+	JIT kernels are compiled immediately, so forked workers inherit them ready to use,
+	and they release the GIL, so threaded workers can run them in parallel.
+	"""
+	global sphere_intersection, plane_intersection, polygon_crossings, triangle_area
+	global phong, _active
+
+	if name not in KERNELS:
+		raise ValueError(f"Kernels must be one of {KERNELS}, not {name}")
+	if name == _active:
+		return
+	_active = name
+
+	sphere_intersection = _sphere_intersection_numpy
+	plane_intersection = _plane_intersection_numpy
+	polygon_crossings = _polygon_crossings_numpy
+	triangle_area = _triangle_area_numpy
+	phong = _phong_numpy
+
+	if name == "scalar":
+		sphere_intersection = _sphere_intersection_scalar
+		plane_intersection = _plane_intersection_scalar
+		polygon_crossings = _polygon_crossings_scalar
+		triangle_area = _triangle_area_scalar
+		phong = _phong_scalar
+
+	if name == "jit":
+		try:
+			# Numba is an optional extra, so it may not be installed to type-check against
+			from numba import njit  # ty: ignore[unresolved-import]
+		except ImportError:
+			print("WARNING: Numba is not installed, falling back to numpy kernels")
+			return
+
+		jit: Callable[[Callable], Any] = njit(cache=True, nogil=True)
+		sphere_intersection = jit(_sphere_intersection_loops)
+		plane_intersection = jit(_plane_intersection_loops)
+		polygon_crossings = jit(_polygon_crossings_loops)
+		triangle_area = jit(_triangle_area_loops)
+		phong = _phong_jit_wrapper(jit(_phong_loops))
+		_compile()
+
+
+def _phong_jit_wrapper(
+	compiled: Callable[..., tuple[NDArray[np.float64], NDArray[np.float64]]],
+) -> Callable[..., tuple[NDArray[np.float64], NDArray[np.float64]]]:
+	"""Wrap the compiled Phong kernel to accept the lists the NumPy kernel takes."""
+
+	def _phong(
+		surface_normal: NDArray[np.float64],
+		view_direction: NDArray[np.float64],
+		light_directions: list[NDArray[np.float64]],
+		light_colors: list[NDArray[np.float64]],
+		gloss_coefficient: float,
+	) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+		return compiled(
+			surface_normal,
+			view_direction,
+			np.array(light_directions, dtype=np.float64).reshape(-1, 3),
+			np.array(light_colors, dtype=np.float64).reshape(-1, 3),
+			float(gloss_coefficient),
+		)
+
+	return _phong
+
+
+def _compile() -> None:
+	"""Call every kernel once so the JIT compiles them ahead of time."""
+	vector = np.zeros(3)
+	flattened = np.zeros(2)
+	sphere_intersection(vector, 1.0, vector, vector)
+	plane_intersection(vector, 1.0, vector, vector)
+	polygon_crossings(np.zeros((3, 2)), np.zeros((3, 2)), flattened, 0.0)
+	triangle_area(flattened, flattened, flattened)
+	phong(vector, vector, [vector], [vector], 1.0)
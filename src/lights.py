@@ -0,0 +1,67 @@
+"""Definitions for all supported light sources and their behavior."""
+
+from math import inf
+
+import numpy as np
+from numpy.typing import NDArray
+
+from vector import magnitude, normalized
+
+
+class Light:
+	"""The universal values shared by all lights."""
+
+	name: str | None = None
+	color: NDArray[np.float64] = np.array([1, 1, 1])
+
+	def direction_from(self, point: NDArray[np.float64]) -> NDArray[np.float64]:
+		"""Return the normalized direction from the point toward the light."""
+		raise NotImplementedError
+
+	def distance_from(self, point: NDArray[np.float64]) -> float:
+		"""Return how far a shadow ray from the point must travel to reach the light."""
+		raise NotImplementedError
+
+
+class DirectionalLight(Light):
+	"""The specific values necessary for DirectionalLights."""
+
+	direction: NDArray[np.float64]
+
+	def __init__(self, direction: NDArray[np.float64]) -> None:
+		"""Initialize an instance of DirectionalLight."""
+		super().__init__()
+		self.direction = normalized(direction)
+
+	def direction_from(
+		self, point: NDArray[np.float64] | None = None
+	) -> NDArray[np.float64]:
+		"""Return the direction toward the light, which is the same for every point."""
+		return self.direction
+
+	def distance_from(self, point: NDArray[np.float64] | None = None) -> float:
+		"""Return the distance to the light, which is infinitely far away."""
+		return inf
+
+
+class PointLight(Light):
+	"""
+	The specific values necessary for PointLights.
+
+	Point lights do not attenuate with distance.
+	"""
+
+	position: NDArray[np.float64]
+
+	def __init__(self, position: NDArray[np.float64]) -> None:
+		"""Initialize an instance of PointLight."""
+		super().__init__()
+		self.position = position
+
+	def direction_from(self, point: NDArray[np.float64]) -> NDArray[np.float64]:
+		"""Return the normalized direction from the point toward the light."""
+		return normalized(self.position - point)
+
+	def distance_from(self, point: NDArray[np.float64]) -> float:
+		"""Return the distance from the point to the light."""
+		return magnitude(self.position - point)
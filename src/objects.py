@@ -1,9 +1,11 @@
 """Definitions for all supported objects and their behavior."""
 
+from math import inf
+
 import numpy as np
 from numpy.typing import NDArray
 
-from lib._itertools import closed_pairwise
+import kernels
 from ray import Ray, RayCollision
 from vector import magnitude, normalized
 
@@ -28,10 +30,38 @@ class Object:
 		"""
 		raise NotImplementedError
 
+	def ray_distance(self, ray: Ray, t_max: float = inf) -> float:
+		"""
+		Calculate how far along the ray (in multiples of its direction) it collides with this object.
+
+		Returns `inf` if the ray misses, or only collides at `t_max` or farther,
+		so objects behind the closest collision so far can be rejected early.
+		"""
+		raise NotImplementedError
+
 	def ray_intersection(self, ray: Ray) -> RayCollision | None:
 		"""Calculate whether the given ray collides with this object."""
+		t = self.ray_distance(ray)
+		if t == inf:
+			return None
+
+		return RayCollision(self, ray, ray.origin + ray.direction * t)
+
+	def ray_distances(
+		self, origin: NDArray[np.float64], directions: NDArray[np.float64]
+	) -> NDArray[np.float64]:
+		"""
+		Calculate how far along many rays from one origin they collide with this object.
+
+		The directions must be normalized, with `shape=(rays, 3)`.
+		Returns `inf` for rays that miss.
+		"""
 		raise NotImplementedError
 
+	def bounding_sphere(self) -> tuple[NDArray[np.float64], float] | None:
+		"""Return the center and radius of a sphere containing the object, or nothing if it is unbounded."""
+		return None
+
 
 class Plane(Object):
 	"""The specific values necessary for Planes."""
@@ -52,20 +82,24 @@ class Plane(Object):
 		"""Return the "up" direction, which is the same for every point."""
 		return self._normal
 
-	def ray_intersection(self, ray: Ray) -> RayCollision | None:
-		"""Calculate whether the given ray collides with this object."""
-		v_d = np.dot(self._normal, ray.direction)
-		if v_d == 0:
-			# Ray is parallel to plane
-			return None
+	def ray_distance(self, ray: Ray, t_max: float = inf) -> float:
+		"""Calculate how far along the ray it collides with this object, if closer than `t_max`."""
+		t = kernels.plane_intersection(
+			self._normal, self._distance_from_origin, ray.origin, ray.direction
+		)
+		return t if t < t_max else inf
 
-		v_o = -np.dot(self._normal, ray.origin) - self._distance_from_origin
-		t = v_o / v_d
-		if t <= 0:
-			# Intersection point is behind the ray
-			return None
+	def ray_distances(
+		self, origin: NDArray[np.float64], directions: NDArray[np.float64]
+	) -> NDArray[np.float64]:
+		"""Calculate how far along many rays from one origin they collide with this object."""
+		v_d = directions @ self._normal
+		v_o = -np.dot(self._normal, origin) - self._distance_from_origin
+		with np.errstate(divide="ignore", invalid="ignore"):
+			t = v_o / v_d
 
-		return RayCollision(self, ray, ray.origin + ray.direction * t)
+		# Rays parallel to the plane, or with intersections behind them, miss
+		return np.where((v_d != 0) & (t > 0), t, inf)
 
 
 class Circle(Object):
@@ -91,21 +125,38 @@ class Circle(Object):
 		"""Return the "up" direction, which is the same for every point."""
 		return self._plane.normal(point)
 
-	def ray_intersection(self, ray: Ray) -> RayCollision | None:
-		"""Calculate whether the given ray collides with this object."""
+	def ray_distance(self, ray: Ray, t_max: float = inf) -> float:
+		"""Calculate how far along the ray it collides with this object, if closer than `t_max`."""
 		# See if ray intersects with plane
-		plane_collision = self._plane.ray_intersection(ray)
-		if plane_collision is None:
-			return None
+		t = self._plane.ray_distance(ray, t_max)
+		if t == inf:
+			return inf
 
 		# Check if intersection is within circle radius
-		intersection = plane_collision.position
+		intersection = ray.origin + ray.direction * t
 		distance = magnitude(intersection - self.position)
 
 		if distance > self.radius:
-			return None
+			return inf
+
+		return t
+
+	def ray_distances(
+		self, origin: NDArray[np.float64], directions: NDArray[np.float64]
+	) -> NDArray[np.float64]:
+		"""Calculate how far along many rays from one origin they collide with this object."""
+		t = self._plane.ray_distances(origin, directions)
 
-		return RayCollision(self, ray, intersection)
+		# Check if intersections are within circle radius
+		hits = np.flatnonzero(t != inf)
+		intersections = origin + directions[hits] * t[hits, np.newaxis]
+		distances = np.linalg.norm(intersections - self.position, axis=1)
+		t[hits[distances > self.radius]] = inf
+		return t
+
+	def bounding_sphere(self) -> tuple[NDArray[np.float64], float]:
+		"""Return the center and radius of a sphere containing the object."""
+		return self.position, self.radius
 
 
 class Polygon(Object):
@@ -116,10 +167,20 @@ class Polygon(Object):
 	X_AXIS_SHIFT = 0.01
 	"To make sure no flattened relative vertices lie on the x-axis."
 
+	CONTAINS_CHUNK_SIZE = 16384
+	"Most pairs of points and edges to test at once, to bound the size of temporary arrays."
+
 	_vertices: list[NDArray[np.float64]]
 	_plane: Plane
 	_plane_dominant_coord: int
-	_flattened_vertices: list[NDArray[np.float64]]
+	_flattened_axes: list[int]
+	_flattened_vertices: NDArray[np.float64]
+	_edge_starts: NDArray[np.float64]
+	_edge_ends: NDArray[np.float64]
+	_bounding_min: NDArray[np.float64]
+	_bounding_max: NDArray[np.float64]
+	_bounding_center: NDArray[np.float64]
+	_bounding_radius: float
 
 	def __init__(self, vertices: list[NDArray[np.float64]]) -> None:
 		"""Initialize an instance of Polygon."""
@@ -140,63 +201,149 @@ class Polygon(Object):
 		self._plane_dominant_coord: int = np.where(
 			np.abs(_normal) == np.max(np.abs(_normal)),
 		)[0][0]
-		self._flattened_vertices = [
-			np.delete(v, self._plane_dominant_coord) for v in self._vertices
+		self._flattened_axes = [
+			axis for axis in range(3) if axis != self._plane_dominant_coord
+		]
+		self._flattened_vertices = np.array(self._vertices, dtype=np.float64)[
+			:, self._flattened_axes
 		]
 
+		# Precompute the edges and bounding rectangle of the flattened polygon
+		self._edge_starts = self._flattened_vertices
+		self._edge_ends = np.roll(self._flattened_vertices, -1, axis=0)
+		self._bounding_min = np.min(self._flattened_vertices, axis=0)
+		self._bounding_max = np.max(self._flattened_vertices, axis=0)
+
+		# Precompute a bounding sphere of the polygon in 3D
+		self._bounding_center = np.mean(self._vertices, axis=0)
+		self._bounding_radius = float(
+			np.max(np.linalg.norm(self._vertices - self._bounding_center, axis=1))
+		)
+
 	def normal(self, point: NDArray[np.float64] | None = None) -> NDArray[np.float64]:
 		"""Return the "up" direction, which is the same for every point."""
 		return self._plane.normal(point)
 
-	def ray_intersection(self, ray: Ray) -> RayCollision | None:
-		"""Calculate whether the given ray collides with this object."""
+	def ray_distance(self, ray: Ray, t_max: float = inf) -> float:
+		"""Calculate how far along the ray it collides with this object, if closer than `t_max`."""
 		# See if ray intersects with plane
-		plane_collision = self._plane.ray_intersection(ray)
-		if plane_collision is None:
-			return None
-		intersection = plane_collision.position
+		t = self._plane.ray_distance(ray, t_max)
+		if t == inf:
+			return inf
+		intersection = ray.origin + ray.direction * t
 
 		# All vertices are pre-flattened in __init__()
+		flattened_intersection = intersection[self._flattened_axes]
 
-		# Move all flattened vertices so the intersection is at the origin
-		flattened_intersection = np.delete(intersection, self._plane_dominant_coord)
-		vertices = [v - flattened_intersection for v in self._flattened_vertices]
-
-		# Make sure no vertices lie on the x-axis
-		for vertex in vertices:
-			if vertex[1] == 0:
-				vertex[1] += Polygon.X_AXIS_SHIFT
+		# Points outside the bounding rectangle cannot be inside the polygon
+		if np.any(flattened_intersection < self._bounding_min) or np.any(
+			flattened_intersection > self._bounding_max
+		):
+			return inf
 
 		# Calculate how many times polygon edges cross the x-axis
-		num_crossings = 0
-		for vertex, next_vertex in closed_pairwise(vertices):
-			below_x_axis = vertex[1] < 0
-			next_below_x_axis = next_vertex[1] < 0
-
-			# If the edge crosses the x axis...
-			if below_x_axis != next_below_x_axis:
-				right_of_y_axis = vertex[0] > 0
-				next_right_of_y_axis = next_vertex[0] > 0
-
-				if right_of_y_axis and next_right_of_y_axis:
-					# This edge crosses
-					num_crossings += 1
-				elif right_of_y_axis or next_right_of_y_axis:
-					# The edge might cross
-					# Compute intersection with the axis
-					vertex_dif = next_vertex - vertex
-					cross = vertex[0] - vertex[1] * vertex_dif[0] / vertex_dif[1]
-
-					if cross > 0:
-						# The edge crosses
-						num_crossings += 1
+		num_crossings = kernels.polygon_crossings(
+			self._edge_starts,
+			self._edge_ends,
+			flattened_intersection,
+			Polygon.X_AXIS_SHIFT,
+		)
 
 		# Even number of crossings -> outside polygon -> no collision
 		if num_crossings % 2 == 0:
-			return None
+			return inf
 
 		# Odd number of crossings -> inside polygon -> yes collision
-		return RayCollision(self, ray, intersection)
+		return t
+
+	def ray_distances(
+		self, origin: NDArray[np.float64], directions: NDArray[np.float64]
+	) -> NDArray[np.float64]:
+		"""Calculate how far along many rays from one origin they collide with this object."""
+		t = self._plane.ray_distances(origin, directions)
+
+		# Check if the flattened intersections are within the polygon
+		hits = np.flatnonzero(t != inf)
+		intersections = origin + directions[hits] * t[hits, np.newaxis]
+		flattened_intersections = intersections[:, self._flattened_axes]
+		t[hits[~self._contains(flattened_intersections)]] = inf
+		return t
+
+	def _contains(self, flattened_points: NDArray[np.float64]) -> NDArray[np.bool_]:
+		"""Return whether each flattened point is inside the flattened polygon."""
+		inside = np.all(
+			(flattened_points >= self._bounding_min)
+			& (flattened_points <= self._bounding_max),
+			axis=1,
+		)
+		points = flattened_points[inside, np.newaxis]
+
+		# Test the points in chunks, so the arrays of every point and edge stay small
+		chunk_points = max(1, Polygon.CONTAINS_CHUNK_SIZE // len(self._edge_starts))
+		inside[inside] = np.concatenate(
+			[
+				self._contains_chunk(points[i : i + chunk_points])
+				for i in range(0, len(points), chunk_points)
+			]
+			or [np.zeros(0, dtype=np.bool_)]
+		)
+		return inside
+
+	def _contains_chunk(self, points: NDArray[np.float64]) -> NDArray[np.bool_]:
+		"""Return whether each flattened point, with `shape=(n, 1, 2)`, is inside the flattened polygon, without checking bounds."""
+		# Same as the polygon_crossings kernels, for every point and edge at once
+		starts = self._edge_starts - points
+		ends = self._edge_ends - points
+		starts[starts[:, :, 1] == 0, 1] = Polygon.X_AXIS_SHIFT
+		ends[ends[:, :, 1] == 0, 1] = Polygon.X_AXIS_SHIFT
+
+		right_of_y_axis = starts[:, :, 0] > 0
+		next_right_of_y_axis = ends[:, :, 0] > 0
+		differences = ends - starts
+		with np.errstate(divide="ignore", invalid="ignore"):
+			cross = (
+				starts[:, :, 0]
+				- starts[:, :, 1] * differences[:, :, 0] / differences[:, :, 1]
+			)
+		crosses = ((starts[:, :, 1] < 0) != (ends[:, :, 1] < 0)) & (
+			(right_of_y_axis & next_right_of_y_axis)
+			| ((right_of_y_axis | next_right_of_y_axis) & (cross > 0))
+		)
+
+		return np.count_nonzero(crosses, axis=1) % 2 == 1
+
+	def bounding_sphere(self) -> tuple[NDArray[np.float64], float]:
+		"""Return the center and radius of a sphere containing the object."""
+		return self._bounding_center, self._bounding_radius
+
+	def triangulate(self) -> list["Triangle"]:
+		"""
+		Split the polygon into triangles with the same material, using ear clipping.
+
+		Supports convex and simple concave polygons.
+		Raises a ValueError if no triangulation can be found,
+		which can happen if the polygon intersects itself.
+		"""
+		ears = _ear_clip(self._flattened_vertices)
+		if ears is None:
+			raise ValueError("Polygon could not be triangulated")
+
+		triangles = []
+		for ear in ears:
+			vertices = [self._vertices[i] for i in ear]
+			triangle = Triangle(vertices)
+
+			# Keep facing the same way as the polygon
+			if np.dot(triangle.normal(), self.normal()) < 0:
+				triangle = Triangle(vertices[::-1])
+
+			# Copy the name and material
+			for attribute in Object.__annotations__:
+				setattr(triangle, attribute, getattr(self, attribute, None))
+
+			triangles.append(triangle)
+
+		return triangles
 
 
 class Triangle(Polygon):
@@ -225,49 +372,45 @@ class Triangle(Polygon):
 
 		self._flattened_area = Triangle.area(self._flattened_vertices)
 
-	def ray_intersection(self, ray: Ray) -> RayCollision | None:
-		"""Calculate whether the given ray collides with this object."""
+	def ray_distance(self, ray: Ray, t_max: float = inf) -> float:
+		"""Calculate how far along the ray it collides with this object, if closer than `t_max`."""
 		# See if ray intersects with plane
-		plane_collision = self._plane.ray_intersection(ray)
-		if plane_collision is None:
-			return None
-		intersection = plane_collision.position
+		t = self._plane.ray_distance(ray, t_max)
+		if t == inf:
+			return inf
+		intersection = ray.origin + ray.direction * t
 
 		# All vertices are pre-flattened in Polygon.__init__()
-		flattened_intersection = np.delete(intersection, self._plane_dominant_coord)
+		flattened_intersection = intersection[self._flattened_axes]
 
 		# Calculate areas
-		area_1 = Triangle.area(
-			[
-				self._flattened_vertices[0],
-				self._flattened_vertices[1],
-				flattened_intersection,
-			]
-		)
-		area_2 = Triangle.area(
-			[
-				self._flattened_vertices[0],
-				self._flattened_vertices[2],
-				flattened_intersection,
-			]
-		)
-		area_3 = Triangle.area(
-			[
-				self._flattened_vertices[1],
-				self._flattened_vertices[2],
-				flattened_intersection,
-			]
-		)
+		vertex_1, vertex_2, vertex_3 = self._flattened_vertices
+		area_1 = kernels.triangle_area(vertex_1, vertex_2, flattened_intersection)
+		area_2 = kernels.triangle_area(vertex_1, vertex_3, flattened_intersection)
+		area_3 = kernels.triangle_area(vertex_2, vertex_3, flattened_intersection)
 
 		# If point is inside triangle, then the area of all sub-triangles
 		# will add up to the total area
 		if abs(area_1 + area_2 + area_3 - self._flattened_area) > Triangle.TOLERANCE:
-			return None
+			return inf
 
-		return RayCollision(self, ray, intersection)
+		return t
+
+	def _contains(self, flattened_points: NDArray[np.float64]) -> NDArray[np.bool_]:
+		"""Return whether each flattened point is inside the flattened triangle."""
+		vertex_1, vertex_2, vertex_3 = self._flattened_vertices
+		areas = [
+			_triangle_areas(vertex_1, vertex_2, flattened_points),
+			_triangle_areas(vertex_1, vertex_3, flattened_points),
+			_triangle_areas(vertex_2, vertex_3, flattened_points),
+		]
+		return (
+			np.abs(areas[0] + areas[1] + areas[2] - self._flattened_area)
+			<= Triangle.TOLERANCE
+		)
 
 	@staticmethod
-	def area(vertices: list[NDArray[np.float64]]) -> float:
+	def area(vertices: list[NDArray[np.float64]] | NDArray[np.float64]) -> float:
 		"""Given the three vertices, return the area of the enclosed triangle."""
 		if len(vertices) != Triangle.REQUIRED_VERTICES:
 			raise ValueError(
@@ -275,12 +418,7 @@ class Triangle(Polygon):
 				{Triangle.REQUIRED_VERTICES} vertices"
 			)
 
-		area: float = (
-			vertices[0][0] * (vertices[1][1] - vertices[2][1])
-			+ vertices[1][0] * (vertices[2][1] - vertices[0][1])
-			+ vertices[2][0] * (vertices[0][1] - vertices[1][1])
-		) / 2.0
-		return abs(area)
+		return kernels.triangle_area(vertices[0], vertices[1], vertices[2])
 
 
 class Sphere(Object):
@@ -299,32 +437,128 @@ class Sphere(Object):
 		"""Return the "up" direction from the point on the object."""
 		return normalized(point - self.position)
 
-	def ray_intersection(self, ray: Ray) -> RayCollision | None:
-		"""Calculate whether the given ray collides with this object."""
-		relative_position = self.position - ray.origin
+	def ray_distance(self, ray: Ray, t_max: float = inf) -> float:
+		"""Calculate how far along the ray it collides with this object, if closer than `t_max`."""
+		t = kernels.sphere_intersection(
+			self.position, self.radius, ray.origin, ray.direction
+		)
+		return t if t < t_max else inf
+
+	def ray_distances(
+		self, origin: NDArray[np.float64], directions: NDArray[np.float64]
+	) -> NDArray[np.float64]:
+		"""Calculate how far along many rays from one origin they collide with this object."""
+		# Same as the sphere_intersection kernels, for every ray at once
+		relative_position = self.position - origin
 		distance_sqr = np.dot(relative_position, relative_position)
-		distance = distance_sqr**0.5
-
-		origin_outside = distance >= self.radius
-
-		closest_approach = np.dot(ray.direction, relative_position)
-
-		if closest_approach < 0 and origin_outside:
-			return None
+		origin_outside = distance_sqr**0.5 >= self.radius
 
+		closest_approach = directions @ relative_position
 		closest_approach_dist_to_surface_sqr = (
 			self.radius**2 - distance_sqr + closest_approach**2
 		)
+		misses = closest_approach_dist_to_surface_sqr < 0
+		if origin_outside:
+			misses |= closest_approach < 0
 
-		if closest_approach_dist_to_surface_sqr < 0:
-			return None
-
-		closest_approach_dist_to_surface = closest_approach_dist_to_surface_sqr**0.5
-
+		with np.errstate(invalid="ignore"):
+			closest_approach_dist_to_surface = closest_approach_dist_to_surface_sqr**0.5
 		t = (
-			(closest_approach - closest_approach_dist_to_surface)
+			closest_approach - closest_approach_dist_to_surface
 			if origin_outside
-			else (closest_approach + closest_approach_dist_to_surface)
+			else closest_approach + closest_approach_dist_to_surface
 		)
+		return np.where(misses, inf, t)
 
-		return RayCollision(self, ray, ray.origin + ray.direction * t)
+	def bounding_sphere(self) -> tuple[NDArray[np.float64], float]:
+		"""Return the center and radius of a sphere containing the object."""
+		return self.position, self.radius
+
+
+def _ear_clip(points: NDArray[np.float64]) -> list[tuple[int, int, int]] | None:
+	"""
+	Return the indices of triangles that cover the 2D polygon, or nothing if it runs out of ears.
+
+	Collinear vertices are dropped instead of becoming empty triangles.
+	"""
+
+	def cross(i: int, j: int, k: int) -> float:
+		"""Return twice the signed area of the triangle, positive if counterclockwise."""
+		return _cross_2d(points[j] - points[i], points[k] - points[i])
+
+	# Walk the vertices counterclockwise
+	signed_area = sum(cross(0, i, i + 1) for i in range(1, len(points) - 1))
+	remaining = list(range(len(points)))
+	if signed_area < 0:
+		remaining.reverse()
+
+	triangles = []
+	while len(remaining) > Triangle.REQUIRED_VERTICES:
+		for k, i in enumerate(remaining):
+			previous = remaining[k - 1]
+			following = remaining[(k + 1) % len(remaining)]
+
+			# An ear is a convex corner with no other vertices inside
+			if cross(previous, i, following) <= 0:
+				continue
+			if any(
+				_is_in_triangle(
+					points[j], points[previous], points[i], points[following]
+				)
+				for j in remaining
+				if j not in (previous, i, following)
+			):
+				continue
+
+			triangles.append((previous, i, following))
+			remaining.pop(k)
+			break
+		else:
+			# Without ears, the polygon is either degenerate or self-intersecting
+			for k, i in enumerate(remaining):
+				previous = remaining[k - 1]
+				following = remaining[(k + 1) % len(remaining)]
+				if cross(previous, i, following) == 0:
+					remaining.pop(k)
+					break
+			else:
+				return None
+
+	if cross(*remaining) > 0:
+		triangles.append((remaining[0], remaining[1], remaining[2]))
+	return triangles
+
+
+def _is_in_triangle(
+	point: NDArray[np.float64],
+	vertex_1: NDArray[np.float64],
+	vertex_2: NDArray[np.float64],
+	vertex_3: NDArray[np.float64],
+) -> bool:
+	"""Return whether the 2D point is inside or on the edge of the counterclockwise triangle."""
+	return (
+		_cross_2d(vertex_2 - vertex_1, point - vertex_1) >= 0
+		and _cross_2d(vertex_3 - vertex_2, point - vertex_2) >= 0
+		and _cross_2d(vertex_1 - vertex_3, point - vertex_3) >= 0
+	)
+
+
+def _triangle_areas(
+	vertex_1: NDArray[np.float64],
+	vertex_2: NDArray[np.float64],
+	points: NDArray[np.float64],
+) -> NDArray[np.float64]:
+	"""Return the areas of the triangles between two flattened vertices and each flattened point."""
+	return np.abs(
+		(
+			vertex_1[0] * (vertex_2[1] - points[:, 1])
+			+ vertex_2[0] * (points[:, 1] - vertex_1[1])
+			+ points[:, 0] * (vertex_1[1] - vertex_2[1])
+		)
+		/ 2.0
+	)
+
+
+def _cross_2d(vector_1: NDArray[np.float64], vector_2: NDArray[np.float64]) -> float:
+	"""Return the z-component of the cross product of two 2D vectors."""
+	return float(vector_1[0] * vector_2[1] - vector_1[1] * vector_2[0])
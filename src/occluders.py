@@ -0,0 +1,134 @@
+"""
+Indexes which objects can cast shadows from each directional light.
+
+Every shadow ray toward a directional light is parallel, so whether an object can
+block one only depends on where the ray starts, as seen from the light.
+Projecting every object's bounding sphere onto a plane facing the light, and
+bucketing them into a grid on that plane, means each shadow ray only has to be
+tested against the objects in the grid cell it starts in.
+"""
+
+from math import ceil, floor, sqrt
+
+import numpy as np
+from numpy.typing import NDArray
+
+from lights import DirectionalLight, Light
+from objects import Object
+from vector import normalized
+
+CELLS_PER_OBJECT = 4
+"Number of grid cells to aim for per bounded object"
+
+MAX_GRID_RESOLUTION = 64
+"Maximum number of grid cells along each axis"
+
+BOUNDS_PADDING = 1e-9
+"How much to grow projected bounds (relative to the grid size), so rounding cannot drop occluders"
+
+
+class OccluderGrid:
+	"""
+	Defines a grid on a plane facing a directional light, listing the objects that overlap each cell.
+
+	Objects without a bounding sphere (such as planes) are listed in every cell,
+	and are the only objects that can block rays starting outside the grid.
+	"""
+
+	direction: NDArray[np.float64]
+	"The direction toward the light"
+	axes: NDArray[np.float64]
+	"Two directions spanning the plane facing the light, with `shape=(2, 3)`"
+	minimum: NDArray[np.float64]
+	"The corner of the grid on the plane"
+	cell_size: NDArray[np.float64]
+	resolution: tuple[int, int]
+	cells: list[list[int]]
+	"Indices of the objects overlapping each cell, in scene order and row-major cell order"
+	unbounded: list[int]
+	"Indices of the objects without a bounding sphere"
+
+	def __init__(self, direction: NDArray[np.float64], objects: list[Object]) -> None:
+		"""Initialize an instance of OccluderGrid, indexing the objects."""
+		self.direction = direction
+		self.axes = _perpendicular_axes(direction)
+
+		bounded = []
+		self.unbounded = []
+		for i, obj in enumerate(objects):
+			bounding_sphere = obj.bounding_sphere()
+			if bounding_sphere is None:
+				self.unbounded.append(i)
+			else:
+				bounded.append((i, *bounding_sphere))
+
+		# Project the bounding spheres onto the plane, as squares
+		centers = np.array([center for _, center, _ in bounded]).reshape((-1, 3))
+		radii = np.array([radius for _, _, radius in bounded])
+		projected_centers = centers @ self.axes.T
+		minimums = projected_centers - radii[:, np.newaxis]
+		maximums = projected_centers + radii[:, np.newaxis]
+
+		# Fit the grid around every square, with roughly square cells
+		minimum = np.min(minimums, axis=0) if bounded else np.zeros(2)
+		size = np.max(maximums, axis=0) - minimum if bounded else np.ones(2)
+		size = np.maximum(size, 1e-12)
+		padding = BOUNDS_PADDING * float(np.max(size))
+		self.minimum = minimum - padding
+		size += 2 * padding
+		cell_length = sqrt(
+			float(size[0] * size[1]) / (CELLS_PER_OBJECT * max(1, len(bounded)))
+		)
+		self.resolution = (
+			min(MAX_GRID_RESOLUTION, max(1, ceil(size[0] / cell_length))),
+			min(MAX_GRID_RESOLUTION, max(1, ceil(size[1] / cell_length))),
+		)
+		self.cell_size = size / self.resolution
+
+		# List each object in every cell its square overlaps
+		self.cells = [[] for _ in range(self.resolution[0] * self.resolution[1])]
+		first_cells = np.floor((minimums - padding - self.minimum) / self.cell_size)
+		last_cells = np.floor((maximums + padding - self.minimum) / self.cell_size)
+		for (i, _, _), first, last in zip(
+			bounded, first_cells, last_cells, strict=True
+		):
+			x_start, y_start = np.maximum(first, 0).astype(int)
+			x_end = min(int(last[0]), self.resolution[0] - 1)
+			y_end = min(int(last[1]), self.resolution[1] - 1)
+			for y in range(y_start, y_end + 1):
+				for x in range(x_start, x_end + 1):
+					self.cells[y * self.resolution[0] + x].append(i)
+
+		# Unbounded objects can be anywhere
+		for cell in self.cells:
+			cell.extend(self.unbounded)
+			cell.sort()
+
+	def candidates(self, point: NDArray[np.float64]) -> list[int]:
+		"""Return the indices of the objects that could block a ray from the point toward the light."""
+		x = floor((float(self.axes[0] @ point) - self.minimum[0]) / self.cell_size[0])
+		y = floor((float(self.axes[1] @ point) - self.minimum[1]) / self.cell_size[1])
+		if 0 <= x < self.resolution[0] and 0 <= y < self.resolution[1]:
+			return self.cells[y * self.resolution[0] + x]
+		return self.unbounded
+
+
+def get_occluder_grids(
+	lights: list[Light], objects: list[Object]
+) -> dict[int, OccluderGrid]:
+	"""Return an occluder grid for each directional light, by the index of the light."""
+	return {
+		i: OccluderGrid(light.direction, objects)
+		for i, light in enumerate(lights)
+		if isinstance(light, DirectionalLight)
+	}
+
+
+def _perpendicular_axes(direction: NDArray[np.float64]) -> NDArray[np.float64]:
+	"""Return two perpendicular directions that are both perpendicular to the direction."""
+	# Start from whichever axis is least aligned with the direction
+	helper = np.zeros(3)
+	helper[np.argmin(np.abs(direction))] = 1
+	first = normalized(np.cross(direction, helper))
+	second = np.cross(direction, first)
+	return np.array([first, normalized(second)])
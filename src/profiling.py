@@ -0,0 +1,97 @@
+"""
+Profiles renders, including the work done inside worker processes.
+
+The main process profiles itself, and each worker process profiles itself until it
+exits, saving its profile to a shared directory. The profiles are then merged into
+one `pstats` file, which can be explored with `python -m pstats <file>` or any
+viewer that reads `cProfile` output.
+"""
+
+from collections.abc import Iterator
+from contextlib import contextmanager
+from cProfile import Profile
+from multiprocessing.util import Finalize
+from os import getpid
+from pathlib import Path
+from pstats import Stats
+from tempfile import TemporaryDirectory
+
+PROFILE_EXTENSION = ".prof"
+
+REPORT_MODULES = ("objects", "shader", "scene", "ray_tracer")
+"Modules whose hottest functions are reported"
+
+REPORT_FUNCTIONS = 5
+"Number of functions reported per module"
+
+SOURCE_DIRECTORY = Path(__file__).resolve().parent
+
+_main_profiler: Profile | None = None
+"The profiler of the main process, while profiling"
+
+
+@contextmanager
+def profile(profile_file_path: str) -> Iterator[str]:
+	"""
+	Profile the main process, and yield a directory for worker processes to save their profiles to.
+
+	Afterwards, every profile is merged and saved to the profile file path.
+	"""
+	global _main_profiler
+	with TemporaryDirectory() as directory:
+		_main_profiler = Profile()
+		_main_profiler.enable()
+		try:
+			yield directory
+		finally:
+			_main_profiler.disable()
+			stats = Stats(_main_profiler)
+			_main_profiler = None
+
+		for worker_profile_path in Path(directory).glob(f"*{PROFILE_EXTENSION}"):
+			stats.add(str(worker_profile_path))
+		stats.dump_stats(profile_file_path)
+
+
+def start_worker_profile(directory: str) -> None:
+	"""Profile this worker process, saving its profile to the directory when it exits."""
+	# Forked workers inherit the profiler of the main process, which is still enabled
+	if _main_profiler is not None:
+		_main_profiler.disable()
+
+	profiler = Profile()
+	Finalize(
+		None,
+		profiler.dump_stats,
+		(str(Path(directory) / f"{getpid()}{PROFILE_EXTENSION}"),),
+		exitpriority=0,
+	)
+	profiler.enable()
+
+
+def hot_functions(profile_file_path: str) -> str:
+	"""Return a summary of the functions that took the most time of their own, in each module."""
+	stats = Stats(profile_file_path)
+	# The stubs of pstats leave out the documented `stats` and `total_tt` attributes,
+	# and `get_stats_profile` merges functions of the same name across modules
+	function_stats: dict[tuple[str, int, str], tuple[int, int, float, float, dict]]
+	function_stats = stats.stats  # ty: ignore[unresolved-attribute]
+	total_time: float = stats.total_tt  # ty: ignore[unresolved-attribute]
+	module_functions: dict[str, list[tuple[float, int, int, str]]] = {
+		module: [] for module in REPORT_MODULES
+	}
+	for (file, line, name), (_, calls, own_time, _, _) in function_stats.items():
+		path = Path(file).resolve()
+		if path.parent == SOURCE_DIRECTORY and path.stem in module_functions:
+			module_functions[path.stem].append((own_time, calls, line, name))
+
+	lines = [
+		f"Hot functions by own time (in all processes, {total_time:.3f}s in total):"
+	]
+	for module, functions in module_functions.items():
+		lines.append(f"\t{module}")
+		for own_time, calls, line, name in sorted(functions, reverse=True)[
+			:REPORT_FUNCTIONS
+		]:
+			lines.append(f"\t\t{own_time:8.3f}s {calls:10} calls  {name} (line {line})")
+	return "\n".join(lines)
@@ -9,6 +9,8 @@ from vector import magnitude
 class Ray:
 	"""Represents a semi-infinite line."""
 
+	__slots__ = ("direction", "origin")
+
 	origin: NDArray[np.float64]
 	direction: NDArray[np.float64]
 
@@ -23,6 +25,8 @@ class Ray:
 class RayCollision:
 	"""Contains information about the collision of a ray with an object."""
 
+	__slots__ = ("distance", "obj", "position", "ray")
+
 	# obj: Object # would cause a circular import
 	ray: Ray
 	position: NDArray[np.float64]
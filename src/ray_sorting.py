@@ -0,0 +1,45 @@
+"""Reorders batches of rays so that rays traced one after another are coherent."""
+
+import numpy as np
+from numpy.typing import NDArray
+
+from ray import Ray
+
+MORTON_BITS = 10
+"Number of bits per axis used to quantize ray origins"
+
+
+def coherence_order(rays: list[Ray]) -> NDArray[np.intp]:
+	"""
+	Return the order in which to trace the rays so that similar rays are adjacent.
+
+	Rays are sorted by the octant of their direction first,
+	then by the [Morton code](https://en.wikipedia.org/wiki/Z-order_curve)
+	of their origin within the bounding box of all the origins.
+	"""
+	origins = np.array([ray.origin for ray in rays])
+	directions = np.array([ray.direction for ray in rays])
+
+	# Quantize origins to a grid spanning the batch
+	lowest = origins.min(axis=0)
+	span = origins.max(axis=0) - lowest
+	span[span == 0] = 1
+	cells = ((origins - lowest) / span * (2**MORTON_BITS - 1)).astype(np.uint64)
+
+	morton = (
+		_spread_bits(cells[:, 0]) << np.uint64(2)
+		| _spread_bits(cells[:, 1]) << np.uint64(1)
+		| _spread_bits(cells[:, 2])
+	)
+	octant = (directions < 0).astype(np.uint64) @ np.array([4, 2, 1], dtype=np.uint64)
+
+	keys = octant << np.uint64(3 * MORTON_BITS) | morton
+	return np.argsort(keys, kind="stable")
+
+
+def _spread_bits(values: NDArray[np.uint64]) -> NDArray[np.uint64]:
+	"""Insert two zero bits between each of the lowest 10 bits of every value."""
+	values = (values | values << np.uint64(16)) & np.uint64(0x030000FF)
+	values = (values | values << np.uint64(8)) & np.uint64(0x0300F00F)
+	values = (values | values << np.uint64(4)) & np.uint64(0x030C30C3)
+	return (values | values << np.uint64(2)) & np.uint64(0x09249249)
@@ -1,20 +1,35 @@
 """Generates an image from a scene using [ray tracing](https://en.wikipedia.org/wiki/Ray_tracing_(graphics))."""
 
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import ExitStack, contextmanager
 from math import tan
-from multiprocessing import Pool, cpu_count
-from typing import TYPE_CHECKING
+from multiprocessing import cpu_count
+from multiprocessing.pool import Pool, ThreadPool
+from time import perf_counter
+from typing import Any, TextIO
 
 import numpy as np
 from numpy.typing import NDArray
-from tqdm import tqdm
 
-from ray import Ray
-from scene import Camera, Scene
-from shader import shade
+from kernels import use_kernels
+from lights import Light
+from objects import Object
+from profiling import start_worker_profile
+from ray import Ray, RayCollision
+from ray_sorting import coherence_order
+from scene import Camera, CountingScene, Scene
+from scheduling import get_pixel_costs, get_sample_rows, schedule_tiles
+from shader import max_light_contribution, shade
+from telemetry import (
+	Consumer,
+	Telemetry,
+	TileReport,
+	json_lines_consumer,
+	progress_bar_consumer,
+	worker_name,
+)
 from vector import normalized
-
-if TYPE_CHECKING:
-	from collections.abc import Iterable
+from visibility import AMBIGUOUS, MISSED, primary_visibility
 
 FADE_LIMIT = 0.01
 "Fading limit for reflections"
@@ -22,15 +37,125 @@ FADE_LIMIT = 0.01
 COLLISION_NORMAL_OFFSET = 0.01
 "Offsets collision positions from the surfaces of objects to avoid incorrect shadows"
 
+LIGHT_CONTRIBUTION_LIMIT = 0.001
+"Lights that cannot contribute more than this are not shadow-tested or shaded"
+
+BACKENDS = ("process", "thread", "serial")
+"Names of the supported parallel backends"
+
+_worker_scene: Scene | None = None
+"The scene of this worker process, if it was given the scene when it started"
+
 
 def ray_trace(
-	scene: Scene, width: int, height: int, reflection_limit: int, progress_bar: bool
+	scene: Scene,
+	width: int,
+	height: int,
+	reflection_limit: int,
+	progress_bar: bool,
+	ray_reordering: bool = False,
+	kernels: str = "numpy",
+	backend: str = "process",
+	workers: int | None = None,
+	tile_size: tuple[int, int] | None = None,
+	batch_size: int | None = None,
+	rasterize: bool = False,
+	telemetry_stream: TextIO | None = None,
+	profile_directory: str | None = None,
+	cost_scheduling: bool = False,
 ) -> NDArray[np.float64]:
 	"""
 	Ray traces the given scene.
 
+	The `kernels` are used for the hot numerical loops (see `kernels.KERNELS`),
+	and the work is spread across `workers` (default: one per CPU)
+	of the parallel `backend` (see `BACKENDS`).
+
+	The screen is split into tiles of `tile_size=(width, height)`, which are the
+	units of work handed to workers. Within each tile, `batch_size` primary rays are
+	traced together one generation of bounces at a time; a batch size of 1 traces
+	each pixel recursively instead.
+
+	If `ray_reordering` is enabled, the secondary and shadow rays of each generation
+	are sorted for coherence before being cast. By default, this traces each row as
+	one batch.
+
+	If `rasterize` is enabled, the object each primary ray hits is found for all
+	pixels at once (see `visibility.primary_visibility`), so primary rays only need
+	to be tested against that one object.
+
+	If `cost_scheduling` is enabled, every few pixels are traced first to estimate
+	the cost of each tile, and tiles are handed out most expensive first, split
+	when they are too large a share of the work left (see `scheduling`).
+
+	Progress is reported once per tile (see `telemetry.Telemetry`) to the progress
+	bar, and as JSON lines to the `telemetry_stream`, if given.
+
+	If a `profile_directory` is given, each worker process profiles itself and saves
+	its profile there when it exits (see `profiling.profile`).
+
 	Returns a 3-dimensional array of pixel colors with `shape=(height, width, 3)`.
 	"""
+	if backend not in BACKENDS:
+		raise ValueError(f"Backend must be one of {BACKENDS}, not {backend}")
+	if workers is not None and workers <= 0:
+		raise ValueError(f"Workers must be positive, not {workers}")
+
+	# Prepare the kernels before forking, so workers inherit them ready to use
+	use_kernels(kernels)
+
+	workers = 1 if backend == "serial" else workers or cpu_count()
+	with _open_imap(backend, kernels, workers, profile_directory, scene) as imap:
+		# Handing out tiles in a different order cannot help a single worker
+		pixel_costs = None
+		if cost_scheduling and workers > 1:
+			pixel_costs = _get_pixel_costs(scene, width, height, reflection_limit, imap)
+
+		tiles, tuple_inputs = _get_tile_inputs(
+			scene,
+			width,
+			height,
+			reflection_limit,
+			ray_reordering,
+			tile_size,
+			batch_size,
+			rasterize,
+			pixel_costs,
+			workers,
+		)
+		outputs = imap(_ray_trace_tile_tuple, tuple_inputs)
+		return _fill_screen(
+			tiles, outputs, width, height, progress_bar, telemetry_stream
+		)
+
+
+def _get_tile_inputs(
+	scene: Scene,
+	width: int,
+	height: int,
+	reflection_limit: int,
+	ray_reordering: bool,
+	tile_size: tuple[int, int] | None,
+	batch_size: int | None,
+	rasterize: bool,
+	pixel_costs: NDArray[np.float64] | None = None,
+	workers: int = 1,
+) -> tuple[list[tuple[int, int, int, int]], list[tuple]]:
+	"""
+	Split the screen into tiles, and return them with the inputs of `_ray_trace_tile_tuple`.
+
+	If the estimated `pixel_costs` are given, the tiles are scheduled for the
+	`workers` with `scheduling.schedule_tiles`.
+	"""
+	if tile_size is None:
+		tile_size = (width, 1) if ray_reordering else (1, 1)
+	if batch_size is None:
+		batch_size = tile_size[0] * tile_size[1] if ray_reordering else 1
+	if min(tile_size) <= 0:
+		raise ValueError(f"Tile size must be positive, not {tile_size}")
+	if batch_size <= 0:
+		raise ValueError(f"Batch size must be positive, not {batch_size}")
+
 	# Save time by pre-calculating constant values
 	viewport_size = np.array([width, height])
 	window_size = _get_window_size(
@@ -38,75 +163,471 @@ def ray_trace(
 	)
 	window_to_viewport_size_ratio = window_size / viewport_size
 	half_window_size = window_size / 2
+	bounding_spheres = _get_bounding_spheres(scene.objects)
+
+	# Find the first hit of every primary ray up front
+	object_indices = None
+	if rasterize:
+		object_indices, _ = primary_visibility(
+			scene.objects,
+			scene.camera.position,
+			_get_pixel_directions(
+				scene, width, height, window_to_viewport_size_ratio, half_window_size
+			),
+		)
+		object_indices = object_indices.reshape((height, width))
 
-	# Set up multiprocessing pool and inputs
+	tiles = _get_tiles(width, height, *tile_size)
+	if pixel_costs is not None:
+		tiles = schedule_tiles(tiles, pixel_costs, workers)
 	tuple_inputs = [
 		(
 			scene,
 			reflection_limit,
-			x,
-			y,
+			tile,
 			window_to_viewport_size_ratio,
 			half_window_size,
+			batch_size,
+			ray_reordering,
+			bounding_spheres,
+			_get_tile_slice(object_indices, tile)
+			if object_indices is not None
+			else None,
 		)
-		for y in range(height)
-		for x in range(width)
+		for tile in tiles
 	]
-	outputs = []
+	return tiles, tuple_inputs
 
-	with Pool(cpu_count()) as pool:
-		# Start a process for ray-tracing each pixel
-		processes: Iterable = pool.imap(_ray_trace_pixel_tuple, tuple_inputs)
-		if progress_bar:
-			processes = tqdm(processes, total=len(tuple_inputs))
 
-		# Iterate and store the output to allow it to compute
-		outputs = list(processes)
+def _get_pixel_costs(
+	scene: Scene,
+	width: int,
+	height: int,
+	reflection_limit: int,
+	imap: Callable[[Callable[[Any], Any], list], Iterator],
+) -> NDArray[np.float64]:
+	"""Estimate the cost of every pixel by counting the rays of a sample of pixels, with `shape=(height, width)`."""
+	viewport_size = np.array([width, height])
+	window_size = _get_window_size(
+		viewport_size, scene.camera.focal_length, scene.camera.field_of_view
+	)
+	window_to_viewport_size_ratio = window_size / viewport_size
+	half_window_size = window_size / 2
+	bounding_spheres = _get_bounding_spheres(scene.objects)
+
+	tuple_inputs = [
+		(
+			scene,
+			reflection_limit,
+			pixels,
+			window_to_viewport_size_ratio,
+			half_window_size,
+			bounding_spheres,
+		)
+		for pixels in get_sample_rows(width, height)
+	]
+	sample_costs = list(imap(_count_rays_tuple, tuple_inputs))
+	return get_pixel_costs(sample_costs, width, height)
+
 
-	# Shape outputs into a width*height screen
-	screen = np.array(outputs)
-	_, depth = screen.shape
-	screen.resize((height, width, depth))
+def _fill_screen(
+	tiles: list[tuple[int, int, int, int]],
+	outputs: Iterable[tuple[NDArray[np.float64], TileReport]],
+	width: int,
+	height: int,
+	progress_bar: bool,
+	telemetry_stream: TextIO | None,
+) -> NDArray[np.float64]:
+	"""Write the outputs of the tiles (in order) into the screen, reporting progress as they arrive."""
+	screen = np.zeros((height, width, 3))
+	with ExitStack() as stack:
+		consumers: list[Consumer] = []
+		if progress_bar:
+			consumers.append(stack.enter_context(progress_bar_consumer()))
+		if telemetry_stream is not None:
+			consumers.append(json_lines_consumer(telemetry_stream))
+
+		telemetry = Telemetry(consumers, len(tiles), width * height)
+		for (x, y, tile_width, tile_height), (colors, report) in zip(
+			tiles, outputs, strict=True
+		):
+			screen[y : y + tile_height, x : x + tile_width] = colors
+			telemetry.report(report)
+		telemetry.finish()
 
 	return screen
 
 
-def _ray_trace_pixel_tuple(
+def _get_tiles(
+	width: int, height: int, tile_width: int, tile_height: int
+) -> list[tuple[int, int, int, int]]:
+	"""Split the screen into `(x, y, width, height)` tiles, in row-major order."""
+	return [
+		(x, y, min(tile_width, width - x), min(tile_height, height - y))
+		for y in range(0, height, tile_height)
+		for x in range(0, width, tile_width)
+	]
+
+
+def _get_tile_slice(array: NDArray, tile: tuple[int, int, int, int]) -> NDArray:
+	"""Return the part of the screen-shaped array covered by the tile."""
+	x, y, width, height = tile
+	return array[y : y + height, x : x + width]
+
+
+def _imap(
+	function: Callable[[Any], Any],
+	inputs: list,
+	backend: str,
+	kernels: str,
+	workers: int,
+	profile_directory: str | None = None,
+) -> Iterator:
+	"""
+	Lazily apply the function to every input in order, using the given backend.
+
+	- `process` spreads inputs across a pool of processes,
+	which must each receive their own copy of the scene.
+	- `thread` spreads inputs across a pool of threads that share the scene.
+	This pays off on free-threaded Python and with kernels that release the GIL.
+	- `serial` runs everything in the calling thread, which is easiest to profile.
+	"""
+	if backend == "serial":
+		yield from map(function, inputs)
+		return
+
+	with _open_imap(backend, kernels, workers, profile_directory) as imap:
+		yield from imap(function, inputs)
+
+
+@contextmanager
+def _open_imap(
+	backend: str,
+	kernels: str,
+	workers: int,
+	profile_directory: str | None = None,
+	scene: Scene | None = None,
+) -> Iterator[Callable[[Callable[[Any], Any], list], Iterator]]:
+	"""
+	Yield a function like `_imap` that reuses the same workers for every call.
+
+	If given the `scene`, worker processes receive it once when they start, and it is
+	left out of the inputs sent to them (which must all start with the scene).
+	"""
+	if backend == "serial":
+		yield map
+		return
+
+	with _open_pool(backend, kernels, workers, profile_directory, scene) as pool:
+		if backend == "process" and scene is not None:
+
+			def imap(function: Callable[[Any], Any], inputs: list) -> Iterator:
+				"""Lazily apply the function to every input, without sending the scene."""
+				return pool.imap(
+					function, [(None, *tuple_input[1:]) for tuple_input in inputs]
+				)
+
+			yield imap
+		else:
+			yield pool.imap
+
+		# Let the workers exit on their own, so they save their profiles
+		if profile_directory is not None:
+			pool.close()
+			pool.join()
+
+
+def _open_pool(
+	backend: str,
+	kernels: str,
+	workers: int,
+	profile_directory: str | None = None,
+	scene: Scene | None = None,
+) -> Pool:
+	"""
+	Start a pool of the parallel backend, whose workers each prepare the kernels.
+
+	Worker processes also keep the `scene`, if given, and start profiling themselves
+	if given a `profile_directory`.
+	Worker threads share the scene, and are already seen by the profiler of the
+	main process.
+	"""
+	if backend == "process":
+		return Pool(workers, _initialize_worker, (kernels, profile_directory, scene))
+	return ThreadPool(workers, use_kernels, (kernels,))
+
+
+def _initialize_worker(
+	kernels: str, profile_directory: str | None, scene: Scene | None
+) -> None:
+	"""Prepare the kernels and scene of a worker process, and start profiling it if given a directory."""
+	global _worker_scene
+	use_kernels(kernels)
+	_worker_scene = scene
+	if profile_directory is not None:
+		start_worker_profile(profile_directory)
+
+
+def _ray_trace_tile_tuple(
 	tuple_input: tuple[
-		Scene,
+		Scene | None,
 		int,
+		tuple[int, int, int, int],
+		NDArray[np.float64],
+		NDArray[np.float64],
 		int,
+		bool,
+		tuple[NDArray[np.float64], NDArray[np.float64]],
+		NDArray[np.int32] | None,
+	],
+) -> tuple[NDArray[np.float64], TileReport]:
+	"""Unpacks the tuple input for _ray_trace_tile and returns the result, with a report of the work."""
+	start_time = perf_counter()
+	(
+		scene,
+		reflection_limit,
+		tile,
+		window_to_viewport_size_ratio,
+		half_window_size,
+		batch_size,
+		sort_rays,
+		bounding_spheres,
+		object_indices,
+	) = tuple_input
+	counting_scene = CountingScene(_get_worker_scene(scene))
+	colors = _ray_trace_tile(
+		counting_scene,
+		reflection_limit,
+		tile,
+		window_to_viewport_size_ratio,
+		half_window_size,
+		batch_size,
+		sort_rays,
+		bounding_spheres,
+		object_indices,
+	)
+	return colors, TileReport(
+		worker_name(),
+		colors.shape[0] * colors.shape[1],
+		counting_scene.rays,
+		perf_counter() - start_time,
+	)
+
+
+def _count_rays_tuple(
+	tuple_input: tuple[
+		Scene | None,
 		int,
+		list[tuple[int, int]],
 		NDArray[np.float64],
 		NDArray[np.float64],
+		tuple[NDArray[np.float64], NDArray[np.float64]],
 	],
-) -> NDArray[np.float64]:
-	"""Unpacks the tuple input for _ray_trace_pixel and returns the result."""
-	return _ray_trace_pixel(*tuple_input)
+) -> list[int]:
+	"""Trace each of the pixels like `ray_trace` does by default, and return how many rays each one cast."""
+	(
+		scene,
+		reflection_limit,
+		pixels,
+		window_to_viewport_size_ratio,
+		half_window_size,
+		bounding_spheres,
+	) = tuple_input
+	scene = _get_worker_scene(scene)
+	rays = []
+	for x, y in pixels:
+		counting_scene = CountingScene(scene)
+		_ray_trace_tile(
+			counting_scene,
+			reflection_limit,
+			(x, y, 1, 1),
+			window_to_viewport_size_ratio,
+			half_window_size,
+			1,
+			False,
+			bounding_spheres,
+		)
+		rays.append(counting_scene.rays)
+	return rays
+
+
+def _get_worker_scene(scene: Scene | None) -> Scene:
+	"""Return the scene of the tuple input, or of the worker process if it was left out."""
+	if scene is not None:
+		return scene
+	assert _worker_scene is not None
+	return _worker_scene
 
 
-def _ray_trace_pixel(
+def _ray_trace_tile(
 	scene: Scene,
 	reflection_limit: int,
+	tile: tuple[int, int, int, int],
+	window_to_viewport_size_ratio: NDArray[np.float64],
+	half_window_size: NDArray[np.float64],
+	batch_size: int,
+	sort_rays: bool,
+	bounding_spheres: tuple[NDArray[np.float64], NDArray[np.float64]] | None = None,
+	object_indices: NDArray[np.int32] | None = None,
+) -> NDArray[np.float64]:
+	"""
+	Retrieve the colors for a given tile of pixels, with `shape=(height, width, 3)`.
+
+	Primary rays are only tested against objects whose `bounding_spheres`
+	(see `_get_bounding_spheres`) overlap the tile, or only against the object at
+	their pixel in `object_indices` (see `visibility.primary_visibility`), if given.
+	"""
+	x, y, width, height = tile
+	# Ambiguous pixels fall back to culling
+	objects: list[Object] = []
+	if object_indices is None or np.any(object_indices == AMBIGUOUS):
+		objects = _get_tile_objects(
+			scene,
+			tile,
+			window_to_viewport_size_ratio,
+			half_window_size,
+			bounding_spheres or _get_bounding_spheres(scene.objects),
+		)
+	pixel_objects = [objects] * (width * height)
+	if object_indices is not None:
+		for pixel, i in enumerate(object_indices.flat):
+			if i == MISSED:
+				pixel_objects[pixel] = []
+			elif i != AMBIGUOUS:
+				pixel_objects[pixel] = [scene.objects[i]]
+	directions = [
+		_get_pixel_direction(
+			scene, pixel_x, pixel_y, window_to_viewport_size_ratio, half_window_size
+		)
+		for pixel_y in range(y, y + height)
+		for pixel_x in range(x, x + width)
+	]
+
+	# Start sending out rays
+	colors: list[NDArray[np.float64]] = []
+	if batch_size == 1:
+		colors = [
+			_get_color(
+				scene,
+				reflection_limit,
+				scene.camera.position,
+				direction,
+				objects=objects,
+			)
+			for direction, objects in zip(directions, pixel_objects, strict=True)
+		]
+	else:
+		for i in range(0, len(directions), batch_size):
+			rays = [
+				Ray(scene.camera.position, direction)
+				for direction in directions[i : i + batch_size]
+			]
+			colors += _get_colors(
+				scene,
+				reflection_limit,
+				rays,
+				sort_rays,
+				pixel_objects[i : i + batch_size],
+			)
+
+	return np.array(colors).reshape((height, width, 3))
+
+
+def _get_bounding_spheres(
+	objects: list[Object],
+) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+	"""Return the centers and radii of the bounding spheres of the objects (`inf` if unbounded)."""
+	centers = np.zeros((len(objects), 3))
+	radii = np.full(len(objects), np.inf)
+	for i, obj in enumerate(objects):
+		bounds = obj.bounding_sphere()
+		if bounds is not None:
+			centers[i], radii[i] = bounds
+	return centers, radii
+
+
+def _get_tile_objects(
+	scene: Scene,
+	tile: tuple[int, int, int, int],
+	window_to_viewport_size_ratio: NDArray[np.float64],
+	half_window_size: NDArray[np.float64],
+	bounding_spheres: tuple[NDArray[np.float64], NDArray[np.float64]],
+) -> list[Object]:
+	"""
+	Return the objects that primary rays of the tile could hit, in their original order.
+
+	Objects are culled if their bounding spheres lie entirely outside the
+	sub-frustum of the tile. The frustum is padded by half a pixel on every side,
+	so it never collapses for single pixels or rows.
+	"""
+	x, y, width, height = tile
+	viewport_corners = np.array(
+		[
+			[x - 0.5, y - 0.5],
+			[x + width - 0.5, y - 0.5],
+			[x + width - 0.5, y + height - 0.5],
+			[x - 0.5, y + height - 0.5],
+		]
+	)
+
+	# Same as _viewport_to_window and _window_to_relative_world, for all corners at once
+	window_corners = viewport_corners * window_to_viewport_size_ratio - half_window_size
+	window_corners[:, 1] *= -1
+	corners = scene.camera.relative_look_at + window_corners @ np.array(
+		[scene.camera.right, scene.camera.up]
+	)
+
+	# Each pair of neighboring corners forms a side of the frustum, facing inward
+	side_normals = np.cross(corners, np.roll(corners, -1, axis=0))
+	side_normals *= np.sign(side_normals @ np.sum(corners, axis=0))[:, np.newaxis]
+	side_normals /= np.linalg.norm(side_normals, axis=1)[:, np.newaxis]
+
+	centers, radii = bounding_spheres
+	distances = (centers - scene.camera.position) @ side_normals.T
+	visible = np.all(distances >= -radii[:, np.newaxis], axis=1)
+	return [
+		obj
+		for obj, is_visible in zip(scene.objects, visible, strict=True)
+		if is_visible
+	]
+
+
+def _get_pixel_direction(
+	scene: Scene,
 	x: int,
 	y: int,
 	window_to_viewport_size_ratio: NDArray[np.float64],
 	half_window_size: NDArray[np.float64],
 ) -> NDArray[np.float64]:
-	"""Retrieve the color for a given pixel."""
+	"""Return the direction from the camera through the given pixel."""
 	# Find the world point of the pixel, relative to the camera's position
 	viewport_point = np.array([x, y])
 	window_point = _viewport_to_window(
 		viewport_point, window_to_viewport_size_ratio, half_window_size
 	)
 	world_point_relative = _window_to_relative_world(window_point, scene.camera)
+	return normalized(world_point_relative)
 
-	# Start sending out rays
-	return _get_color(
-		scene,
-		reflection_limit,
-		scene.camera.position,
-		normalized(world_point_relative),
+
+def _get_pixel_directions(
+	scene: Scene,
+	width: int,
+	height: int,
+	window_to_viewport_size_ratio: NDArray[np.float64],
+	half_window_size: NDArray[np.float64],
+) -> NDArray[np.float64]:
+	"""Return the direction from the camera through every pixel, in row-major order."""
+	# Same as _get_pixel_direction, for every pixel at once
+	pixel_x, pixel_y = np.meshgrid(np.arange(width), np.arange(height))
+	viewport_points = np.stack([pixel_x.ravel(), pixel_y.ravel()], axis=1)
+	window_points = viewport_points * window_to_viewport_size_ratio - half_window_size
+	window_points[:, 1] *= -1
+	world_points_relative = scene.camera.relative_look_at + window_points @ np.array(
+		[scene.camera.right, scene.camera.up]
+	)
+	return (
+		world_points_relative
+		/ np.linalg.norm(world_points_relative, axis=1)[:, np.newaxis]
 	)
 
 
@@ -117,14 +638,19 @@ def _get_color(
 	direction: NDArray[np.float64],
 	fade: float = 1.0,
 	reflections: int = 0,
+	objects: list[Object] | None = None,
 ) -> NDArray[np.float64]:
-	"""Recursively cast rays to retrieve the color for the original ray collision."""
+	"""
+	Recursively cast rays to retrieve the color for the original ray collision.
+
+	The original ray is only tested against the given `objects` (default: all of them).
+	"""
 	if fade <= FADE_LIMIT or reflections > reflection_limit:
 		return np.array([0, 0, 0])
 
 	# Initialize and cast the ray
 	ray = Ray(origin, direction)
-	collision = scene.cast_ray(ray)
+	collision = scene.cast_ray(ray, objects)
 
 	# Shade the pixel using the collided object
 	if collision is not None:
@@ -132,7 +658,9 @@ def _get_color(
 		# Avoid getting trapped inside objects
 		normal = collision.obj.normal(collision.position)
 		collision.position += COLLISION_NORMAL_OFFSET * normal
-		shadow = _is_in_shadow(scene, collision.position)
+		lights = _get_unshadowed_lights(
+			scene, collision.obj, collision.position, normal
+		)
 
 		# Reflections (recursive)
 		sight_reflection_direction = ray.direction - 2 * normal * np.dot(
@@ -154,7 +682,7 @@ def _get_color(
 			collision.obj,
 			collision.position,
 			view_direction,
-			shadow,
+			lights,
 			reflected_color,
 		)
 
@@ -162,11 +690,198 @@ def _get_color(
 	return scene.background_color
 
 
-def _is_in_shadow(scene: Scene, point: NDArray[np.float64]) -> bool:
-	"""Casts a ray toward the light source to determine if the point is in shadow."""
-	ray = Ray(point, scene.light_direction)
-	collision = scene.cast_ray(ray)
-	return collision is not None
+class _Bounce:
+	"""The shading inputs recorded when a batched ray collides with an object."""
+
+	obj: Object
+	position: NDArray[np.float64]
+	view_direction: NDArray[np.float64]
+	lights: list[Light]
+	reflection: int | None
+	"Index of the reflected ray in the next generation, if it was cast"
+
+	def __init__(
+		self,
+		obj: Object,
+		position: NDArray[np.float64],
+		view_direction: NDArray[np.float64],
+	) -> None:
+		"""Initialize an instance of _Bounce."""
+		self.obj = obj
+		self.position = position
+		self.view_direction = view_direction
+		self.lights = []
+		self.reflection = None
+
+
+def _get_colors(
+	scene: Scene,
+	reflection_limit: int,
+	rays: list[Ray],
+	sort_rays: bool = True,
+	objects: list[list[Object]] | None = None,
+) -> list[NDArray[np.float64]]:
+	"""
+	Cast rays one generation of reflections at a time to retrieve their colors.
+
+	Produces the same colors as calling `_get_color` for each ray.
+	Each original ray is only tested against its list of `objects` (default: all of them).
+	If `sort_rays` is enabled, the secondary and shadow rays of each generation
+	are sorted for coherence before being cast, and the results are scattered back
+	afterward.
+	"""
+	if reflection_limit < 0:
+		return [np.array([0, 0, 0]) for _ in rays]
+
+	# Trace forward, recording what each generation of rays collided with
+	generations: list[list[_Bounce | None]] = []
+	fades = [1.0] * len(rays)
+	while rays:
+		reflections = len(generations)
+
+		# Primary rays are already coherent, so only sort secondary rays
+		order = (
+			coherence_order(rays) if sort_rays and reflections > 0 else range(len(rays))
+		)
+		ordered_collisions = scene.cast_rays(
+			[rays[i] for i in order],
+			[objects[i] for i in order]
+			if objects is not None and reflections == 0
+			else None,
+		)
+		collisions: list[RayCollision | None] = [None] * len(rays)
+		for i, collision in zip(order, ordered_collisions, strict=True):
+			collisions[i] = collision
+
+		bounces: list[_Bounce | None] = []
+		shadow_rays: list[Ray] = []
+		shadow_sources: list[tuple[_Bounce, int]] = []
+		next_rays: list[Ray] = []
+		next_fades: list[float] = []
+		for ray, collision, fade in zip(rays, collisions, fades, strict=True):
+			if collision is None:
+				bounces.append(None)
+				continue
+
+			# Avoid getting trapped inside objects
+			normal = collision.obj.normal(collision.position)
+			collision.position += COLLISION_NORMAL_OFFSET * normal
+			bounce = _Bounce(collision.obj, collision.position, -1 * ray.direction)
+			bounces.append(bounce)
+
+			# Shadows (cast together after the whole generation)
+			for light_index, shadow_ray in _get_shadow_rays(
+				scene, collision.obj, collision.position, normal
+			):
+				shadow_rays.append(shadow_ray)
+				shadow_sources.append((bounce, light_index))
+
+			# Reflections (cast in the next generation)
+			next_fade = fade * collision.obj.reflectivity
+			if next_fade > FADE_LIMIT and reflections + 1 <= reflection_limit:
+				bounce.reflection = len(next_rays)
+				next_rays.append(
+					Ray(
+						collision.position,
+						ray.direction - 2 * normal * np.dot(ray.direction, normal),
+					)
+				)
+				next_fades.append(next_fade)
+
+		if shadow_rays:
+			order = (
+				coherence_order(shadow_rays) if sort_rays else range(len(shadow_rays))
+			)
+			blockers = scene.cast_shadow_rays(
+				[shadow_rays[i] for i in order],
+				[
+					scene.lights[shadow_sources[i][1]].distance_from(
+						shadow_rays[i].origin
+					)
+					for i in order
+				],
+				[shadow_sources[i][1] for i in order],
+			)
+			for i, blocker in zip(order, blockers, strict=True):
+				if blocker is None:
+					bounce, light_index = shadow_sources[i]
+					bounce.lights.append(scene.lights[light_index])
+
+		generations.append(bounces)
+		rays = next_rays
+		fades = next_fades
+
+	# Shade backward, since every color depends on the color of its reflection
+	colors: list[NDArray[np.float64]] = []
+	for bounces in reversed(generations):
+		reflected_colors = colors
+		colors = []
+		for bounce in bounces:
+			if bounce is None:
+				# If no object collided, use the background
+				colors.append(scene.background_color)
+				continue
+
+			# Keep the original light order so colors add up identically
+			bounce.lights.sort(key=scene.lights.index)
+			colors.append(
+				shade(
+					scene,
+					bounce.obj,
+					bounce.position,
+					bounce.view_direction,
+					bounce.lights,
+					reflected_colors[bounce.reflection]
+					if bounce.reflection is not None
+					else np.array([0, 0, 0]),
+				)
+			)
+
+	return colors
+
+
+def _get_unshadowed_lights(
+	scene: Scene,
+	obj: Object,
+	point: NDArray[np.float64],
+	normal: NDArray[np.float64],
+) -> list[Light]:
+	"""Casts one batch of rays toward every visible light to find which are not blocked."""
+	shadow_rays = _get_shadow_rays(scene, obj, point, normal)
+	if not shadow_rays:
+		return []
+
+	light_indices = [light_index for light_index, _ in shadow_rays]
+	lights = [scene.lights[light_index] for light_index in light_indices]
+	blockers = scene.cast_shadow_rays(
+		[ray for _, ray in shadow_rays],
+		[light.distance_from(point) for light in lights],
+		light_indices,
+	)
+	return [
+		light
+		for light, blocker in zip(lights, blockers, strict=True)
+		if blocker is None
+	]
+
+
+def _get_shadow_rays(
+	scene: Scene,
+	obj: Object,
+	point: NDArray[np.float64],
+	normal: NDArray[np.float64],
+) -> list[tuple[int, Ray]]:
+	"""Return the index of each light and a ray toward it, skipping lights behind the surface or too dim to matter."""
+	shadow_rays = []
+	for i, light in enumerate(scene.lights):
+		light_direction = light.direction_from(point)
+		normal_dot_light = float(np.dot(normal, light_direction))
+		if (
+			max_light_contribution(obj, light, normal_dot_light)
+			> LIGHT_CONTRIBUTION_LIMIT
+		):
+			shadow_rays.append((i, Ray(point, light_direction)))
+	return shadow_rays
 
 
 def _get_window_size(
@@ -0,0 +1,131 @@
+"""Caches rendered images on disk, so identical renders are only made once."""
+
+from hashlib import sha256
+from json import dumps as dict_as_json
+from json import loads as json_as_dict
+from os import getenv, utime
+from pathlib import Path
+from shutil import copyfile
+
+CACHE_DIRECTORY = (
+	Path(getenv("XDG_CACHE_HOME", str(Path.home() / ".cache")))
+	/ "ray-tracer"
+	/ "renders"
+)
+"Where rendered images are cached between runs"
+
+STATS_FILE_NAME = "stats.json"
+"Name of the file in the cache directory that counts cache hits and misses"
+
+SOURCE_DIRECTORY = Path(__file__).parent
+"The source code of the renderer, which is part of every cache key"
+
+
+class RenderCache:
+	"""
+	Defines a directory of rendered images, named by the hash of everything that went into them.
+
+	When the images take up more than `max_bytes`, the least recently used are deleted.
+	"""
+
+	directory: Path
+	max_bytes: int
+
+	def __init__(self, max_bytes: int, directory: Path = CACHE_DIRECTORY) -> None:
+		"""Initialize an instance of RenderCache."""
+		self.directory = directory
+		self.max_bytes = max_bytes
+
+	def fetch(self, key: str, output_file_path: str) -> bool:
+		"""Copy the cached image to the output path, and return whether it was cached."""
+		path = self._path(key, output_file_path)
+		hit = path.is_file()
+		if hit:
+			copyfile(path, output_file_path)
+			# Mark it as recently used
+			utime(path)
+
+		self._record(hit)
+		return hit
+
+	def store(self, key: str, output_file_path: str) -> None:
+		"""Copy the rendered image into the cache, evicting old images to make room."""
+		path = self._path(key, output_file_path)
+		try:
+			self.directory.mkdir(parents=True, exist_ok=True)
+			copyfile(output_file_path, path)
+			self._evict()
+		except OSError as err:
+			print(f"WARNING: Could not save render to cache at {path}\n\t{err}")
+
+	def stats(self) -> tuple[int, int]:
+		"""Return the number of cache hits and misses ever recorded."""
+		try:
+			stats = json_as_dict(self._stats_path().read_text(encoding="utf8"))
+			return int(stats["hits"]), int(stats["misses"])
+		except (OSError, ValueError, KeyError, TypeError):
+			return 0, 0
+
+	def _path(self, key: str, output_file_path: str) -> Path:
+		"""Return where the image is cached, keeping the extension of the output."""
+		return self.directory / f"{key}{Path(output_file_path).suffix}"
+
+	def _stats_path(self) -> Path:
+		"""Return where the number of cache hits and misses is kept."""
+		return self.directory / STATS_FILE_NAME
+
+	def _evict(self) -> None:
+		"""Delete the least recently used images until the cache fits its size."""
+		images = sorted(
+			(path for path in self.directory.iterdir() if path != self._stats_path()),
+			key=lambda path: path.stat().st_mtime,
+		)
+		total_bytes = sum(path.stat().st_size for path in images)
+		for path in images:
+			if total_bytes <= self.max_bytes:
+				break
+			total_bytes -= path.stat().st_size
+			path.unlink()
+
+	def _record(self, hit: bool) -> None:
+		"""Add the hit or miss to the saved statistics, ignoring write failures."""
+		hits, misses = self.stats()
+		hits, misses = (hits + 1, misses) if hit else (hits, misses + 1)
+		try:
+			self.directory.mkdir(parents=True, exist_ok=True)
+			self._stats_path().write_text(
+				dict_as_json({"hits": hits, "misses": misses}, indent="\t"),
+				encoding="utf8",
+			)
+		except OSError:
+			pass
+
+
+def render_key(
+	scene_file_path: str,
+	width: int,
+	height: int,
+	reflection_limit: int,
+	kernels: str,
+	triangulate: bool,
+	rasterize: bool,
+	subsampling: float | None = None,
+) -> str:
+	"""
+	Return a hash of the scene file contents, every setting that affects the image, and the renderer.
+
+	The renderer is identified by the paths and contents of its source files, including
+	those in subdirectories, so any change to the code invalidates old renders.
+
+	Raises an OSError if the scene file cannot be read.
+	"""
+	fingerprint = sha256(Path(scene_file_path).read_bytes())
+	fingerprint.update(
+		f"{width}x{height}/{reflection_limit}/{kernels}/{triangulate}/{rasterize}/{subsampling}".encode()
+	)
+	for source_file_path in sorted(SOURCE_DIRECTORY.rglob("*.py")):
+		fingerprint.update(
+			source_file_path.relative_to(SOURCE_DIRECTORY).as_posix().encode()
+		)
+		fingerprint.update(source_file_path.read_bytes())
+	return fingerprint.hexdigest()
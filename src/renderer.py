@@ -0,0 +1,290 @@
+"""
+Renders scenes in-process, reusing the same workers across renders.
+
+Unlike `ray_trace`, which starts a new pool of workers for every render,
+a `Renderer` keeps its pool for as long as it is open:
+
+```python
+with Renderer(backend="process") as renderer:
+    screen = renderer.render("scenes/program-6-scene-3.json", 256, 256)
+    for tile, colors in renderer.render_tiles(scene, 256, 256):
+        ...
+```
+
+Worker processes load the scene of each render once from a temporary file, instead
+of receiving it with every tile.
+"""
+
+import pickle
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from multiprocessing import cpu_count
+from multiprocessing.pool import Pool
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from types import TracebackType
+from typing import Any, Self, TextIO
+
+import numpy as np
+from numpy.typing import NDArray
+
+from batch import _get_job_scene
+from importer import load_scene
+from kernels import use_kernels
+from ray_tracer import (
+	BACKENDS,
+	_fill_screen,
+	_get_pixel_costs,
+	_get_tile_inputs,
+	_open_pool,
+	_ray_trace_tile_tuple,
+)
+from scene import Scene
+
+
+class Renderer:
+	"""Defines a pool of workers that ray trace scenes, which is kept open between renders."""
+
+	kernels: str
+	backend: str
+	workers: int
+	pool: Pool | None
+	"The pool of workers, while the renderer is open (never for the `serial` backend)"
+	opened: bool
+	directory: TemporaryDirectory | None
+	"Where the scenes of renders are saved for worker processes, while the renderer is open"
+	renders: int
+	"Number of renders started, which names the file each scene is saved to"
+
+	def __init__(
+		self,
+		kernels: str = "numpy",
+		backend: str = "process",
+		workers: int | None = None,
+	) -> None:
+		"""
+		Initialize an instance of Renderer.
+
+		The arguments are the same as those of `ray_trace`.
+		"""
+		if backend not in BACKENDS:
+			raise ValueError(f"Backend must be one of {BACKENDS}, not {backend}")
+		if workers is not None and workers <= 0:
+			raise ValueError(f"Workers must be positive, not {workers}")
+
+		self.kernels = kernels
+		self.backend = backend
+		self.workers = 1 if backend == "serial" else workers or cpu_count()
+		self.pool = None
+		self.opened = False
+		self.directory = None
+		self.renders = 0
+
+	def __enter__(self) -> Self:
+		"""Prepare the kernels and start the workers."""
+		# Prepare the kernels before forking, so workers inherit them ready to use
+		use_kernels(self.kernels)
+		if self.backend != "serial":
+			self.pool = _open_pool(self.backend, self.kernels, self.workers)
+		if self.backend == "process":
+			self.directory = TemporaryDirectory()
+		self.opened = True
+		return self
+
+	def __exit__(
+		self,
+		exception_type: type[BaseException] | None,
+		exception: BaseException | None,
+		traceback: TracebackType | None,
+	) -> None:
+		"""Stop the workers."""
+		if self.pool is not None:
+			self.pool.terminate()
+			self.pool.join()
+			self.pool = None
+		if self.directory is not None:
+			self.directory.cleanup()
+			self.directory = None
+		self.opened = False
+
+	def render(
+		self,
+		scene: Scene | str,
+		width: int,
+		height: int,
+		reflection_limit: int = 10,
+		ray_reordering: bool = False,
+		tile_size: tuple[int, int] | None = None,
+		batch_size: int | None = None,
+		rasterize: bool = False,
+		triangulate: bool = False,
+		progress_bar: bool = False,
+		telemetry_stream: TextIO | None = None,
+		cost_scheduling: bool = False,
+	) -> NDArray[np.float64]:
+		"""
+		Ray trace the scene, or the scene file at the path, without writing any files.
+
+		The arguments are the same as those of `ray_trace`, and `triangulate` is passed
+		to `load_scene` when given a path. Scene files that cannot be read raise
+		`OSError`, and invalid scenes raise `ValueError`.
+
+		Returns a 3-dimensional array of pixel colors with `shape=(height, width, 3)`.
+		"""
+		loaded_scene = self._load(scene, triangulate)
+		with self._save(loaded_scene) as scene_path:
+			tiles, tuple_inputs = self._prepare_tiles(
+				loaded_scene,
+				scene_path,
+				width,
+				height,
+				reflection_limit,
+				ray_reordering,
+				tile_size,
+				batch_size,
+				rasterize,
+				cost_scheduling,
+			)
+			outputs = self._imap(
+				_ray_trace_tile_tuple, tuple_inputs, scene_path, ordered=True
+			)
+			return _fill_screen(
+				tiles, outputs, width, height, progress_bar, telemetry_stream
+			)
+
+	def render_tiles(
+		self,
+		scene: Scene | str,
+		width: int,
+		height: int,
+		reflection_limit: int = 10,
+		ray_reordering: bool = False,
+		tile_size: tuple[int, int] | None = None,
+		batch_size: int | None = None,
+		rasterize: bool = False,
+		triangulate: bool = False,
+		cost_scheduling: bool = False,
+	) -> Iterator[tuple[tuple[int, int, int, int], NDArray[np.float64]]]:
+		"""
+		Ray trace the scene like `render`, yielding each tile as soon as it is finished.
+
+		Yields the `(x, y, width, height)` of each tile and its pixel colors with
+		`shape=(height, width, 3)`, in whatever order the workers finish them.
+		"""
+		loaded_scene = self._load(scene, triangulate)
+		with self._save(loaded_scene) as scene_path:
+			_, tuple_inputs = self._prepare_tiles(
+				loaded_scene,
+				scene_path,
+				width,
+				height,
+				reflection_limit,
+				ray_reordering,
+				tile_size,
+				batch_size,
+				rasterize,
+				cost_scheduling,
+			)
+			yield from self._imap(
+				_ray_trace_located_tile_tuple, tuple_inputs, scene_path, ordered=False
+			)
+
+	def _load(self, scene: Scene | str, triangulate: bool) -> Scene:
+		"""Import the scene if given a path, after checking the renderer is open."""
+		if not self.opened:
+			raise RuntimeError("Renderer must be opened with a `with` statement first")
+		return load_scene(scene, triangulate) if isinstance(scene, str) else scene
+
+	@contextmanager
+	def _save(self, scene: Scene) -> Iterator[str | None]:
+		"""Save the scene for worker processes to load while the context is open, and yield its path (or None without worker processes)."""
+		if self.directory is None:
+			yield None
+			return
+
+		self.renders += 1
+		scene_path = Path(self.directory.name) / f"{self.renders}.pickle"
+		scene_path.write_bytes(pickle.dumps(scene))
+		try:
+			yield str(scene_path)
+		finally:
+			scene_path.unlink(missing_ok=True)
+
+	def _prepare_tiles(
+		self,
+		scene: Scene,
+		scene_path: str | None,
+		width: int,
+		height: int,
+		reflection_limit: int,
+		ray_reordering: bool,
+		tile_size: tuple[int, int] | None,
+		batch_size: int | None,
+		rasterize: bool,
+		cost_scheduling: bool,
+	) -> tuple[list[tuple[int, int, int, int]], list[tuple]]:
+		"""Split the screen into tiles like `ray_trace`, estimating their costs with the workers if scheduling by cost."""
+		pixel_costs = None
+		if cost_scheduling and self.workers > 1:
+			pixel_costs = _get_pixel_costs(
+				scene,
+				width,
+				height,
+				reflection_limit,
+				lambda function, inputs: self._imap(
+					function, inputs, scene_path, ordered=True
+				),
+			)
+		return _get_tile_inputs(
+			scene,
+			width,
+			height,
+			reflection_limit,
+			ray_reordering,
+			tile_size,
+			batch_size,
+			rasterize,
+			pixel_costs,
+			self.workers,
+		)
+
+	def _imap(
+		self,
+		function: Callable[[Any], Any],
+		inputs: list,
+		scene_path: str | None,
+		ordered: bool,
+	) -> Iterator:
+		"""
+		Lazily apply the function to every input with the workers.
+
+		Inputs start with the scene, which is left out of them and loaded from the
+		scene path instead, if given one.
+		"""
+		if self.pool is None:
+			return map(function, inputs)
+		if scene_path is not None:
+			inputs = [
+				(function, scene_path, (None, *tuple_input[1:]))
+				for tuple_input in inputs
+			]
+			function = _call_with_saved_scene
+		if ordered:
+			return self.pool.imap(function, inputs)
+		return self.pool.imap_unordered(function, inputs)
+
+
+def _call_with_saved_scene(
+	saved_input: tuple[Callable[[tuple], Any], str, tuple],
+) -> Any:
+	"""Apply the function to the tuple input, with the scene saved at the scene path."""
+	function, scene_path, tuple_input = saved_input
+	return function((_get_job_scene(scene_path), *tuple_input[1:]))
+
+
+def _ray_trace_located_tile_tuple(
+	tuple_input: tuple,
+) -> tuple[tuple[int, int, int, int], NDArray[np.float64]]:
+	"""Unpacks the tuple input for _ray_trace_tile and returns the tile with its result."""
+	colors, _ = _ray_trace_tile_tuple(tuple_input)
+	return tuple_input[2], colors
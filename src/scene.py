@@ -1,9 +1,13 @@
 """Classes that define the scene to be ray traced."""
 
+from math import inf
+
 import numpy as np
 from numpy.typing import NDArray
 
+from lights import Light
 from objects import Object
+from occluders import OccluderGrid, get_occluder_grids
 from ray import Ray, RayCollision
 from vector import magnitude, normalized
 
@@ -42,36 +46,180 @@ class Scene:
 	"""Defines the entire scene and all objects within it."""
 
 	camera: Camera
-	light_direction: NDArray[np.float64]
-	light_color: NDArray[np.float64]
+	lights: list[Light]
 	ambient_light_color: NDArray[np.float64]
 	background_color: NDArray[np.float64]
 	objects: list[Object]
+	occluder_grids: dict[int, OccluderGrid]
+	"Which objects can block the shadow rays of each directional light, by the index of the light"
 
 	def __init__(
 		self,
 		camera: Camera,
-		light_direction: NDArray[np.float64],
-		light_color: NDArray[np.float64],
+		lights: list[Light],
 		ambient_light_color: NDArray[np.float64],
 		background_color: NDArray[np.float64],
 		objects: list[Object],
+		occluder_grids: dict[int, OccluderGrid] | None = None,
 	) -> None:
-		"""Initialize an instance of Scene."""
+		"""
+		Initialize an instance of Scene.
+
+		The `occluder_grids` are built from the lights and objects, unless given.
+		"""
 		# Camera
 		self.camera = camera
 
 		# Lighting
-		self.light_direction = light_direction
-		self.light_color = light_color
+		self.lights = lights
 		self.ambient_light_color = ambient_light_color
 		self.background_color = background_color
 
 		# Objects
 		self.objects = objects
+		self.occluder_grids = (
+			get_occluder_grids(lights, objects)
+			if occluder_grids is None
+			else occluder_grids
+		)
+
+	def cast_ray(
+		self, ray: Ray, objects: list[Object] | None = None
+	) -> RayCollision | None:
+		"""
+		Projects the ray into the scene and returns the closest object collision.
+
+		Only the given `objects` are tested, if the ray is known to miss the rest.
+		"""
+		# Only build a collision for the closest object
+		closest_obj, closest_t = self.find_closest(ray, objects)
+		if closest_obj is None:
+			return None
+		return RayCollision(closest_obj, ray, ray.origin + ray.direction * closest_t)
+
+	def cast_rays(
+		self, rays: list[Ray], objects: list[list[Object]] | None = None
+	) -> list[RayCollision | None]:
+		"""
+		Projects a batch of rays into the scene and returns the closest object collision of each.
+
+		Each ray is only tested against its list of `objects`, if given.
+		"""
+		if objects is None:
+			return [self.cast_ray(ray) for ray in rays]
+		return [
+			self.cast_ray(ray, ray_objects)
+			for ray, ray_objects in zip(rays, objects, strict=True)
+		]
+
+	def find_closest(
+		self, ray: Ray, objects: list[Object] | None = None
+	) -> tuple[Object | None, float]:
+		"""
+		Return the closest object the ray collides with, and how far along the ray (in multiples of its direction).
+
+		Only the given `objects` are tested, if the ray is known to miss the rest.
+		Returns `None` and `inf` if the ray misses every object.
+		"""
+		closest_obj = None
+		closest_t = inf
+		for obj in self.objects if objects is None else objects:
+			t = obj.ray_distance(ray, closest_t)
+			if t < closest_t:
+				closest_obj = obj
+				closest_t = t
+		return closest_obj, closest_t
+
+	def cast_shadow_rays(
+		self,
+		rays: list[Ray],
+		max_distances: list[float],
+		light_indices: list[int] | None = None,
+	) -> list[RayCollision | None]:
+		"""
+		Projects a batch of shadow rays into the scene and returns what blocked each.
+
+		Shadow rays only need to know whether *any* object lies closer than their
+		max distance. If given the index in `lights` of the light each ray points
+		toward, rays toward directional lights are only tested against the objects
+		in their cell of the light's occluder grid. The rest are tested
+		against every object, with each object tested against the whole batch at
+		once and blocked rays retired from the batch immediately.
+		The returned collision is the first blocker found, not necessarily the closest.
+		"""
+		blockers: list[RayCollision | None] = [None] * len(rays)
+		remaining = []
+		for i, ray in enumerate(rays):
+			grid = (
+				None
+				if light_indices is None
+				else self.occluder_grids.get(light_indices[i])
+			)
+			if grid is None:
+				remaining.append(i)
+				continue
 
-	def cast_ray(self, ray: Ray) -> RayCollision | None:
-		"""Projects the ray into the scene and returns the closest object collision."""
-		collisions = [obj.ray_intersection(ray) for obj in self.objects]
-		real = list(filter(None, collisions))
-		return min(real, key=lambda c: c.distance) if real else None
+			for j in grid.candidates(ray.origin):
+				t = self.objects[j].ray_distance(ray, max_distances[i])
+				if t < max_distances[i]:
+					blockers[i] = RayCollision(
+						self.objects[j], ray, ray.origin + ray.direction * t
+					)
+					break
+
+		for obj in self.objects:
+			if not remaining:
+				break
+
+			unblocked = []
+			for i in remaining:
+				t = obj.ray_distance(rays[i], max_distances[i])
+				if t < max_distances[i]:
+					blockers[i] = RayCollision(
+						obj, rays[i], rays[i].origin + rays[i].direction * t
+					)
+				else:
+					unblocked.append(i)
+			remaining = unblocked
+
+		return blockers
+
+
+class CountingScene(Scene):
+	"""A scene that counts every ray cast into it."""
+
+	rays: int
+	"Number of primary, reflection, and shadow rays"
+	sight_rays: int
+	"Number of primary and reflection rays"
+
+	def __init__(self, scene: Scene) -> None:
+		"""Initialize an instance of CountingScene, sharing everything with the scene."""
+		super().__init__(
+			scene.camera,
+			scene.lights,
+			scene.ambient_light_color,
+			scene.background_color,
+			scene.objects,
+			scene.occluder_grids,
+		)
+		self.rays = 0
+		self.sight_rays = 0
+
+	def cast_ray(
+		self, ray: Ray, objects: list[Object] | None = None
+	) -> RayCollision | None:
+		"""Projects the ray into the scene, counting it."""
+		self.rays += 1
+		self.sight_rays += 1
+		return super().cast_ray(ray, objects)
+
+	def cast_shadow_rays(
+		self,
+		rays: list[Ray],
+		max_distances: list[float],
+		light_indices: list[int] | None = None,
+	) -> list[RayCollision | None]:
+		"""Projects a batch of shadow rays into the scene, counting them."""
+		self.rays += len(rays)
+		return super().cast_shadow_rays(rays, max_distances, light_indices)
@@ -0,0 +1,116 @@
+"""
+Orders and splits tiles by how expensive they are likely to be to trace.
+
+Pixels that only see the background cost a single ray, while pixels on mirrors cost
+a ray per reflection and a shadow ray per light at every bounce. A cheap pre-pass
+counts the rays of every few pixels, and tiles are then handed out most expensive
+first, so the cheap ones fill in the gaps at the end. Tiles that would be a large
+share of the work left when they are handed out are split first, so no worker is
+left tracing one big tile while the others idle.
+"""
+
+from heapq import heapify, heappop, heappush
+
+import numpy as np
+from numpy.typing import NDArray
+
+SAMPLE_SPACING = 8
+"Pixels between the pixels traced by the pre-pass, along each axis"
+
+SHARES_PER_WORKER = 2
+"Tiles are split until each costs less than this fraction of a worker's share of the work left"
+
+MAX_SPLITS = 2
+"Tiles are split at most this many times, so splitting cannot shrink them to single pixels"
+
+
+def get_sample_rows(width: int, height: int) -> list[list[tuple[int, int]]]:
+	"""Return the `(x, y)` of the pixels traced by the pre-pass, one in the middle of every block, row by row."""
+	offset = SAMPLE_SPACING // 2
+	return [
+		[
+			(min(x + offset, width - 1), min(y + offset, height - 1))
+			for x in range(0, width, SAMPLE_SPACING)
+		]
+		for y in range(0, height, SAMPLE_SPACING)
+	]
+
+
+def get_pixel_costs(
+	sample_costs: list[list[int]], width: int, height: int
+) -> NDArray[np.float64]:
+	"""Return the estimated cost of every pixel (the cost of the sample of its block), with `shape=(height, width)`."""
+	block_costs = np.array(sample_costs, dtype=np.float64)
+	return np.repeat(
+		np.repeat(block_costs, SAMPLE_SPACING, axis=0), SAMPLE_SPACING, axis=1
+	)[:height, :width]
+
+
+def schedule_tiles(
+	tiles: list[tuple[int, int, int, int]],
+	pixel_costs: NDArray[np.float64],
+	workers: int,
+) -> list[tuple[int, int, int, int]]:
+	"""
+	Return the tiles in the order to hand them out, splitting those that cost too much.
+
+	The most expensive tile is always handed out next. If it costs more than
+	`1 / SHARES_PER_WORKER` of each worker's share of the work left, it is split in
+	half across its longer side instead, and both halves wait their turn.
+
+	Halves are never smaller than a block of the pre-pass (`SAMPLE_SPACING` squared
+	pixels), whose costs are all estimated the same, nor smaller than the largest
+	tile given split `MAX_SPLITS` times, so the last tiles keep enough pixels to be
+	worth handing out.
+	"""
+	# Sum the costs of any rectangle with four lookups
+	cumulative_costs = np.zeros((pixel_costs.shape[0] + 1, pixel_costs.shape[1] + 1))
+	cumulative_costs[1:, 1:] = np.cumsum(np.cumsum(pixel_costs, axis=0), axis=1)
+	table: list[list[float]] = cumulative_costs.tolist()
+
+	def cost(tile: tuple[int, int, int, int]) -> float:
+		"""Return the estimated cost of the tile."""
+		x, y, width, height = tile
+		return (
+			table[y + height][x + width]
+			- table[y][x + width]
+			- table[y + height][x]
+			+ table[y][x]
+		)
+
+	# Order by decreasing cost, then by position
+	queue = [(-cost(tile), tile) for tile in tiles]
+	heapify(queue)
+	work_left = -sum(negative_cost for negative_cost, _ in queue)
+	largest_area = max((width * height for _, _, width, height in tiles), default=0)
+	min_area = max(SAMPLE_SPACING**2, largest_area // 2**MAX_SPLITS)
+
+	scheduled = []
+	while queue:
+		negative_cost, tile = heappop(queue)
+		tile_cost = -negative_cost
+		_, _, width, height = tile
+		too_costly = tile_cost * workers * SHARES_PER_WORKER > work_left
+		if too_costly and width * height >= 2 * min_area:
+			for half in _split(tile):
+				heappush(queue, (-cost(half), half))
+		else:
+			scheduled.append(tile)
+			work_left -= tile_cost
+	return scheduled
+
+
+def _split(
+	tile: tuple[int, int, int, int],
+) -> tuple[tuple[int, int, int, int], tuple[int, int, int, int]]:
+	"""Split the tile in half across its longer side."""
+	x, y, width, height = tile
+	if width >= height:
+		left_width = width // 2
+		left = (x, y, left_width, height)
+		right = (x + left_width, y, width - left_width, height)
+		return left, right
+	top_height = height // 2
+	top = (x, y, width, top_height)
+	bottom = (x, y + top_height, width, height - top_height)
+	return top, bottom
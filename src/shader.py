@@ -3,6 +3,8 @@
 import numpy as np
 from numpy.typing import NDArray
 
+import kernels
+from lights import Light
 from objects import Object
 from scene import Scene
 
@@ -12,40 +14,35 @@ def shade(
 	obj: Object,
 	position: NDArray[np.float64],
 	view_direction: NDArray[np.float64],
-	shadow: bool,
+	lights: list[Light],
 	reflected_color: NDArray[np.float64],
 ) -> NDArray[np.float64]:
 	"""
 	Apply [Phong shading](https://en.wikipedia.org/wiki/Phong_shading) to the object.
 
+	Only the given lights contribute diffuse and specular lighting,
+	so shadowed lights should already be excluded.
+
 	Returns the color.
 	"""
-	shadow_coefficient = 0 if shadow else 1
-
 	surface_normal = obj.normal(position)
-	normal_dot_light = np.dot(surface_normal, scene.light_direction)
-	light_reflection_direction = (
-		2 * surface_normal * normal_dot_light - scene.light_direction
-	)
-	view_dot_light = np.dot(view_direction, light_reflection_direction)
 
 	# Ambient lighting
 	ambient = scene.ambient_light_color * obj.diffuse_color
 	ambient *= obj.ambient_coefficient
 
-	# Diffuse lighting
-	diffuse = scene.light_color * obj.diffuse_color * max(0, normal_dot_light)
-	diffuse *= obj.diffuse_coefficient
-	diffuse *= shadow_coefficient
-
-	# Specular lighting
-	specular = (
-		scene.light_color
-		* obj.specular_color
-		* max(0, view_dot_light) ** obj.gloss_coefficient
+	# Diffuse and specular lighting
+	diffuse, specular = kernels.phong(
+		surface_normal,
+		view_direction,
+		[light.direction_from(position) for light in lights],
+		[light.color for light in lights],
+		obj.gloss_coefficient,
 	)
+	diffuse *= obj.diffuse_color
+	diffuse *= obj.diffuse_coefficient
+	specular *= obj.specular_color
 	specular *= obj.specular_coefficient
-	specular *= shadow_coefficient
 
 	# Reflections
 	reflected = obj.reflectivity * reflected_color
@@ -55,3 +52,19 @@ def shade(
 	np.clip(color, 0, 1, out=color)
 
 	return color
+
+
+def max_light_contribution(obj: Object, light: Light, normal_dot_light: float) -> float:
+	"""
+	Return an upper bound on how much the light can brighten any channel of the object.
+
+	Used to skip shadow-testing lights that could not visibly change the color.
+	"""
+	if normal_dot_light < 0:
+		# The light is behind the surface
+		# (Grazing lights can still cast specular highlights, so they are kept)
+		return 0
+
+	diffuse = obj.diffuse_coefficient * obj.diffuse_color * normal_dot_light
+	specular = obj.specular_coefficient * obj.specular_color
+	return float(np.max(light.color * (diffuse + specular)))
@@ -0,0 +1,459 @@
+"""
+Renders scenes whose objects are split among processes, instead of copied to each.
+
+Every worker of the parallel backends holds a copy of the whole scene. In sharded
+mode, the objects are instead split into spatially compact shards, each owned by
+one process, so only the main process holds the whole scene (to shade what rays
+hit). The main process traces tiles one generation of rays at a time, sending each
+batch of rays to every shard whose bounds they pass through. Each shard returns the
+closest object each ray collides with, and the closest of those wins.
+"""
+
+import multiprocessing
+from contextlib import suppress
+from math import inf
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from time import perf_counter
+from types import TracebackType
+from typing import Self, TextIO
+
+import numpy as np
+from numpy.typing import NDArray
+
+from kernels import use_kernels
+from lights import Light
+from objects import Object
+from ray import Ray, RayCollision
+from ray_tracer import _fill_screen, _get_tile_inputs, _ray_trace_tile
+from scene import Camera, Scene
+from telemetry import TileReport, worker_name
+
+SHARD_TILE_HEIGHT = 8
+"Rows of pixels per tile by default, so each batch of rays sent to the shards is large"
+
+START_METHOD = "spawn"
+"Shards are spawned rather than forked, so they never hold more than their own objects"
+
+BOUNDS_PADDING = 1e-9
+"How much to grow the bounds of shards (relative to their size), so rounding cannot drop collisions"
+
+MISSED = -1
+"Object index of rays that miss every object of a shard"
+
+
+class ShardedScene(Scene):
+	"""
+	Defines a scene that finds what rays collide with by asking the shard processes that own its objects.
+
+	The shards are started when the scene is opened with a `with` statement.
+	"""
+
+	shards: int
+	kernels: str
+	connections: list[Connection]
+	processes: list[BaseProcess]
+	bounds: list[tuple[NDArray[np.float64], float]]
+	"Center and radius of a sphere around the objects of each shard (an `inf` radius if any are unbounded)"
+	rays: int
+	"Number of primary, reflection, and shadow rays"
+	opened: bool
+
+	def __init__(self, scene: Scene, shards: int, kernels: str = "numpy") -> None:
+		"""Initialize an instance of ShardedScene, sharing everything with the scene."""
+		super().__init__(
+			scene.camera,
+			scene.lights,
+			scene.ambient_light_color,
+			scene.background_color,
+			scene.objects,
+			{},
+		)
+		self.shards = shards
+		self.kernels = kernels
+		self.connections = []
+		self.processes = []
+		self.bounds = []
+		self.rays = 0
+		self.opened = False
+
+	def __enter__(self) -> Self:
+		"""Start a process for each shard of the objects."""
+		context = multiprocessing.get_context(START_METHOD)
+		for indices in split_objects(self.objects, self.shards):
+			objects = [self.objects[i] for i in indices]
+			connection, shard_connection = context.Pipe()
+			process = context.Process(
+				target=_serve_shard,
+				args=(
+					shard_connection,
+					self.camera,
+					self.lights,
+					self.ambient_light_color,
+					self.background_color,
+					objects,
+					indices,
+					self.kernels,
+				),
+				daemon=True,
+			)
+			process.start()
+			shard_connection.close()
+			self.connections.append(connection)
+			self.processes.append(process)
+			self.bounds.append(_get_bounds(objects))
+		self.opened = True
+		return self
+
+	def __exit__(
+		self,
+		exception_type: type[BaseException] | None,
+		exception: BaseException | None,
+		traceback: TracebackType | None,
+	) -> None:
+		"""Stop the shards."""
+		for connection in self.connections:
+			# Shards that already stopped (such as after crashing) cannot be told to
+			with suppress(OSError):
+				connection.send(None)
+			connection.close()
+		for process in self.processes:
+			process.join()
+		self.connections = []
+		self.processes = []
+		self.bounds = []
+		self.opened = False
+
+	def cast_ray(
+		self, ray: Ray, objects: list[Object] | None = None
+	) -> RayCollision | None:
+		"""Projects the ray into the scene and returns the closest object collision."""
+		return self.cast_rays([ray])[0]
+
+	def cast_rays(
+		self, rays: list[Ray], objects: list[list[Object]] | None = None
+	) -> list[RayCollision | None]:
+		"""
+		Projects a batch of rays into the scene and returns the closest object collision of each.
+
+		Every ray is tested against all objects of the shards it passes through,
+		whatever its `objects`.
+		"""
+		self.rays += len(rays)
+		if not rays:
+			return []
+
+		origins = np.array([ray.origin for ray in rays])
+		directions = np.array([ray.direction for ray in rays])
+		distances = np.full(len(rays), inf)
+		indices = np.full(len(rays), len(self.objects))
+		for ray_indices, (shard_distances, shard_indices) in self._request(
+			"closest", origins, directions, np.full(len(rays), inf)
+		):
+			# Like Scene.cast_ray, break ties in favor of the first object
+			closer = (shard_distances < distances[ray_indices]) | (
+				(shard_distances == distances[ray_indices])
+				& (shard_indices < indices[ray_indices])
+			)
+			distances[ray_indices[closer]] = shard_distances[closer]
+			indices[ray_indices[closer]] = shard_indices[closer]
+
+		return [
+			None
+			if t == inf
+			else RayCollision(self.objects[i], ray, ray.origin + ray.direction * t)
+			for ray, t, i in zip(
+				rays, distances.tolist(), indices.tolist(), strict=True
+			)
+		]
+
+	def cast_shadow_rays(
+		self,
+		rays: list[Ray],
+		max_distances: list[float],
+		light_indices: list[int] | None = None,
+	) -> list[RayCollision | None]:
+		"""
+		Projects a batch of shadow rays into the scene and returns what blocked each.
+
+		The returned collision is the first blocker found, not necessarily the closest.
+		"""
+		self.rays += len(rays)
+		if not rays:
+			return []
+
+		origins = np.array([ray.origin for ray in rays])
+		directions = np.array([ray.direction for ray in rays])
+		blockers: list[RayCollision | None] = [None] * len(rays)
+		for ray_indices, (shard_indices, positions) in self._request(
+			"shadow",
+			origins,
+			directions,
+			np.array(max_distances),
+			None if light_indices is None else np.array(light_indices),
+		):
+			for i, obj_index, position in zip(
+				ray_indices.tolist(), shard_indices.tolist(), positions, strict=True
+			):
+				if obj_index != MISSED and blockers[i] is None:
+					blockers[i] = RayCollision(
+						self.objects[obj_index], rays[i], position
+					)
+		return blockers
+
+	def _request(
+		self,
+		kind: str,
+		origins: NDArray[np.float64],
+		directions: NDArray[np.float64],
+		max_distances: NDArray[np.float64],
+		light_indices: NDArray[np.int_] | None = None,
+	) -> list[tuple[NDArray[np.intp], tuple[NDArray, NDArray]]]:
+		"""
+		Send the rays to every shard whose bounds they pass through, and return the results of each shard.
+
+		All shards are sent their rays before any results are awaited, so they work
+		at the same time. Each result comes with the indices of the rays it is for.
+		"""
+		if not self.opened:
+			raise RuntimeError(
+				"ShardedScene must be opened with a `with` statement first"
+			)
+
+		routes = []
+		for connection, (center, radius) in zip(
+			self.connections, self.bounds, strict=True
+		):
+			ray_indices = np.flatnonzero(
+				_passes_through(origins, directions, max_distances, center, radius)
+			)
+			if ray_indices.size == 0:
+				continue
+			connection.send(
+				(
+					kind,
+					origins[ray_indices],
+					directions[ray_indices],
+					max_distances[ray_indices],
+					None if light_indices is None else light_indices[ray_indices],
+				)
+			)
+			routes.append((connection, ray_indices))
+		return [(ray_indices, connection.recv()) for connection, ray_indices in routes]
+
+
+def ray_trace_sharded(
+	scene: Scene,
+	width: int,
+	height: int,
+	reflection_limit: int,
+	progress_bar: bool,
+	shards: int,
+	ray_reordering: bool = False,
+	kernels: str = "numpy",
+	tile_size: tuple[int, int] | None = None,
+	batch_size: int | None = None,
+	telemetry_stream: TextIO | None = None,
+) -> NDArray[np.float64]:
+	"""
+	Ray traces the given scene, with its objects split among `shards` processes.
+
+	The other arguments are the same as those of `ray_trace`. Tiles are traced in
+	the main process, `SHARD_TILE_HEIGHT` rows at a time by default, and each tile
+	is traced as one batch by default, so the shards are sent as many rays at once
+	as possible.
+
+	Returns a 3-dimensional array of pixel colors with `shape=(height, width, 3)`.
+	"""
+	# Shading happens in the main process
+	use_kernels(kernels)
+
+	if tile_size is None:
+		tile_size = (width, SHARD_TILE_HEIGHT)
+	if batch_size is None:
+		batch_size = tile_size[0] * tile_size[1]
+
+	with ShardedScene(scene, shards, kernels) as sharded_scene:
+		tiles, tuple_inputs = _get_tile_inputs(
+			sharded_scene,
+			width,
+			height,
+			reflection_limit,
+			ray_reordering,
+			tile_size,
+			batch_size,
+			False,
+		)
+		outputs = map(_ray_trace_sharded_tile_tuple, tuple_inputs)
+		return _fill_screen(
+			tiles, outputs, width, height, progress_bar, telemetry_stream
+		)
+
+
+def split_objects(objects: list[Object], shards: int) -> list[list[int]]:
+	"""
+	Split the objects into at most `shards` spatially compact groups of about the same size.
+
+	Bounded objects are split by recursively halving them along the longest side of
+	their bounding spheres' centers. Unbounded objects (which every ray must be tested
+	against) all join the smallest group.
+	Returns the indices of the objects in each group, in scene order.
+	"""
+	bounded: list[tuple[int, NDArray[np.float64]]] = []
+	unbounded: list[int] = []
+	for i, obj in enumerate(objects):
+		bounding_sphere = obj.bounding_sphere()
+		if bounding_sphere is None:
+			unbounded.append(i)
+		else:
+			bounded.append((i, bounding_sphere[0]))
+
+	groups = [group for group in _bisect(bounded, shards) if group]
+	if unbounded:
+		if groups:
+			smallest = min(range(len(groups)), key=lambda i: len(groups[i]))
+			groups[smallest].extend(unbounded)
+		else:
+			groups.append(unbounded)
+	return [sorted(group) for group in groups]
+
+
+def _bisect(
+	items: list[tuple[int, NDArray[np.float64]]], parts: int
+) -> list[list[int]]:
+	"""Split the `(index, center)` items into the given number of parts, recursively halving them across the longest side."""
+	if parts <= 1 or len(items) <= 1:
+		return [[i for i, _ in items]] + [[] for _ in range(parts - 1)]
+
+	centers = np.array([center for _, center in items])
+	axis = int(np.argmax(np.ptp(centers, axis=0)))
+	items = sorted(items, key=lambda item: float(item[1][axis]))
+	left_parts = parts // 2
+	middle = len(items) * left_parts // parts
+	return _bisect(items[:middle], left_parts) + _bisect(
+		items[middle:], parts - left_parts
+	)
+
+
+def _get_bounds(objects: list[Object]) -> tuple[NDArray[np.float64], float]:
+	"""Return the center and radius of a sphere around the objects (an `inf` radius if any are unbounded)."""
+	centers = []
+	radii = []
+	for obj in objects:
+		bounding_sphere = obj.bounding_sphere()
+		if bounding_sphere is None:
+			return np.zeros(3), inf
+		centers.append(bounding_sphere[0])
+		radii.append(bounding_sphere[1])
+
+	centers = np.array(centers)
+	center = np.mean(centers, axis=0)
+	radius = float(np.max(np.linalg.norm(centers - center, axis=1) + np.array(radii)))
+	return center, radius + BOUNDS_PADDING * max(1, radius)
+
+
+def _passes_through(
+	origins: NDArray[np.float64],
+	directions: NDArray[np.float64],
+	max_distances: NDArray[np.float64],
+	center: NDArray[np.float64],
+	radius: float,
+) -> NDArray[np.bool_]:
+	"""Return whether each ray passes through the sphere before its max distance (in multiples of its direction)."""
+	if radius == inf:
+		return np.ones(len(origins), dtype=np.bool_)
+
+	# Find the closest point of each ray to the center of the sphere
+	offsets = center - origins
+	along = np.einsum("ij,ij->i", offsets, directions) / np.einsum(
+		"ij,ij->i", directions, directions
+	)
+	along = np.clip(along, 0, max_distances)
+	closest_offsets = offsets - along[:, np.newaxis] * directions
+	return np.einsum("ij,ij->i", closest_offsets, closest_offsets) <= radius**2
+
+
+def _serve_shard(
+	connection: Connection,
+	camera: Camera,
+	lights: list[Light],
+	ambient_light_color: NDArray[np.float64],
+	background_color: NDArray[np.float64],
+	objects: list[Object],
+	indices: list[int],
+	kernels: str,
+) -> None:
+	"""
+	Find what the rays of each request collide with among the objects of the shard, until sent `None`.
+
+	Returns the closest distance (in multiples of the direction) and object index of
+	each ray for `closest` requests, and the object index and position of the first
+	blocker found for each ray of `shadow` requests (`MISSED` if none).
+	"""
+	use_kernels(kernels)
+	scene = Scene(camera, lights, ambient_light_color, background_color, objects)
+	scene_indices = {id(obj): i for obj, i in zip(objects, indices, strict=True)}
+
+	while (request := connection.recv()) is not None:
+		kind, origins, directions, max_distances, light_indices = request
+		if kind == "closest":
+			closest = [
+				scene.find_closest(Ray(origin, direction))
+				for origin, direction in zip(origins, directions, strict=True)
+			]
+			connection.send(
+				(
+					np.array([t for _, t in closest]),
+					np.array(
+						[
+							MISSED if obj is None else scene_indices[id(obj)]
+							for obj, _ in closest
+						]
+					),
+				)
+			)
+		else:
+			rays = [
+				Ray(origin, direction)
+				for origin, direction in zip(origins, directions, strict=True)
+			]
+			blockers = scene.cast_shadow_rays(
+				rays,
+				max_distances.tolist(),
+				None if light_indices is None else light_indices.tolist(),
+			)
+			connection.send(
+				(
+					np.array(
+						[
+							MISSED
+							if blocker is None
+							else scene_indices[id(blocker.obj)]
+							for blocker in blockers
+						]
+					),
+					np.array(
+						[
+							np.zeros(3) if blocker is None else blocker.position
+							for blocker in blockers
+						]
+					).reshape((-1, 3)),
+				)
+			)
+	connection.close()
+
+
+def _ray_trace_sharded_tile_tuple(
+	tuple_input: tuple,
+) -> tuple[NDArray[np.float64], TileReport]:
+	"""Unpacks the tuple input for _ray_trace_tile and returns the result, with a report of the work."""
+	start_time = perf_counter()
+	scene: ShardedScene = tuple_input[0]
+	rays = scene.rays
+	colors = _ray_trace_tile(*tuple_input)
+	return colors, TileReport(
+		worker_name(),
+		colors.shape[0] * colors.shape[1],
+		scene.rays - rays,
+		perf_counter() - start_time,
+	)
@@ -0,0 +1,24 @@
+"""Starts worker processes quickly, for runs made of many small renders."""
+
+import multiprocessing
+from multiprocessing import forkserver
+
+START_METHODS = tuple(multiprocessing.get_all_start_methods())
+"Names of the ways worker processes can be started on this platform"
+
+PRELOAD_MODULES = ["ray_tracer"]
+"Modules imported by the fork server before it forks any workers"
+
+
+def use_start_method(start_method: str) -> None:
+	"""
+	Start worker processes with the given method from now on.
+
+	With `forkserver`, every worker is forked from a template process that has
+	already imported the ray tracer. The template is started right away, so it
+	warms up while the scene is imported.
+	"""
+	multiprocessing.set_start_method(start_method, force=True)
+	if start_method == "forkserver":
+		multiprocessing.set_forkserver_preload(PRELOAD_MODULES)
+		forkserver.ensure_running()
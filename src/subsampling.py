@@ -0,0 +1,294 @@
+"""
+Renders previews by tracing a sparse grid of pixels, and only refining where the image changes.
+
+The screen is split into blocks whose corners are traced first. Blocks whose corners
+all see the same object, with colors within a threshold of each other, are filled
+in by interpolating the corners. Every other block is split into four, and the new
+corners are traced, until blocks have no pixels left between their corners.
+Flat backgrounds and smoothly shaded surfaces are then mostly interpolated, while
+edges, shadows, and reflections are still traced.
+"""
+
+from collections.abc import Iterable
+from contextlib import ExitStack
+from itertools import pairwise
+from multiprocessing import cpu_count
+from time import perf_counter
+from typing import TextIO
+
+import numpy as np
+from numpy.typing import NDArray
+
+from kernels import use_kernels
+from ray_tracer import (
+	_get_bounding_spheres,
+	_get_pixel_direction,
+	_get_window_size,
+	_get_worker_scene,
+	_open_imap,
+	_ray_trace_tile,
+)
+from scene import CountingScene, Scene
+from telemetry import (
+	Consumer,
+	Telemetry,
+	TileReport,
+	json_lines_consumer,
+	progress_bar_consumer,
+	worker_name,
+)
+from visibility import MISSED, primary_visibility
+
+INITIAL_SPACING = 8
+"Pixels between the corners of the first blocks, along each axis"
+
+PIXELS_PER_TASK = 64
+"Number of pixels handed to a worker at a time"
+
+
+def ray_trace_adaptive(
+	scene: Scene,
+	width: int,
+	height: int,
+	reflection_limit: int,
+	progress_bar: bool,
+	threshold: float,
+	kernels: str = "numpy",
+	backend: str = "process",
+	workers: int | None = None,
+	telemetry_stream: TextIO | None = None,
+	profile_directory: str | None = None,
+) -> tuple[NDArray[np.float64], int]:
+	"""
+	Ray traces the given scene, interpolating blocks of pixels that look smooth.
+
+	A block is smooth if its corners all see the same object (or none), and no color
+	channel differs by more than the `threshold` between them. A threshold of 0 only
+	interpolates blocks whose corners have exactly the same color.
+
+	The other arguments are the same as those of `ray_trace`. Pixels are traced
+	`PIXELS_PER_TASK` at a time, and each progress event counts the pixels traced or
+	interpolated so far.
+
+	Returns a 3-dimensional array of pixel colors with `shape=(height, width, 3)`,
+	and the number of pixels that were traced.
+	"""
+	# Prepare the kernels before forking, so workers inherit them ready to use
+	use_kernels(kernels)
+
+	# Save time by pre-calculating constant values
+	viewport_size = np.array([width, height])
+	window_size = _get_window_size(
+		viewport_size, scene.camera.focal_length, scene.camera.field_of_view
+	)
+	window_to_viewport_size_ratio = window_size / viewport_size
+	half_window_size = window_size / 2
+	bounding_spheres = _get_bounding_spheres(scene.objects)
+
+	screen = np.zeros((height, width, 3))
+	object_indices = np.full((height, width), MISSED, dtype=np.int32)
+	traced = np.zeros((height, width), dtype=np.bool_)
+	# Whether each pixel has been traced or interpolated, to report progress
+	done = np.zeros((height, width), dtype=np.bool_)
+
+	workers = 1 if backend == "serial" else workers or cpu_count()
+	with (
+		_open_imap(backend, kernels, workers, profile_directory, scene) as imap,
+		ExitStack() as stack,
+	):
+		consumers: list[Consumer] = []
+		if progress_bar:
+			consumers.append(stack.enter_context(progress_bar_consumer()))
+		if telemetry_stream is not None:
+			consumers.append(json_lines_consumer(telemetry_stream))
+		telemetry = Telemetry(consumers, 0, width * height)
+
+		blocks = _get_initial_blocks(width, height)
+		while blocks:
+			# Trace the corners of the blocks that have not been traced yet
+			pixels = _get_untraced_corners(blocks, traced)
+			chunks = [
+				pixels[i : i + PIXELS_PER_TASK]
+				for i in range(0, len(pixels), PIXELS_PER_TASK)
+			]
+			telemetry.total_tiles += len(chunks)
+			outputs = imap(
+				_trace_pixels_tuple,
+				[
+					(
+						scene,
+						reflection_limit,
+						chunk,
+						window_to_viewport_size_ratio,
+						half_window_size,
+						bounding_spheres,
+					)
+					for chunk in chunks
+				],
+			)
+			for chunk, (colors, indices, report) in zip(chunks, outputs, strict=True):
+				xs, ys = np.array(chunk).T
+				screen[ys, xs] = colors
+				object_indices[ys, xs] = indices
+				traced[ys, xs] = True
+				# Pixels may have been interpolated by a neighboring block already
+				report.pixels = int(np.count_nonzero(~done[ys, xs]))
+				done[ys, xs] = True
+				telemetry.report(report)
+
+			blocks, interpolated = _refine(
+				blocks, screen, object_indices, traced, done, threshold
+			)
+			telemetry.fill(interpolated)
+		telemetry.finish()
+
+	return screen, int(np.count_nonzero(traced))
+
+
+def _get_initial_blocks(width: int, height: int) -> list[tuple[int, int, int, int]]:
+	"""Split the screen into `(x0, y0, x1, y1)` blocks `INITIAL_SPACING` pixels apart, whose corners are inclusive."""
+	return [
+		(x0, y0, x1, y1)
+		for y0, y1 in _get_spans(height)
+		for x0, x1 in _get_spans(width)
+	]
+
+
+def _get_spans(length: int) -> list[tuple[int, int]]:
+	"""Return the first and last pixel of each span `INITIAL_SPACING` pixels apart along an axis, sharing their ends."""
+	edges = [*range(0, length - 1, INITIAL_SPACING), length - 1]
+	return list(pairwise(edges)) or [(0, 0)]
+
+
+def _get_untraced_corners(
+	blocks: Iterable[tuple[int, int, int, int]], traced: NDArray[np.bool_]
+) -> list[tuple[int, int]]:
+	"""Return the `(x, y)` of the corners of the blocks that have not been traced, in row-major order."""
+	corners = {
+		corner
+		for x0, y0, x1, y1 in blocks
+		for corner in ((x0, y0), (x1, y0), (x0, y1), (x1, y1))
+		if not traced[corner[1], corner[0]]
+	}
+	return sorted(corners, key=lambda corner: (corner[1], corner[0]))
+
+
+def _refine(
+	blocks: list[tuple[int, int, int, int]],
+	screen: NDArray[np.float64],
+	object_indices: NDArray[np.int32],
+	traced: NDArray[np.bool_],
+	done: NDArray[np.bool_],
+	threshold: float,
+) -> tuple[list[tuple[int, int, int, int]], int]:
+	"""
+	Interpolate the smooth blocks into the screen, and split the others.
+
+	Returns the smaller blocks to trace the corners of next, and the number of pixels
+	that were interpolated.
+	"""
+	corners = np.array(blocks).T
+	corner_xs = corners[[0, 2, 0, 2]]
+	corner_ys = corners[[1, 1, 3, 3]]
+	corner_colors = screen[corner_ys, corner_xs]
+	corner_indices = object_indices[corner_ys, corner_xs]
+	smooth = np.all(corner_indices == corner_indices[0], axis=0) & (
+		np.max(np.ptp(corner_colors, axis=0), axis=1) <= threshold
+	)
+
+	children: list[tuple[int, int, int, int]] = []
+	interpolated = 0
+	for (x0, y0, x1, y1), is_smooth in zip(blocks, smooth, strict=True):
+		# Blocks without pixels between their corners are already traced
+		if x1 - x0 <= 1 and y1 - y0 <= 1:
+			continue
+
+		if is_smooth:
+			region = (slice(y0, y1 + 1), slice(x0, x1 + 1))
+			untraced = ~traced[region]
+			screen[region][untraced] = _interpolate(screen, x0, y0, x1, y1)[untraced]
+			interpolated += int(np.count_nonzero(~done[region]))
+			done[region] = True
+		else:
+			xs = [x0, (x0 + x1) // 2, x1] if x1 - x0 > 1 else [x0, x1]
+			ys = [y0, (y0 + y1) // 2, y1] if y1 - y0 > 1 else [y0, y1]
+			children += [
+				(child_x0, child_y0, child_x1, child_y1)
+				for child_y0, child_y1 in pairwise(ys)
+				for child_x0, child_x1 in pairwise(xs)
+			]
+	return children, interpolated
+
+
+def _interpolate(
+	screen: NDArray[np.float64], x0: int, y0: int, x1: int, y1: int
+) -> NDArray[np.float64]:
+	"""Return the colors of the block, bilinearly interpolated from its corners."""
+	weights_x = np.linspace(0, 1, x1 - x0 + 1)[np.newaxis, :, np.newaxis]
+	weights_y = np.linspace(0, 1, y1 - y0 + 1)[:, np.newaxis, np.newaxis]
+	top = screen[y0, x0] * (1 - weights_x) + screen[y0, x1] * weights_x
+	bottom = screen[y1, x0] * (1 - weights_x) + screen[y1, x1] * weights_x
+	return top * (1 - weights_y) + bottom * weights_y
+
+
+def _trace_pixels_tuple(
+	tuple_input: tuple[
+		Scene | None,
+		int,
+		list[tuple[int, int]],
+		NDArray[np.float64],
+		NDArray[np.float64],
+		tuple[NDArray[np.float64], NDArray[np.float64]],
+	],
+) -> tuple[NDArray[np.float64], NDArray[np.int32], TileReport]:
+	"""Trace each of the pixels, and return their colors, the objects their primary rays hit, and a report of the work."""
+	start_time = perf_counter()
+	(
+		scene,
+		reflection_limit,
+		pixels,
+		window_to_viewport_size_ratio,
+		half_window_size,
+		bounding_spheres,
+	) = tuple_input
+	counting_scene = CountingScene(_get_worker_scene(scene))
+
+	# The first hits tell blocks apart, and save testing primary rays against every object
+	directions = np.array(
+		[
+			_get_pixel_direction(
+				counting_scene, x, y, window_to_viewport_size_ratio, half_window_size
+			)
+			for x, y in pixels
+		]
+	)
+	object_indices, _ = primary_visibility(
+		counting_scene.objects, counting_scene.camera.position, directions
+	)
+
+	colors = np.array(
+		[
+			_ray_trace_tile(
+				counting_scene,
+				reflection_limit,
+				(x, y, 1, 1),
+				window_to_viewport_size_ratio,
+				half_window_size,
+				1,
+				False,
+				bounding_spheres,
+				object_indices[i : i + 1].reshape((1, 1)),
+			)[0, 0]
+			for i, (x, y) in enumerate(pixels)
+		]
+	)
+	return (
+		colors,
+		object_indices,
+		TileReport(
+			worker_name(),
+			len(pixels),
+			counting_scene.rays,
+			perf_counter() - start_time,
+		),
+	)
@@ -0,0 +1,184 @@
+"""
+Reports the progress of renders as a stream of structured events.
+
+Workers report every tile they finish, and the progress is summarized into
+events (plain dictionaries) that are handed to every consumer, such as a
+progress bar or a JSON-lines stream read by another program.
+"""
+
+import socket
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from json import dumps as dict_as_json
+from multiprocessing import current_process
+from threading import current_thread
+from time import perf_counter
+from typing import Any, TextIO
+
+from tqdm import tqdm
+
+EVENT_INTERVAL = 0.1
+"Minimum seconds between progress events, so consumers are not flooded by small tiles"
+
+Event = dict[str, Any]
+"A JSON-serializable summary of the progress of a render"
+
+Consumer = Callable[[Event], None]
+"Receives every event"
+
+
+class TileReport:
+	"""Defines how much work went into a finished tile, and who did it."""
+
+	worker: str
+	"Name of the process or thread that traced the tile"
+	pixels: int
+	rays: int
+	"Number of primary, reflection, and shadow rays"
+	seconds: float
+
+	def __init__(self, worker: str, pixels: int, rays: int, seconds: float) -> None:
+		"""Initialize an instance of TileReport."""
+		self.worker = worker
+		self.pixels = pixels
+		self.rays = rays
+		self.seconds = seconds
+
+
+class Telemetry:
+	"""
+	Summarizes tile reports into `start`, `progress`, and `done` events.
+
+	Every event has the `event` type, the `elapsed` seconds, the `tiles` and `pixels`
+	done and in total, the `rays` cast, the overall `rays_per_second`, the `eta` in
+	seconds (or `None` before the first tile), and the `tiles`, `rays`, and
+	`rays_per_second` of each of the `workers` (measured over its busy time).
+	"""
+
+	consumers: list[Consumer]
+	total_tiles: int
+	total_pixels: int
+	tiles: int
+	pixels: int
+	rays: int
+	workers: dict[str, list[float]]
+	"Tiles, rays, and busy seconds of each worker"
+	start_time: float
+	last_event_time: float
+
+	def __init__(
+		self, consumers: list[Consumer], total_tiles: int, total_pixels: int
+	) -> None:
+		"""Initialize an instance of Telemetry, and send the `start` event."""
+		self.consumers = consumers
+		self.total_tiles = total_tiles
+		self.total_pixels = total_pixels
+		self.tiles = 0
+		self.pixels = 0
+		self.rays = 0
+		self.workers = {}
+		self.start_time = perf_counter()
+		self.last_event_time = self.start_time
+		self._send("start")
+
+	def report(self, tile_report: TileReport) -> None:
+		"""Count the finished tile, sending a `progress` event if enough time has passed."""
+		self.tiles += 1
+		self.pixels += tile_report.pixels
+		self.rays += tile_report.rays
+		worker = self.workers.setdefault(tile_report.worker, [0, 0, 0.0])
+		worker[0] += 1
+		worker[1] += tile_report.rays
+		worker[2] += tile_report.seconds
+
+		if perf_counter() - self.last_event_time >= EVENT_INTERVAL:
+			self._send("progress")
+
+	def fill(self, pixels: int) -> None:
+		"""Count pixels that were filled in without being traced."""
+		self.pixels += pixels
+
+	def finish(self) -> None:
+		"""Send the `done` event."""
+		self._send("done")
+
+	def _send(self, event_type: str) -> None:
+		"""Summarize the progress so far, and hand it to every consumer."""
+		self.last_event_time = perf_counter()
+		elapsed = self.last_event_time - self.start_time
+		event: Event = {
+			"event": event_type,
+			"elapsed": elapsed,
+			"tiles": self.tiles,
+			"total_tiles": self.total_tiles,
+			"pixels": self.pixels,
+			"total_pixels": self.total_pixels,
+			"rays": self.rays,
+			"rays_per_second": self.rays / elapsed if elapsed > 0 else 0.0,
+			"eta": elapsed / self.pixels * (self.total_pixels - self.pixels)
+			if self.pixels > 0
+			else None,
+			"workers": {
+				name: {
+					"tiles": tiles,
+					"rays": rays,
+					"rays_per_second": rays / seconds if seconds > 0 else 0.0,
+				}
+				for name, (tiles, rays, seconds) in self.workers.items()
+			},
+		}
+		for consumer in self.consumers:
+			consumer(event)
+
+
+def worker_name() -> str:
+	"""Return the name of the process, or of the thread if it is in the main process."""
+	process = current_process()
+	if process.name != "MainProcess":
+		return process.name
+	return current_thread().name
+
+
+def json_lines_consumer(stream: TextIO) -> Consumer:
+	"""Return a consumer that writes each event to the stream as one line of JSON."""
+
+	def consume(event: Event) -> None:
+		"""Write the event, flushing it so readers see it right away."""
+		stream.write(dict_as_json(event) + "\n")
+		stream.flush()
+
+	return consume
+
+
+@contextmanager
+def progress_bar_consumer() -> Iterator[Consumer]:
+	"""Yield a consumer that shows the pixels done in a progress bar."""
+	with tqdm(unit="pixel") as progress:
+
+		def consume(event: Event) -> None:
+			"""Move the progress bar to the pixels done."""
+			progress.total = event["total_pixels"]
+			progress.update(event["pixels"] - progress.n)
+			progress.set_postfix(rays_per_second=f"{event['rays_per_second']:.0f}")
+
+		yield consume
+
+
+@contextmanager
+def open_stream(target: str) -> Iterator[TextIO]:
+	"""
+	Open a text stream to write events to.
+
+	The target is either `tcp://<host>:<port>` to connect to a listening socket,
+	or a file path to append to.
+	"""
+	if target.startswith("tcp://"):
+		host, _, port = target.removeprefix("tcp://").rpartition(":")
+		with (
+			socket.create_connection((host, int(port))) as connection,
+			connection.makefile("w", encoding="utf8") as stream,
+		):
+			yield stream
+	else:
+		with open(target, "a", encoding="utf8") as stream:
+			yield stream
@@ -0,0 +1,54 @@
+"""
+Finds what every primary ray hits at once, instead of casting them one at a time.
+
+Primary rays all start at the camera, so their first hits can be found like a
+rasterizer would: by computing each object's depth for every pixel with array
+operations, and keeping the closest one in a depth buffer.
+"""
+
+from math import inf
+
+import numpy as np
+from numpy.typing import NDArray
+
+from objects import Object
+
+MISSED = -1
+"Object index for pixels that do not see any object"
+
+AMBIGUOUS = -2
+"Object index for pixels where the closest objects are too close in depth to tell apart"
+
+DEPTH_TOLERANCE = 1e-9
+"How close in depth (relative to the depth) objects must be to count as tied"
+
+
+def primary_visibility(
+	objects: list[Object],
+	origin: NDArray[np.float64],
+	directions: NDArray[np.float64],
+) -> tuple[NDArray[np.int32], NDArray[np.float64]]:
+	"""
+	Return the index of the closest object each ray hits, and how far away it is.
+
+	The directions must be normalized, with `shape=(rays, 3)`.
+	Rays that miss every object have the index `MISSED` and a depth of `inf`.
+	Rays that hit several objects at almost the same depth have the index `AMBIGUOUS`,
+	since rounding could make `Scene.cast_ray` pick any of them.
+	"""
+	object_indices = np.full(len(directions), MISSED, dtype=np.int32)
+	depths = np.full(len(directions), inf)
+	ambiguous = np.zeros(len(directions), dtype=np.bool_)
+	for i, obj in enumerate(objects):
+		distances = obj.ray_distances(origin, directions)
+		closer = distances < depths
+		with np.errstate(invalid="ignore"):
+			tied = (np.abs(distances - depths) <= DEPTH_TOLERANCE * depths) & (
+				depths != inf
+			)
+		ambiguous = (ambiguous & ~closer) | tied
+		object_indices[closer] = i
+		depths[closer] = distances[closer]
+
+	object_indices[ambiguous] = AMBIGUOUS
+	return object_indices, depths
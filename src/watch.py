@@ -0,0 +1,344 @@
+"""
+Re-renders a scene whenever its file changes, re-tracing only the affected pixels.
+
+Every pixel remembers which objects its ray tree touched (objects hit by primary
+and reflection rays, and objects blocking shadow rays), along with every ray
+segment it cast. When the scene changes, a pixel only needs to be re-traced if
+it touched a removed or modified object, or if one of its ray segments would now
+hit an added or modified object before it ended.
+"""
+
+from datetime import timedelta
+from json import loads as json_as_dict
+from math import inf
+from multiprocessing import cpu_count
+from pathlib import Path
+from time import perf_counter, sleep
+
+import numpy as np
+from numpy.typing import NDArray
+
+from exporter import export
+from importer import import_scene, load_from_json
+from kernels import use_kernels
+from objects import Object
+from ray import Ray, RayCollision
+from ray_tracer import (
+	_get_color,
+	_get_pixel_direction,
+	_get_window_size,
+	_imap,
+)
+from scene import Scene
+
+POLL_INTERVAL = 0.5
+"Seconds to wait between checking the scene file for changes"
+
+
+class RayTree:
+	"""Records which objects a pixel's rays touched, and every segment they traveled."""
+
+	touched: set[int]
+	"Indices of the objects hit or blocking a shadow ray"
+	origins: NDArray[np.float64]
+	directions: NDArray[np.float64]
+	max_distances: NDArray[np.float64]
+
+	def __init__(
+		self,
+		touched: set[int],
+		origins: NDArray[np.float64],
+		directions: NDArray[np.float64],
+		max_distances: NDArray[np.float64],
+	) -> None:
+		"""Initialize an instance of RayTree."""
+		self.touched = touched
+		self.origins = origins
+		self.directions = directions
+		self.max_distances = max_distances
+
+	def is_blocked_by(self, obj: Object) -> bool:
+		"""Return whether the object intersects any segment before it ended."""
+		for origin, direction, max_distance in zip(
+			self.origins, self.directions, self.max_distances, strict=True
+		):
+			collision = obj.ray_intersection(Ray(origin, direction))
+			if collision is not None and collision.distance < max_distance:
+				return True
+		return False
+
+
+class _RecordingScene(Scene):
+	"""A scene that records every ray cast into it."""
+
+	_indices: dict[int, int]
+	_touched: set[int]
+	_segments: list[tuple[NDArray[np.float64], NDArray[np.float64], float]]
+
+	def __init__(self, scene: Scene) -> None:
+		"""Initialize an instance of _RecordingScene, sharing everything with the scene."""
+		super().__init__(
+			scene.camera,
+			scene.lights,
+			scene.ambient_light_color,
+			scene.background_color,
+			scene.objects,
+			scene.occluder_grids,
+		)
+		self._indices = {id(obj): i for i, obj in enumerate(scene.objects)}
+		self._touched = set()
+		self._segments = []
+
+	def cast_ray(
+		self, ray: Ray, objects: list[Object] | None = None
+	) -> RayCollision | None:
+		"""Projects the ray into the scene, recording the closest object collision."""
+		collision = super().cast_ray(ray, objects)
+		self._record(ray, collision, inf)
+		return collision
+
+	def cast_shadow_rays(
+		self,
+		rays: list[Ray],
+		max_distances: list[float],
+		light_indices: list[int] | None = None,
+	) -> list[RayCollision | None]:
+		"""Projects a batch of shadow rays into the scene, recording what blocked each."""
+		blockers = super().cast_shadow_rays(rays, max_distances, light_indices)
+		for ray, blocker, max_distance in zip(
+			rays, blockers, max_distances, strict=True
+		):
+			self._record(ray, blocker, max_distance)
+		return blockers
+
+	def ray_tree(self) -> RayTree:
+		"""Return everything recorded so far."""
+		return RayTree(
+			self._touched,
+			np.array([origin for origin, _, _ in self._segments]).reshape((-1, 3)),
+			np.array([direction for _, direction, _ in self._segments]).reshape(
+				(-1, 3)
+			),
+			np.array([max_distance for _, _, max_distance in self._segments]),
+		)
+
+	def _record(
+		self, ray: Ray, collision: RayCollision | None, max_distance: float
+	) -> None:
+		"""Record the segment the ray traveled and the object it touched."""
+		if collision is not None:
+			self._touched.add(self._indices[id(collision.obj)])
+			max_distance = collision.distance
+		self._segments.append((ray.origin.copy(), ray.direction.copy(), max_distance))
+
+
+def watch(
+	scene_file_path: str,
+	output_file_path: str,
+	width: int,
+	height: int,
+	reflection_limit: int,
+	kernels: str,
+	backend: str,
+	workers: int | None,
+) -> None:
+	"""
+	Render the scene, then re-render it every time the scene file changes.
+
+	Camera and lighting changes re-render every pixel,
+	but object changes only re-trace the pixels they affect.
+	Runs until interrupted.
+	"""
+	use_kernels(kernels)
+	workers = workers or cpu_count()
+
+	modified_time = Path(scene_file_path).stat().st_mtime_ns
+	scene = import_scene(scene_file_path)
+	json_data = _read_scene_json(scene_file_path) or {}
+
+	screen = np.zeros((height, width, 3))
+	ray_trees: list[list[RayTree | None]] = [[None] * width for _ in range(height)]
+	all_pixels = [(x, y) for y in range(height) for x in range(width)]
+
+	def render(pixels: list[tuple[int, int]]) -> None:
+		"""Re-trace the given pixels, then export the screen."""
+		print(f"> Ray tracing {len(pixels)}/{width * height} pixels...")
+		start_time = perf_counter()
+		_ray_trace_pixels(
+			scene,
+			width,
+			height,
+			reflection_limit,
+			kernels,
+			backend,
+			workers,
+			pixels,
+			screen,
+			ray_trees,
+		)
+		export(screen, output_file_path)
+		time_elapsed = perf_counter() - start_time
+		print(f"Time elapsed: {timedelta(seconds=time_elapsed)}")
+		print("> Done")
+		print()
+
+	print()
+	render(all_pixels)
+
+	print(f"> Watching {scene_file_path} for changes...")
+	print()
+	while True:
+		sleep(POLL_INTERVAL)
+		try:
+			new_modified_time = Path(scene_file_path).stat().st_mtime_ns
+		except OSError:
+			continue
+		if new_modified_time == modified_time:
+			continue
+		modified_time = new_modified_time
+
+		new_json_data = _read_scene_json(scene_file_path)
+		if new_json_data is None:
+			continue
+		try:
+			new_scene = load_from_json(new_json_data)
+		except (TypeError, ValueError) as err:
+			print(f'"{scene_file_path}" is improperly formatted\n\t{err}')
+			continue
+
+		# Camera and lighting changes affect every pixel
+		if _without_objects(new_json_data) != _without_objects(json_data):
+			json_data, scene = new_json_data, new_scene
+			render(all_pixels)
+			continue
+
+		old_to_new, removed, added = _diff_objects(
+			json_data.get("objects") or [], new_json_data.get("objects") or []
+		)
+		json_data, scene = new_json_data, new_scene
+		added_objects = [scene.objects[i] for i in added]
+
+		# Find the pixels whose ray trees are affected
+		dirty_pixels = []
+		for x, y in all_pixels:
+			ray_tree = ray_trees[y][x]
+			if ray_tree is None or _is_affected(ray_tree, removed, added_objects):
+				dirty_pixels.append((x, y))
+			else:
+				ray_tree.touched = {old_to_new[i] for i in ray_tree.touched}
+
+		if dirty_pixels:
+			render(dirty_pixels)
+
+
+def _ray_trace_pixels(
+	scene: Scene,
+	width: int,
+	height: int,
+	reflection_limit: int,
+	kernels: str,
+	backend: str,
+	workers: int,
+	pixels: list[tuple[int, int]],
+	screen: NDArray[np.float64],
+	ray_trees: list[list[RayTree | None]],
+) -> None:
+	"""Trace the given pixels, storing their colors and ray trees."""
+	viewport_size = np.array([width, height])
+	window_size = _get_window_size(
+		viewport_size, scene.camera.focal_length, scene.camera.field_of_view
+	)
+	window_to_viewport_size_ratio = window_size / viewport_size
+	half_window_size = window_size / 2
+
+	tuple_inputs = [
+		(
+			scene,
+			reflection_limit,
+			x,
+			y,
+			window_to_viewport_size_ratio,
+			half_window_size,
+		)
+		for x, y in pixels
+	]
+	outputs = _imap(_record_pixel_tuple, tuple_inputs, backend, kernels, workers)
+	for (x, y), (color, ray_tree) in zip(pixels, outputs, strict=True):
+		screen[y, x] = color
+		ray_trees[y][x] = ray_tree
+
+
+def _record_pixel_tuple(
+	tuple_input: tuple[Scene, int, int, int, NDArray[np.float64], NDArray[np.float64]],
+) -> tuple[NDArray[np.float64], RayTree]:
+	"""Unpacks the tuple input for _record_pixel and returns the result."""
+	return _record_pixel(*tuple_input)
+
+
+def _record_pixel(
+	scene: Scene,
+	reflection_limit: int,
+	x: int,
+	y: int,
+	window_to_viewport_size_ratio: NDArray[np.float64],
+	half_window_size: NDArray[np.float64],
+) -> tuple[NDArray[np.float64], RayTree]:
+	"""Retrieve the color for a given pixel, along with its ray tree."""
+	recording_scene = _RecordingScene(scene)
+	direction = _get_pixel_direction(
+		scene, x, y, window_to_viewport_size_ratio, half_window_size
+	)
+	color = _get_color(
+		recording_scene, reflection_limit, scene.camera.position, direction
+	)
+	return color, recording_scene.ray_tree()
+
+
+def _is_affected(ray_tree: RayTree, removed: set[int], added: list[Object]) -> bool:
+	"""Return whether the pixel's ray tree touched a removed object or would hit an added one."""
+	return not ray_tree.touched.isdisjoint(removed) or any(
+		ray_tree.is_blocked_by(obj) for obj in added
+	)
+
+
+def _diff_objects(
+	old_objects: list, new_objects: list
+) -> tuple[dict[int, int], set[int], list[int]]:
+	"""
+	Match identical objects between the old and new object lists.
+
+	Modified objects count as removed and added.
+	Returns a map of unchanged object indices from old to new,
+	the old indices of removed objects, and the new indices of added objects.
+	"""
+	old_to_new: dict[int, int] = {}
+	unmatched_old = list(range(len(old_objects)))
+	added = []
+	for new_index, new_object in enumerate(new_objects):
+		for old_index in unmatched_old:
+			if old_objects[old_index] == new_object:
+				old_to_new[old_index] = new_index
+				unmatched_old.remove(old_index)
+				break
+		else:
+			added.append(new_index)
+
+	return old_to_new, set(unmatched_old), added
+
+
+def _without_objects(json: dict) -> dict:
+	"""Return the scene values that affect every pixel (everything except objects)."""
+	return {key: value for key, value in json.items() if key != "objects"}
+
+
+def _read_scene_json(file_path: str) -> dict | None:
+	"""Return the scene file as a dictionary, or nothing if it cannot be read yet."""
+	try:
+		json_data = json_as_dict(Path(file_path).read_text(encoding="utf8"))
+	except (OSError, ValueError) as err:
+		print(f'"{file_path}" is not a valid json file\n\t{err}')
+		return None
+	if not isinstance(json_data, dict):
+		print(f'"{file_path}" is improperly formatted')
+		return None
+	return json_data